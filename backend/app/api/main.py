@@ -1,5 +1,7 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from app.config import Config
+from app.database.instrumentation import track_queries
 
 # Create FastAPI app
 app = FastAPI(
@@ -17,12 +19,37 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Track SQL per request (query count, DB time, slowest statement, N+1)
+@app.middleware("http")
+async def track_request_queries(request: Request, call_next):
+    with track_queries(f"{request.method} {request.url.path}") as stats:
+        response = await call_next(request)
+        
+        # Group stats by route template instead of raw path (session ids)
+        route = request.scope.get("route")
+        if route is not None:
+            stats.name = f"{request.method} {route.path}"
+    
+    if Config.DEBUG:
+        response.headers["X-DB-Query-Count"] = str(stats.query_count)
+        response.headers["X-DB-Time-Ms"] = f"{stats.db_time * 1000:.2f}"
+        response.headers["X-DB-Slowest-Ms"] = f"{stats.slowest_time * 1000:.2f}"
+        response.headers["X-DB-Repeated-Statements"] = str(len(stats.repeated_shapes))
+    
+    return response
+
 # Import routes
 from app.api import routes
 
 # Include routers
 app.include_router(routes.router, prefix="/api/v1")
 
+# Resume background jobs whose process died
+@app.on_event("startup")
+def recover_background_jobs():
+    from app.services.recategorization_jobs import start_recovery_loop
+    start_recovery_loop()
+
 # Root endpoint
 @app.get("/")
 def root():
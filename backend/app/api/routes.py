@@ -7,26 +7,30 @@ from app.api.schemas import (
     TransactionListResponse, Transaction,
     WarningsResponse,
     UploadResponse, SessionStatus,
-    AvailableSessionsResponse, ComparisonResponse
+    AvailableSessionsResponse, ComparisonResponse,
+    BulkLinkRequest, RelinkRequest, RecategorizeRequest, SimilarCountRequest
 
 )
 from app.api.upload_handler import save_uploaded_file, start_analysis_thread  # NEW
 from app.services.analytics import (
     get_monthly_metrics,
-    get_category_breakdown,
-    get_unlinked_splitwise_payer
+    refresh_session_metrics
 )
 from app.chatbot.intent_classifier import classify_intent
 from app.chatbot.filter_extractor import extract_filters
 from app.chatbot.query_builder import build_query
 from app.chatbot.response_formatter import format_response
 from app.database.connection import get_db_connection
+from app.database.instrumentation import get_query_metrics
+from app.database.streaming import stream_rows
 from datetime import datetime
 from typing import Optional
 import math
 
 router = APIRouter()
 
+MAX_SIMILAR_BATCH = 500     # Transaction ids per similar-counts request
+
 
 @router.get("/health")
 def health_check():
@@ -37,6 +41,13 @@ def health_check():
         "service": "finance-advisor-api"
     }
 
+@router.get("/metrics/queries")
+def get_query_stats():
+    """
+    SQL instrumentation: recent requests / pipeline stages and per-unit totals
+    """
+    return get_query_metrics()
+
 @router.post("/upload", response_model=UploadResponse)
 async def upload_files(
     bank_file: UploadFile = File(..., description="Bank statement CSV"),
@@ -322,8 +333,8 @@ def get_session_categories(session_id: str):
         cur.close()
         conn.close()
         
-        # Get category breakdown using existing service
-        categories_data = get_category_breakdown(session_id)
+        # Get category breakdown from the metrics snapshot
+        categories_data = get_monthly_metrics(session_id)['category_breakdown']
         
         # Calculate total
         total_spending = sum(cat['amount'] for cat in categories_data)
@@ -488,8 +499,8 @@ def get_session_warnings(session_id: str):
         cur.close()
         conn.close()
         
-        # Get unlinked payer transactions using existing service
-        unlinked_data = get_unlinked_splitwise_payer(session_id)
+        # Get unlinked payer transactions from the metrics snapshot
+        unlinked_data = get_monthly_metrics(session_id)['unlinked_payer']
         
         # No need to recalculate - already done in service ✅
         
@@ -601,127 +612,161 @@ def get_grouped_transactions(
             raise HTTPException(status_code=404, detail="Session not found")
         
         user_id = 1
-        all_transactions = []
         
         # Build WHERE conditions for category filter
         category_filter = ""
+        linked_category_filter = ""
         category_params = []
         if category:
             category_filter = " AND category = %s"
+            linked_category_filter = " AND b.category = %s"  # Specify b.category
             category_params = [category]
         
+        selects = []
+        params = []
+        
         # TYPE 1: Independent Bank Transactions
         if source in [None, 'BANK']:
-            cur.execute(f"""
+            selects.append(f"""
                 SELECT 
                     id, date, description, amount, category,
                     'BANK' as source, 'independent' as txn_type,
-                    status, NULL as link_id, NULL as match_confidence, NULL as match_method,
-                    NULL as bank_amount, NULL as my_share, NULL as split_percentage
+                    status, NULL::integer as link_id, NULL::numeric as match_confidence,
+                    NULL::varchar as match_method, NULL::numeric as bank_amount,
+                    NULL::numeric as my_share, NULL::numeric as split_percentage,
+                    NULL::varchar as role
                 FROM bank_transactions
                 WHERE upload_session_id = %s
                   AND user_id = %s
                   AND status = 'UNLINKED'
                   {category_filter}
-                ORDER BY date DESC, id DESC
-            """, [session_id, user_id] + category_params)
-            
-            all_transactions.extend(cur.fetchall())
+            """)
+            params += [session_id, user_id] + category_params
         
         # TYPE 2: Independent Splitwise Transactions
         if source in [None, 'SPLITWISE']:
-            cur.execute(f"""
+            selects.append(f"""
                 SELECT 
                     id, date, description, -my_share as amount, category,
                     'SPLITWISE' as source, 'independent' as txn_type,
-                    status, NULL as link_id, NULL as match_confidence, NULL as match_method,
-                    NULL as bank_amount, my_share, NULL as split_percentage,
-                    role  -- ADD THIS
+                    status, NULL::integer as link_id, NULL::numeric as match_confidence,
+                    NULL::varchar as match_method, NULL::numeric as bank_amount,
+                    my_share, NULL::numeric as split_percentage,
+                    role
                 FROM splitwise_transactions
                 WHERE upload_session_id = %s
-                AND user_id = %s
-                AND status = 'UNLINKED'
-                {category_filter}
-                ORDER BY date DESC, id DESC
-            """, [session_id, user_id] + category_params)
-            
-            all_transactions.extend(cur.fetchall())
+                  AND user_id = %s
+                  AND status = 'UNLINKED'
+                  {category_filter}
+            """)
+            params += [session_id, user_id] + category_params
         
         # TYPE 3: Linked Transactions (merged)
         if source in [None, 'BANK', 'SPLITWISE']:
-            # Build category filter with table prefix
-            linked_category_filter = ""
-            if category:
-                linked_category_filter = " AND b.category = %s"  # Specify b.category
-            
-            cur.execute(f"""
+            # Links come from transaction_links so one-to-many links show every
+            # Splitwise row; my_share is prorated by the amount each link covers.
+            # Rows linked without a transaction_links row fall back to
+            # linked_splitwise_id, and still show as linked if even that is missing.
+            selects.append(f"""
                 SELECT 
-                    b.id, b.date, s.description, b.amount, b.category,
+                    b.id, b.date, COALESCE(agg.description, b.description), b.amount, b.category,
                     'LINKED' as source, 'linked' as txn_type,
-                    b.status, b.linked_splitwise_id as link_id, 
+                    b.status, agg.link_id, 
                     b.match_confidence, b.match_method,
-                    b.amount as bank_amount, s.my_share,
-                    ROUND((s.my_share / s.total_cost * 100)::numeric, 0) as split_percentage
+                    b.amount as bank_amount, agg.my_share,
+                    ROUND((agg.my_share / NULLIF(agg.linked_total, 0) * 100)::numeric, 0) as split_percentage,
+                    NULL::varchar as role
                 FROM bank_transactions b
-                JOIN splitwise_transactions s ON b.linked_splitwise_id = s.id
+                CROSS JOIN LATERAL (
+                    SELECT 
+                        string_agg(s.description, ' + ' ORDER BY s.id) as description,
+                        MIN(s.id) as link_id,
+                        SUM(s.my_share * COALESCE(l.amount, s.total_cost) / NULLIF(s.total_cost, 0)) as my_share,
+                        SUM(COALESCE(l.amount, s.total_cost)) as linked_total
+                    FROM (
+                        SELECT l.splitwise_id, l.amount
+                        FROM transaction_links l
+                        WHERE l.bank_id = b.id
+                        UNION ALL
+                        SELECT b.linked_splitwise_id, NULL::numeric
+                        WHERE b.linked_splitwise_id IS NOT NULL
+                          AND NOT EXISTS (SELECT 1 FROM transaction_links l WHERE l.bank_id = b.id)
+                    ) l
+                    JOIN splitwise_transactions s ON s.id = l.splitwise_id
+                ) agg
                 WHERE b.upload_session_id = %s
-                AND b.user_id = %s
-                AND b.status = 'LINKED'
-                {linked_category_filter}
-                ORDER BY b.date DESC, b.id DESC
-            """, [session_id, user_id] + category_params)
-            
-            all_transactions.extend(cur.fetchall())
-        
-        # Sort all by date
-        all_transactions.sort(key=lambda x: (x[1], x[0]), reverse=True)
+                  AND b.user_id = %s
+                  AND b.status = 'LINKED'
+                  {linked_category_filter}
+            """)
+            params += [session_id, user_id] + category_params
         
-        # Group by date
-        from collections import defaultdict
-        grouped = defaultdict(list)
+        groups = []
+        total_groups = 0
+        offset = (page - 1) * limit
         
-        for row in all_transactions:
-            date_str = row[1].isoformat()
+        if selects:
+            combined = " UNION ALL ".join(f"({sql})" for sql in selects)
             
-            txn_obj = {
-                'id': row[0],
-                'date': date_str,
-                'description': row[2],
-                'amount': float(row[3]),
-                'category': row[4],
-                'source': row[5],
-                'txn_type': row[6],
-                'status': row[7],
-                'link_id': row[8],
-                'match_confidence': float(row[9]) if row[9] else None,
-                'match_method': row[10],
-                'bank_amount': float(row[11]) if row[11] else None,
-                'my_share': float(row[12]) if row[12] else None,
-                'split_percentage': int(row[13]) if row[13] else None,
-                'role': row[14] if len(row) > 14 else None
-            }
+            # Total number of date groups (for pagination)
+            cur.execute(f"SELECT COUNT(DISTINCT date) FROM ({combined}) as combined", params)
+            total_groups = cur.fetchone()[0]
             
-            grouped[date_str].append(txn_obj)
-        
-        # Convert to list of groups
-        groups = []
-        for date_str, transactions in grouped.items():
-            total_amount = sum(t['amount'] for t in transactions)
-            groups.append({
-                'date': date_str,
-                'transactions': transactions,
-                'total_amount': total_amount,
-                'count': len(transactions)
-            })
-        
-        # Sort by date descending
-        groups.sort(key=lambda x: x['date'], reverse=True)
+            # Stream rows newest first and keep only the requested page of groups
+            rows = stream_rows(conn, f"""
+                SELECT * FROM ({combined}) as combined
+                ORDER BY date DESC, id DESC
+            """, params)
+            
+            group_index = -1
+            current_date = None
+            
+            for row in rows:
+                if row[1] != current_date:
+                    current_date = row[1]
+                    group_index += 1
+                    
+                    if group_index >= offset + limit:
+                        break
+                    
+                    if group_index >= offset:
+                        groups.append({
+                            'date': current_date.isoformat(),
+                            'transactions': [],
+                            'total_amount': 0,
+                            'count': 0
+                        })
+                
+                if group_index < offset:
+                    continue
+                
+                txn_obj = {
+                    'id': row[0],
+                    'date': row[1].isoformat(),
+                    'description': row[2],
+                    'amount': float(row[3]),
+                    'category': row[4],
+                    'source': row[5],
+                    'txn_type': row[6],
+                    'status': row[7],
+                    'link_id': row[8],
+                    'match_confidence': float(row[9]) if row[9] else None,
+                    'match_method': row[10],
+                    'bank_amount': float(row[11]) if row[11] else None,
+                    'my_share': float(row[12]) if row[12] else None,
+                    'split_percentage': int(row[13]) if row[13] else None,
+                    'role': row[14]
+                }
+                
+                group = groups[-1]
+                group['transactions'].append(txn_obj)
+                group['total_amount'] += txn_obj['amount']
+                group['count'] += 1
+            
+            rows.close()
         
-        # Pagination
-        total_groups = len(groups)
         total_pages = math.ceil(total_groups / limit) if total_groups > 0 else 1
-        offset = (page - 1) * limit
-        paginated_groups = groups[offset:offset + limit]
+        paginated_groups = groups
         
         cur.close()
         conn.close()
@@ -771,9 +816,10 @@ def compare_sessions(
         
         session_months = {row[0]: row[1] for row in results}
         
-        # Get metrics for both sessions
-        from app.services.analytics import get_monthly_metrics
+        cur.close()
+        conn.close()
         
+        # Get metrics for both sessions
         metrics1 = get_monthly_metrics(session1)
         metrics2 = get_monthly_metrics(session2)
         
@@ -834,31 +880,13 @@ def compare_sessions(
         increases.sort(key=lambda x: x['difference'], reverse=True)
         decreases.sort(key=lambda x: x['difference'])
         
-        # Daily averages - count distinct days from bank transactions
-        cur.execute("""
-            SELECT COUNT(DISTINCT date)
-            FROM bank_transactions
-            WHERE upload_session_id = %s
-            AND amount < 0
-            AND status != 'TRANSFER'
-        """, (session1,))
-        days1 = cur.fetchone()[0] or 1
-
-        cur.execute("""
-            SELECT COUNT(DISTINCT date)
-            FROM bank_transactions
-            WHERE upload_session_id = %s
-            AND amount < 0
-            AND status != 'TRANSFER'
-        """, (session2,))
-        days2 = cur.fetchone()[0] or 1
+        # Daily averages - distinct spending days from the snapshot
+        days1 = metrics1['spending_days'] or 1
+        days2 = metrics2['spending_days'] or 1
         
         daily_avg1 = metrics1['net_consumption']['total'] / days1
         daily_avg2 = metrics2['net_consumption']['total'] / days2
         
-        cur.close()
-        conn.close()
-        
         return {
             'session1_id': session1,
             'session1_month': session_months[session1],
@@ -935,6 +963,143 @@ def link_transactions_manually(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/sessions/{session_id}/link-transactions/bulk")
+def link_transactions_bulk(session_id: str, request: BulkLinkRequest):
+    """
+    Manually link many splitwise/bank pairs in one transaction (all or nothing)
+    """
+    try:
+        from app.services.manual_linking import link_transactions_manual_bulk
+        
+        linked = link_transactions_manual_bulk(
+            [(pair.splitwise_id, pair.bank_id) for pair in request.links],
+            session_id
+        )
+        
+        return {
+            'success': True,
+            'linked': linked,
+            'message': f'{linked} transaction pairs linked successfully'
+        }
+        
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/sessions/{session_id}/relink")
+def relink_session_changes(session_id: str, request: RelinkRequest):
+    """
+    Incrementally re-link after edits or late uploads: links of the changed
+    transactions are re-checked, and only unlinked rows near them are
+    reconsidered. Ids that are not in this session are ignored.
+    """
+    try:
+        from app.services.relinker import relink_changed, changed_since, session_rows
+        
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT user_id FROM upload_sessions WHERE id = %s", (session_id,))
+        session = cur.fetchone()
+        cur.close()
+        conn.close()
+        
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+        
+        splitwise_ids = set(request.splitwise_ids)
+        bank_ids = set(request.bank_ids)
+        if request.since is not None:
+            new_splits, new_banks = changed_since(session_id, request.since, session[0])
+            splitwise_ids.update(new_splits)
+            bank_ids.update(new_banks)
+        
+        # Only rows of this session (and its user) may be relinked from here
+        owned_splits, owned_banks = session_rows(session_id, session[0], splitwise_ids, bank_ids)
+        ignored = (len(splitwise_ids) - len(owned_splits)) + (len(bank_ids) - len(owned_banks))
+        
+        if not owned_splits and not owned_banks:
+            raise HTTPException(status_code=400, detail="No changed transactions of this session given")
+        
+        result = relink_changed(session[0], owned_splits, owned_banks)
+        
+        return {
+            'success': True,
+            'ignored_ids': ignored,
+            **result
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/sessions/{session_id}/categorization/profile")
+def get_categorization_profile(
+    session_id: str,
+    pipeline: Optional[str] = Query(None, description="auto_categorize or detect_transfers (default: both)"),
+    runs: int = Query(5, ge=1, le=100, description="Latest profiled runs to return")
+):
+    """
+    Per-stage wall time, statements and rows scanned/updated of the
+    session's latest categorization and transfer-detection runs
+    """
+    try:
+        from app.services.categorization_profiler import get_profiles
+        
+        if pipeline not in (None, 'auto_categorize', 'detect_transfers'):
+            raise HTTPException(status_code=400, detail="pipeline must be 'auto_categorize' or 'detect_transfers'")
+        
+        profiles = get_profiles(session_id, pipeline, runs)
+        
+        return {
+            'session_id': session_id,
+            'runs': profiles,
+            'count': len(profiles)
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/sessions/{session_id}/linker/explain")
+def explain_session_linking(
+    session_id: str,
+    mode: Optional[str] = Query(None, description="greedy or assignment (default: LINKER_MODE)"),
+    max_details: int = Query(200, ge=1, le=5000, description="Max tie-breaks/rejections listed per pass")
+):
+    """
+    Dry-run settlement detection and linking: per-pass candidate counts,
+    tie-breaks, rejected pairs and SQL vs matching time. Writes nothing.
+    """
+    try:
+        from app.services.linker import explain_linker
+        
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT user_id FROM upload_sessions WHERE id = %s", (session_id,))
+        session = cur.fetchone()
+        cur.close()
+        conn.close()
+        
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+        
+        if mode not in (None, 'greedy', 'assignment'):
+            raise HTTPException(status_code=400, detail="mode must be 'greedy' or 'assignment'")
+        
+        return explain_linker(session_id, session[0], mode, max_details)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.post("/sessions/{session_id}/skip-transaction")
 def skip_splitwise_transaction(
     session_id: str,
@@ -1042,6 +1207,41 @@ def get_similar_transaction_count(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/sessions/{session_id}/similar-counts")
+def get_similar_transaction_counts(session_id: str, request: SimilarCountRequest):
+    """
+    Similar-transaction preview for many rows at once (two queries in total,
+    however many rows are asked for)
+    """
+    try:
+        from app.services.categorization_rules import count_similar_batch
+        
+        if request.source not in ('BANK', 'SPLITWISE'):
+            raise HTTPException(status_code=400, detail="source must be BANK or SPLITWISE")
+        
+        if len(request.transaction_ids) > MAX_SIMILAR_BATCH:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_SIMILAR_BATCH} transactions per request")
+        
+        counts = count_similar_batch(session_id, request.source, request.transaction_ids)
+        
+        return {
+            'counts': [
+                {
+                    'transaction_id': txn_id,
+                    'pattern': pattern,
+                    'count': count
+                }
+                for txn_id, (pattern, count) in counts.items()
+            ],
+            'not_found': [txn_id for txn_id in request.transaction_ids if txn_id not in counts]
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.patch("/sessions/{session_id}/transactions/{transaction_id}/category")
 def update_transaction_category(
     session_id: str,
@@ -1049,7 +1249,8 @@ def update_transaction_category(
     source: str = Query(..., description="BANK or SPLITWISE"),
     new_category: str = Query(..., description="New category name"),
     create_rule: bool = Query(False, description="Save as rule for future"),
-    apply_to_similar: bool = Query(False, description="Apply to similar transactions")
+    apply_to_similar: bool = Query(False, description="Apply to similar transactions"),
+    apply_to_all_sessions: bool = Query(False, description="Also recategorize similar transactions in every session (background job)")
 ):
     """
     Update transaction category with optional rule creation
@@ -1060,6 +1261,8 @@ def update_transaction_category(
             save_categorization_rule,
             apply_rule_to_similar
         )
+        from app.services.merchant_memory import remember_correction
+        from app.services.ml_categorizer import schedule_retrain
         
         conn = get_db_connection()
         cur = conn.cursor()
@@ -1102,6 +1305,10 @@ def update_transaction_category(
         cur.close()
         conn.close()
         
+        # Future sessions categorize this merchant the same way
+        if source == 'BANK':
+            remember_correction(1, description, new_category)
+        
         updated_count = 1
         pattern = None
         
@@ -1114,6 +1321,21 @@ def update_transaction_category(
                 )
                 updated_count += similar_count
         
+        # Keep the metrics snapshot in sync with the new categories
+        refresh_session_metrics(session_id)
+        
+        # Corrected rows (this one and any similar ones) are picked up by label time
+        if source == 'BANK':
+            schedule_retrain(1)
+        
+        # Older months are fixed by a background job (refreshes their metrics itself)
+        job_id = None
+        if apply_to_all_sessions:
+            pattern = pattern or extract_merchant_pattern(description)
+            if pattern:
+                from app.services.recategorization_jobs import start_job
+                job_id = start_job(1, pattern, new_category, source)
+        
         # Save rule for future if requested
         if create_rule and pattern:
             save_categorization_rule(
@@ -1129,7 +1351,8 @@ def update_transaction_category(
             'message': f'Updated {updated_count} transaction(s)',
             'updated_count': updated_count,
             'pattern': pattern,
-            'rule_saved': create_rule and pattern is not None
+            'rule_saved': create_rule and pattern is not None,
+            'job_id': job_id
         }
         
     except HTTPException:
@@ -1157,6 +1380,72 @@ def get_categorization_rules(user_id: int = Query(1, description="User ID")):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/recategorization-jobs")
+def create_recategorization_job(request: RecategorizeRequest, user_id: int = Query(1, description="User ID")):
+    """
+    Apply a category to matching transactions in all of the user's sessions
+    in the background; poll the returned job for progress
+    """
+    try:
+        from app.services.recategorization_jobs import start_job, get_job
+        
+        job_id = start_job(user_id, request.pattern, request.category, request.source, request.match_type)
+        
+        return get_job(job_id)
+        
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/recategorization-jobs/{job_id}")
+def get_recategorization_job(job_id: str, user_id: int = Query(1, description="User ID")):
+    """
+    Status and progress of a recategorization job
+    """
+    try:
+        from app.services.recategorization_jobs import get_job
+        
+        job = get_job(job_id, user_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        
+        return job
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/recategorization-jobs/{job_id}/cancel")
+def cancel_recategorization_job(job_id: str, user_id: int = Query(1, description="User ID")):
+    """
+    Stop a running job after its current chunk (sessions already done keep their changes)
+    """
+    try:
+        from app.services.recategorization_jobs import get_job, cancel_job
+        
+        job = get_job(job_id, user_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        
+        if not cancel_job(job_id, user_id):
+            raise HTTPException(status_code=400, detail=f"Job already {job['status']}")
+        
+        return {
+            'success': True,
+            'message': 'Cancellation requested',
+            'job_id': job_id
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/sessions/{session_id}/recommendations")
 def get_recommendations(session_id: str, user_id: int = Query(1)):
     """
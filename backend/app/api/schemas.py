@@ -195,4 +195,33 @@ class ComparisonResponse(BaseModel):
     session2_daily_avg: float
     
     top_increases: List[CategoryComparison]
-    top_decreases: List[CategoryComparison]
\ No newline at end of file
+    top_decreases: List[CategoryComparison]
+# ============================================================================
+# MANUAL LINKING SCHEMAS
+# ============================================================================
+
+class LinkPair(BaseModel):
+    splitwise_id: int
+    bank_id: int
+
+class BulkLinkRequest(BaseModel):
+    links: List[LinkPair]
+
+class RelinkRequest(BaseModel):
+    splitwise_ids: List[int] = []
+    bank_ids: List[int] = []
+    since: Optional[datetime] = None    # also relink rows added to the session after this
+
+# ============================================================================
+# RECATEGORIZATION SCHEMAS
+# ============================================================================
+
+class RecategorizeRequest(BaseModel):
+    pattern: str
+    category: str
+    source: str = 'BANK'            # BANK, SPLITWISE or BOTH
+    match_type: str = 'contains'    # contains, exact or starts_with
+
+class SimilarCountRequest(BaseModel):
+    source: str                     # BANK or SPLITWISE
+    transaction_ids: List[int]
@@ -2,6 +2,7 @@
 Query Builder - Converts filters to SQL queries
 Deterministic, no LLM needed
 """
+from app.database.text_search import description_contains, contains_pattern
 
 def build_query(intent: str, filters: dict) -> dict:
     """
@@ -47,8 +48,8 @@ def build_query(intent: str, filters: dict) -> dict:
     
     # Add keyword filter
     if keyword:
-        where_clauses.append("UPPER(description) LIKE %s")
-        params.append(f"%{keyword.upper()}%")
+        where_clauses.append(description_contains())
+        params.append(contains_pattern(keyword))
     
     where_sql = " AND ".join(where_clauses)
     
@@ -13,4 +13,50 @@ class Config:
     UPLOAD_SESSION_PREFIX = "session_"
     
     # Date Formats
-    DATE_FORMAT_DB = "%Y-%m-%d"  # Standard ISO format for Postgres
\ No newline at end of file
+    DATE_FORMAT_DB = "%Y-%m-%d"  # Standard ISO format for Postgres
+    
+    # Database connection pool (DB_POOL_MIN connections are kept warm)
+    DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 4))
+    DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 20))
+    # Seconds to wait for a free pooled connection; 0 = open a dedicated one instead
+    DB_POOL_WAIT = float(os.getenv("DB_POOL_WAIT", 0))
+    
+    # Debug / SQL instrumentation
+    DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+    N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", 20))  # Same statement shape per unit of work
+    QUERY_STATS_HISTORY = int(os.getenv("QUERY_STATS_HISTORY", 200))  # Recent units kept for /metrics/queries
+    
+    # Server-side cursor streaming (rows fetched per round trip)
+    STREAM_ITERSIZE = int(os.getenv("STREAM_ITERSIZE", 2000))
+    
+    # Linker strategy: "greedy" (three passes) or "assignment" (optimal matching)
+    LINKER_MODE = os.getenv("LINKER_MODE", "greedy")
+    
+    # Multi-month backfill (DB connections <= workers * BACKFILL_POOL_MAX);
+    # workers wait up to BACKFILL_POOL_WAIT seconds for a pooled connection
+    BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", 4))
+    BACKFILL_POOL_MAX = int(os.getenv("BACKFILL_POOL_MAX", 2))
+    BACKFILL_POOL_WAIT = float(os.getenv("BACKFILL_POOL_WAIT", 30))
+    
+    # Compiled user categorization rules are reused for this many seconds
+    # (saves in this process invalidate immediately; other workers catch up)
+    RULE_CACHE_TTL = int(os.getenv("RULE_CACHE_TTL", 300))
+    
+    # Local ML categorizer (hashed n-gram naive Bayes, runs before keywords)
+    ML_CATEGORIZER = os.getenv("ML_CATEGORIZER", "true").lower() == "true"
+    ML_CONFIDENCE_THRESHOLD = float(os.getenv("ML_CONFIDENCE_THRESHOLD", 0.9))
+    ML_MIN_TRAINING_ROWS = int(os.getenv("ML_MIN_TRAINING_ROWS", 200))
+    ML_HASH_BITS = int(os.getenv("ML_HASH_BITS", 16))  # 2^16 hashed features
+    # Retrain in background threads after categorization (off in backfill workers)
+    ML_BACKGROUND_RETRAIN = os.getenv("ML_BACKGROUND_RETRAIN", "true").lower() == "true"
+    
+    # Cross-session recategorization jobs commit and check for cancel
+    # after this many sessions
+    RECATEGORIZE_CHUNK_SESSIONS = int(os.getenv("RECATEGORIZE_CHUNK_SESSIONS", 3))
+    # Resume jobs a restart interrupted (false: mark them failed)
+    RECATEGORIZE_RESUME = os.getenv("RECATEGORIZE_RESUME", "true").lower() == "true"
+    # A job whose heartbeat is older than this is treated as orphaned
+    RECATEGORIZE_STALE_SECONDS = int(os.getenv("RECATEGORIZE_STALE_SECONDS", 300))
+    
+    # Store per-stage timings of each categorization run (categorization_profiles)
+    PROFILE_CATEGORIZATION = os.getenv("PROFILE_CATEGORIZATION", "true").lower() == "true"
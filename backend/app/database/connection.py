@@ -1,5 +1,12 @@
+import os
+import threading
+import time
 import psycopg2
+from psycopg2 import pool
+from psycopg2.extensions import connection as _base_connection
 from psycopg2.extras import RealDictCursor
+from app.config import Config
+from app.database.instrumentation import InstrumentedCursor
 
 # Hardcoded for local dev, in prod use os.getenv()
 DB_CONFIG = {
@@ -10,10 +17,103 @@ DB_CONFIG = {
     "port": "5432"
 }
 
+
+class FinanceConnection(_base_connection):
+    """
+    Connection used across the app
+
+    - Remembers which named statements were prepared on it (see prepared.py)
+    - close() hands pooled connections back to the pool instead of closing
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+        self._pool = None
+
+    def close(self):
+        owner, self._pool = self._pool, None
+
+        if owner is None or self.closed:
+            return super().close()
+
+        if self.autocommit:
+            self.autocommit = False
+        owner.putconn(self)  # Rolls back any open transaction
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def create_connection():
+    """Open a dedicated (unpooled) connection"""
+    return psycopg2.connect(
+        **DB_CONFIG,
+        connect_timeout=10,
+        connection_factory=FinanceConnection,
+        cursor_factory=InstrumentedCursor
+    )
+
+
+def _get_pool():
+    global _pool, _pool_pid
+
+    # A pool inherited through fork() must not be shared with the parent
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = pool.ThreadedConnectionPool(
+                    Config.DB_POOL_MIN,
+                    Config.DB_POOL_MAX,
+                    **DB_CONFIG,
+                    connect_timeout=10,
+                    connection_factory=FinanceConnection,
+                    cursor_factory=InstrumentedCursor
+                )
+                _pool_pid = os.getpid()
+
+    return _pool
+
+
+def _getconn(connection_pool):
+    """
+    A pooled connection, or None if the pool is exhausted and
+    Config.DB_POOL_WAIT is 0. With a wait, polls for a returned connection
+    and raises PoolError once the wait is over.
+    """
+    deadline = time.monotonic() + Config.DB_POOL_WAIT
+
+    while True:
+        try:
+            return connection_pool.getconn()
+        except pool.PoolError:
+            if Config.DB_POOL_WAIT <= 0:
+                return None
+            if time.monotonic() >= deadline:
+                raise pool.PoolError(
+                    f"No pooled connection free after {Config.DB_POOL_WAIT:.0f}s "
+                    f"(DB_POOL_MAX={Config.DB_POOL_MAX})"
+                )
+            time.sleep(0.05)
+
+
 def get_db_connection():
     try:
-        conn = psycopg2.connect(**DB_CONFIG, connect_timeout=10)
+        connection_pool = _get_pool()
+
+        conn = _getconn(connection_pool)
+        if conn is None:
+            # Pool exhausted and not waiting - fall back to a dedicated connection
+            return create_connection()
+
+        if conn.closed:
+            connection_pool.putconn(conn, close=True)
+            conn = connection_pool.getconn()
+
+        conn._pool = connection_pool
         return conn
     except Exception as e:
         print(f"❌ Database connection failed: {e}")
-        raise e
\ No newline at end of file
+        raise e
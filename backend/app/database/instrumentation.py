@@ -0,0 +1,222 @@
+"""
+SQL Instrumentation
+Records query count, total DB time, rows read/written and the slowest
+statement for each unit of work (an API request or a pipeline stage), and
+warns when the same statement shape runs more than N times in one unit
+(N+1 pattern)
+"""
+import re
+import time
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from psycopg2.extensions import cursor as _base_cursor
+from app.config import Config
+from app.database.prepared import STATEMENTS
+from app.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Stack of active units of work for the current request / thread
+_active_units = ContextVar("active_query_units", default=())
+
+# Finished units, kept for the metrics endpoint
+_recent_units = deque(maxlen=Config.QUERY_STATS_HISTORY)
+_unit_totals = {}
+_lock = threading.Lock()
+
+_WRITES = ("UPDATE", "INSERT", "DELETE")
+_WRITE_KEYWORD = re.compile(r"(?<!FOR )\b(?:UPDATE|INSERT|DELETE)\b", re.IGNORECASE)  # not SELECT ... FOR UPDATE
+_EXECUTE = re.compile(r"^EXECUTE\s+(\w+)", re.IGNORECASE)
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_VALUES_LIST = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)(?:\s*,\s*\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\))*")
+
+
+def statement_shape(sql):
+    """
+    Normalize a statement so calls that differ only in literal values
+    (or in the number of VALUES tuples) share one shape
+    """
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    elif not isinstance(sql, str):
+        sql = str(sql)
+
+    shape = _STRING_LITERAL.sub("?", sql)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _VALUES_LIST.sub("(...)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+@lru_cache(maxsize=1024)
+def is_write(shape):
+    """
+    Does the statement modify rows?
+
+    EXECUTE of a prepared statement is classified by its registered SQL,
+    and a WITH query counts as a write when any part of it (a data-modifying
+    CTE or the main statement) is an INSERT, UPDATE or DELETE.
+    """
+    first = shape.split(None, 1)[0].upper() if shape else ""
+
+    if first == "EXECUTE":
+        match = _EXECUTE.match(shape)
+        sql = STATEMENTS.get(match.group(1)) if match else None
+        return is_write(statement_shape(sql)) if sql else False
+
+    if first == "WITH":
+        return _WRITE_KEYWORD.search(shape) is not None
+
+    return first in _WRITES
+
+
+class QueryStats:
+    """Query statistics for one unit of work"""
+
+    def __init__(self, name):
+        self.name = name
+        self.query_count = 0
+        self.db_time = 0.0
+        self.slowest_time = 0.0
+        self.slowest_statement = None
+        self.rows_read = 0
+        self.rows_written = 0
+        self.shape_counts = Counter()
+        self.repeated_shapes = []
+        self.started_at = time.perf_counter()
+        self.wall_time = None
+
+    def record(self, shape, duration, rowcount=-1):
+        self.query_count += 1
+        self.db_time += duration
+
+        # cursor.rowcount: rows returned by a SELECT, rows affected by a write
+        if rowcount > 0:
+            if is_write(shape):
+                self.rows_written += rowcount
+            else:
+                self.rows_read += rowcount
+
+        if duration > self.slowest_time:
+            self.slowest_time = duration
+            self.slowest_statement = shape
+
+        self.shape_counts[shape] += 1
+        if self.shape_counts[shape] == Config.N_PLUS_ONE_THRESHOLD + 1:
+            self.repeated_shapes.append(shape)
+            logger.warning(
+                f"⚠️  N+1 suspected in '{self.name}': statement ran more than "
+                f"{Config.N_PLUS_ONE_THRESHOLD} times: {shape[:200]}"
+            )
+
+    def finish(self):
+        self.wall_time = time.perf_counter() - self.started_at
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'query_count': self.query_count,
+            'db_time_ms': round(self.db_time * 1000, 2),
+            'wall_time_ms': round(self.wall_time * 1000, 2) if self.wall_time is not None else None,
+            'slowest_ms': round(self.slowest_time * 1000, 2),
+            'slowest_statement': self.slowest_statement,
+            'rows_read': self.rows_read,
+            'rows_written': self.rows_written,
+            'repeated_statements': [
+                {'statement': shape, 'count': self.shape_counts[shape]}
+                for shape in self.repeated_shapes
+            ]
+        }
+
+
+def _record(sql, duration, rowcount=-1):
+    units = _active_units.get()
+    if not units:
+        return
+    shape = statement_shape(sql)
+    for stats in units:
+        stats.record(shape, duration, rowcount)
+
+
+def _store(stats):
+    with _lock:
+        _recent_units.append(stats.to_dict())
+
+        totals = _unit_totals.setdefault(stats.name, {
+            'calls': 0,
+            'query_count': 0,
+            'db_time_ms': 0.0,
+            'max_query_count': 0,
+            'slowest_ms': 0.0,
+            'slowest_statement': None,
+            'n_plus_one_warnings': 0
+        })
+        totals['calls'] += 1
+        totals['query_count'] += stats.query_count
+        totals['db_time_ms'] = round(totals['db_time_ms'] + stats.db_time * 1000, 2)
+        totals['max_query_count'] = max(totals['max_query_count'], stats.query_count)
+        totals['n_plus_one_warnings'] += len(stats.repeated_shapes)
+        if stats.slowest_time * 1000 > totals['slowest_ms']:
+            totals['slowest_ms'] = round(stats.slowest_time * 1000, 2)
+            totals['slowest_statement'] = stats.slowest_statement
+
+
+@contextmanager
+def track_queries(name, log_summary=False):
+    """
+    Track all queries issued inside the block as one unit of work
+
+    Units nest: a pipeline stage inside a pipeline run counts toward both.
+    """
+    stats = QueryStats(name)
+    token = _active_units.set(_active_units.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _active_units.reset(token)
+        stats.finish()
+        _store(stats)
+        if log_summary:
+            logger.info(
+                f"📈 {name}: {stats.query_count} queries, "
+                f"{stats.db_time * 1000:.1f}ms DB / {stats.wall_time * 1000:.1f}ms total"
+            )
+
+
+def get_query_metrics():
+    """Snapshot of recent units and per-unit totals for the metrics endpoint"""
+    with _lock:
+        return {
+            'n_plus_one_threshold': Config.N_PLUS_ONE_THRESHOLD,
+            'recent': list(_recent_units),
+            'by_unit': {name: dict(totals) for name, totals in _unit_totals.items()}
+        }
+
+
+class InstrumentedCursor(_base_cursor):
+    """Cursor that reports every execute() to the active units of work"""
+
+    def execute(self, query, vars=None):
+        if not _active_units.get():
+            return super().execute(query, vars)
+
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _record(query, time.perf_counter() - start, self.rowcount)
+
+    def executemany(self, query, vars_list):
+        if not _active_units.get():
+            return super().executemany(query, vars_list)
+
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            _record(query, time.perf_counter() - start, self.rowcount)
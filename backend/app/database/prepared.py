@@ -0,0 +1,43 @@
+"""
+Prepared Statement Registry
+Hot parameterized queries are registered once by name and PREPAREd on each
+connection the first time they run there, so Postgres parses and plans
+them once per connection instead of on every call
+"""
+# name -> SQL text using $1..$n placeholders
+STATEMENTS = {}
+
+
+def register_statement(name, sql):
+    """
+    Register a named statement and return its name
+
+    SQL must use $1..$n placeholders (PREPARE syntax); add casts where
+    Postgres can't infer a parameter's type from context.
+    """
+    if name in STATEMENTS and STATEMENTS[name] != sql:
+        raise ValueError(f"Prepared statement '{name}' already registered with different SQL")
+
+    STATEMENTS[name] = sql
+    return name
+
+
+def execute_prepared(cur, name, params=()):
+    """
+    Execute a registered statement on cur, preparing it on first use
+
+    Results are read from cur as with cur.execute().
+    """
+    conn = cur.connection
+    prepared = conn.prepared_statements
+
+    if name not in prepared:
+        cur.execute(f"PREPARE {name} AS {STATEMENTS[name]}")
+        prepared.add(name)
+
+    if params:
+        placeholders = ", ".join(["%s"] * len(params))
+        cur.execute(f"EXECUTE {name} ({placeholders})", params)
+    else:
+        cur.execute(f"EXECUTE {name}")
+
@@ -0,0 +1,32 @@
+"""
+Streaming Fetch
+Iterates large result sets through named (server-side) cursors so only
+`itersize` rows are held in Python memory at a time
+"""
+import uuid
+from app.config import Config
+
+
+def stream_rows(conn, sql, params=None, itersize=None, name=None):
+    """
+    Yield rows of a query using a named server-side cursor
+
+    The cursor lives inside the connection's current transaction, so don't
+    commit on `conn` until the generator is exhausted or closed.
+
+    Args:
+        conn: Open psycopg2 connection (not in autocommit mode)
+        sql: Query text with %s placeholders
+        params: Query parameters
+        itersize: Rows fetched per round trip (default Config.STREAM_ITERSIZE)
+        name: Cursor name (random if not given)
+    """
+    cur = conn.cursor(name=name or f"stream_{uuid.uuid4().hex[:12]}")
+    cur.itersize = itersize or Config.STREAM_ITERSIZE
+
+    try:
+        cur.execute(sql, params)
+        for row in cur:
+            yield row
+    finally:
+        cur.close()
@@ -0,0 +1,26 @@
+"""
+Description substring search
+Every "description contains X" filter goes through these helpers so the
+SQL always has the shape UPPER(description) LIKE '%X%', which is served by
+the pg_trgm GIN indexes on UPPER(description) (see reset_schema.py)
+"""
+
+def description_contains(column="description"):
+    """SQL condition for a case-insensitive substring match on a column"""
+    return f"UPPER({column}) LIKE %s"
+
+
+def contains_pattern(text):
+    """
+    Build the LIKE parameter for description_contains()
+
+    Upper-cases the text and escapes LIKE wildcards so patterns such as
+    "50% OFF" or "PAY_TM" match literally.
+    """
+    escaped = (
+        text.upper()
+        .replace("\\", "\\\\")
+        .replace("%", "\\%")
+        .replace("_", "\\_")
+    )
+    return f"%{escaped}%"
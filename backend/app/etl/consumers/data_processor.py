@@ -1,16 +1,34 @@
 import json
-import psycopg2
 import pika
 from app.config import Config
-from app.database.connection import DB_CONFIG
+from app.database.connection import create_connection
+from app.database.prepared import register_statement, execute_prepared
+from app.services.merchant_memory import merchant_key
+from app.services.ingest_categorizer import IngestCategorizer
 from app.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+INSERT_BANK = register_statement("consumer_insert_bank", """
+    INSERT INTO bank_transactions 
+    (transaction_id, user_id, upload_session_id, date, amount, 
+     description, category, status, merchant_key)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+    ON CONFLICT (transaction_id) DO NOTHING
+""")
+
+INSERT_SPLITWISE = register_statement("consumer_insert_splitwise", """
+    INSERT INTO splitwise_transactions 
+    (transaction_id, user_id, upload_session_id, date, total_cost,
+     description, category, my_column_value, my_share, role, status)
+    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11)
+    ON CONFLICT (transaction_id) DO NOTHING
+""")
+
 def process_messages():
     # 1. Connect to DB
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
+        conn = create_connection()
         cur = conn.cursor()
         logger.info("Connected to Database")
     except Exception as e:
@@ -43,6 +61,9 @@ def process_messages():
     
     logger.info(f"Consumer started. Listening on queue: {Config.RABBITMQ_QUEUE}")
 
+    # Most bank rows get their final category in the INSERT itself
+    categorizer = IngestCategorizer()
+
     # 3. Define callback function for message processing
     def callback(ch, method, properties, body):
         try:
@@ -52,16 +73,15 @@ def process_messages():
             source = data.get('source')  # 'BANK' or 'SPLITWISE'
             
             if source == 'BANK':
-                # Insert into bank_transactions
-                insert_query = """
-                INSERT INTO bank_transactions 
-                (transaction_id, user_id, upload_session_id, date, amount, 
-                 description, category, status)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (transaction_id) DO NOTHING;
-                """
+                key = merchant_key(data['description'])
+                if data['category'] == 'Uncategorized':
+                    data['category'] = categorizer.categorize(
+                        cur, data['user_id'], data.get('upload_session_id'),
+                        data['description'], data['amount'], key
+                    )
                 
-                cur.execute(insert_query, (
+                # Insert into bank_transactions (prepared once per connection)
+                execute_prepared(cur, INSERT_BANK, (
                     data['transaction_id'],
                     data['user_id'],
                     data.get('upload_session_id'),
@@ -69,24 +89,17 @@ def process_messages():
                     data['amount'],
                     data['description'],
                     data['category'],
-                    data['status']
+                    data['status'],
+                    key
                 ))
                 
                 conn.commit()
                 icon = "🦁"
-                logger.info(f"{icon} Bank: {data['description'][:30]:30} | ₹{data['amount']:,.2f}")
+                logger.info(f"{icon} Bank: {data['description'][:30]:30} | ₹{data['amount']:,.2f} | {data['category']}")
             
             elif source == 'SPLITWISE':
-                # Insert into splitwise_transactions
-                insert_query = """
-                INSERT INTO splitwise_transactions 
-                (transaction_id, user_id, upload_session_id, date, total_cost,
-                 description, category, my_column_value, my_share, role, status)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (transaction_id) DO NOTHING;
-                """
-                
-                cur.execute(insert_query, (
+                # Insert into splitwise_transactions (prepared once per connection)
+                execute_prepared(cur, INSERT_SPLITWISE, (
                     data['transaction_id'],
                     data['user_id'],
                     data.get('upload_session_id'),
@@ -1,5 +1,121 @@
 from app.database.connection import get_db_connection
+from app.database.prepared import register_statement, execute_prepared
 from datetime import datetime
+import json
+
+# Per-session aggregates (prepared once per pooled connection)
+SOLO_SPEND = register_statement("analytics_solo_spend", """
+    SELECT COALESCE(SUM(ABS(amount)), 0)
+    FROM bank_transactions
+    WHERE upload_session_id = $1
+      AND user_id = $2
+      AND amount < 0
+      AND status = 'UNLINKED'
+      AND category NOT IN ('Self Transfer')
+""")
+
+SPLIT_I_PAID = register_statement("analytics_split_i_paid", """
+    SELECT COALESCE(SUM(my_share), 0)
+    FROM splitwise_transactions
+    WHERE upload_session_id = $1
+      AND user_id = $2
+      AND role = 'PAYER'
+""")
+
+SPLIT_THEY_PAID = register_statement("analytics_split_they_paid", """
+    SELECT COALESCE(SUM(my_share), 0)
+    FROM splitwise_transactions
+    WHERE upload_session_id = $1
+      AND user_id = $2
+      AND role = 'BORROWER'
+""")
+
+CASH_OUTFLOW = register_statement("analytics_cash_outflow", """
+    SELECT COALESCE(SUM(ABS(amount)), 0)
+    FROM bank_transactions
+    WHERE upload_session_id = $1
+      AND user_id = $2
+      AND amount < 0
+""")
+
+FRIENDS_OWE_ME = register_statement("analytics_friends_owe_me", """
+    SELECT COALESCE(SUM(my_column_value), 0)
+    FROM splitwise_transactions
+    WHERE upload_session_id = $1
+      AND user_id = $2
+      AND my_column_value > 0
+""")
+
+I_OWE_FRIENDS = register_statement("analytics_i_owe_friends", """
+    SELECT COALESCE(ABS(SUM(my_column_value)), 0)
+    FROM splitwise_transactions
+    WHERE upload_session_id = $1
+      AND user_id = $2
+      AND my_column_value < 0
+""")
+
+CATEGORY_SOLO = register_statement("analytics_category_solo", """
+    SELECT 
+        category,
+        SUM(ABS(amount)) as total_amount,
+        COUNT(*) as txn_count
+    FROM bank_transactions
+    WHERE upload_session_id = $1
+      AND user_id = $2
+      AND amount < 0
+      AND status = 'UNLINKED'
+      AND category NOT IN ('Settlement', 'Investment', 'Credit Card', 'Savings', 'Self Transfer')
+    GROUP BY category
+""")
+
+CATEGORY_SPLIT_PAID = register_statement("analytics_category_split_paid", """
+    SELECT 
+        category,
+        SUM(my_share) as your_share,
+        COUNT(*) as txn_count
+    FROM splitwise_transactions
+    WHERE upload_session_id = $1
+      AND user_id = $2
+      AND role = 'PAYER'
+      AND status = 'LINKED'
+    GROUP BY category
+""")
+
+CATEGORY_SPLIT_BORROWED = register_statement("analytics_category_split_borrowed", """
+    SELECT 
+        category,
+        SUM(my_share) as your_share,
+        COUNT(*) as txn_count
+    FROM splitwise_transactions
+    WHERE upload_session_id = $1
+      AND user_id = $2
+      AND role = 'BORROWER'
+    GROUP BY category
+""")
+
+UNLINKED_PAYER = register_statement("analytics_unlinked_payer", """
+    SELECT 
+        date,
+        description,
+        total_cost,
+        my_share,
+        category
+    FROM splitwise_transactions
+    WHERE upload_session_id = $1
+      AND user_id = $2
+      AND role = 'PAYER'
+      AND status = 'UNLINKED'
+    ORDER BY date DESC
+""")
+
+SPENDING_DAYS = register_statement("analytics_spending_days", """
+    SELECT COUNT(DISTINCT date)
+    FROM bank_transactions
+    WHERE upload_session_id = $1
+      AND user_id = $2
+      AND amount < 0
+      AND status != 'TRANSFER'
+""")
 
 CATEGORY_MAPPING = {
     'General': 'Other',
@@ -22,37 +138,17 @@ def calculate_net_consumption(session_id, user_id=1):
     cur = conn.cursor()
     
     # 1. Solo Spend (unlinked bank, exclude self-transfers)
-    cur.execute("""
-        SELECT COALESCE(SUM(ABS(amount)), 0)
-        FROM bank_transactions
-        WHERE upload_session_id = %s
-          AND user_id = %s
-          AND amount < 0
-          AND status = 'UNLINKED'
-          AND category NOT IN ('Self Transfer')
-    """, (session_id, user_id))
+    execute_prepared(cur, SOLO_SPEND, (session_id, user_id))
     
     solo_spend = float(cur.fetchone()[0])
     
     # 2. My Share (I Paid) - where role = PAYER (not settlements)
-    cur.execute("""
-        SELECT COALESCE(SUM(my_share), 0)
-        FROM splitwise_transactions
-        WHERE upload_session_id = %s
-          AND user_id = %s
-          AND role = 'PAYER'
-    """, (session_id, user_id))
+    execute_prepared(cur, SPLIT_I_PAID, (session_id, user_id))
     
     split_i_paid = float(cur.fetchone()[0])
     
     # 3. My Share (They Paid) - where role = BORROWER
-    cur.execute("""
-        SELECT COALESCE(SUM(my_share), 0)
-        FROM splitwise_transactions
-        WHERE upload_session_id = %s
-          AND user_id = %s
-          AND role = 'BORROWER'
-    """, (session_id, user_id))
+    execute_prepared(cur, SPLIT_THEY_PAID, (session_id, user_id))
     
     split_they_paid = float(cur.fetchone()[0])
     
@@ -77,13 +173,7 @@ def calculate_cash_outflow(session_id, user_id=1):
     conn = get_db_connection()
     cur = conn.cursor()
     
-    cur.execute("""
-        SELECT COALESCE(SUM(ABS(amount)), 0)
-        FROM bank_transactions
-        WHERE upload_session_id = %s
-          AND user_id = %s
-          AND amount < 0
-    """, (session_id, user_id))
+    execute_prepared(cur, CASH_OUTFLOW, (session_id, user_id))
     
     total = float(cur.fetchone()[0])
     
@@ -105,24 +195,12 @@ def calculate_monthly_float(session_id, user_id=1):
     cur = conn.cursor()
     
     # What friends owe you (positive values in my_column_value)
-    cur.execute("""
-        SELECT COALESCE(SUM(my_column_value), 0)
-        FROM splitwise_transactions
-        WHERE upload_session_id = %s
-          AND user_id = %s
-          AND my_column_value > 0
-    """, (session_id, user_id))
+    execute_prepared(cur, FRIENDS_OWE_ME, (session_id, user_id))
     
     friends_owe_me = float(cur.fetchone()[0])
     
     # What you owe friends (negative values in my_column_value)
-    cur.execute("""
-        SELECT COALESCE(ABS(SUM(my_column_value)), 0)
-        FROM splitwise_transactions
-        WHERE upload_session_id = %s
-          AND user_id = %s
-          AND my_column_value < 0
-    """, (session_id, user_id))
+    execute_prepared(cur, I_OWE_FRIENDS, (session_id, user_id))
     
     i_owe_friends = float(cur.fetchone()[0])
     
@@ -144,19 +222,7 @@ def get_category_breakdown(session_id, user_id=1):
     category_counts = {}  # NEW: Track transaction counts
     
     # 1. Solo expenses (unlinked bank)
-    cur.execute("""
-        SELECT 
-            category,
-            SUM(ABS(amount)) as total_amount,
-            COUNT(*) as txn_count
-        FROM bank_transactions
-        WHERE upload_session_id = %s
-          AND user_id = %s
-          AND amount < 0
-          AND status = 'UNLINKED'
-          AND category NOT IN ('Settlement', 'Investment', 'Credit Card', 'Savings', 'Self Transfer')
-        GROUP BY category
-    """, (session_id, user_id))
+    execute_prepared(cur, CATEGORY_SOLO, (session_id, user_id))
     
     for row in cur.fetchall():
         raw_category = row[0] or 'Other'
@@ -167,18 +233,7 @@ def get_category_breakdown(session_id, user_id=1):
         category_counts[category] = category_counts.get(category, 0) + count  # NEW
     
     # 2. Split expenses (you paid) - use YOUR SHARE
-    cur.execute("""
-        SELECT 
-            category,
-            SUM(my_share) as your_share,
-            COUNT(*) as txn_count
-        FROM splitwise_transactions
-        WHERE upload_session_id = %s
-          AND user_id = %s
-          AND role = 'PAYER'
-          AND status = 'LINKED'
-        GROUP BY category
-    """, (session_id, user_id))
+    execute_prepared(cur, CATEGORY_SPLIT_PAID, (session_id, user_id))
     
     for row in cur.fetchall():
         raw_category = row[0] or 'Other'
@@ -189,17 +244,7 @@ def get_category_breakdown(session_id, user_id=1):
         category_counts[category] = category_counts.get(category, 0) + count  # NEW
     
     # 3. Split expenses (friend paid) - use YOUR SHARE
-    cur.execute("""
-        SELECT 
-            category,
-            SUM(my_share) as your_share,
-            COUNT(*) as txn_count
-        FROM splitwise_transactions
-        WHERE upload_session_id = %s
-          AND user_id = %s
-          AND role = 'BORROWER'
-        GROUP BY category
-    """, (session_id, user_id))
+    execute_prepared(cur, CATEGORY_SPLIT_BORROWED, (session_id, user_id))
     
     for row in cur.fetchall():
         raw_category = row[0] or 'Other'
@@ -319,20 +364,7 @@ def get_unlinked_splitwise_payer(session_id, user_id=1):
     conn = get_db_connection()
     cur = conn.cursor()
     
-    cur.execute("""
-        SELECT 
-            date,
-            description,
-            total_cost,
-            my_share,
-            category
-        FROM splitwise_transactions
-        WHERE upload_session_id = %s
-          AND user_id = %s
-          AND role = 'PAYER'
-          AND status = 'UNLINKED'
-        ORDER BY date DESC
-    """, (session_id, user_id))
+    execute_prepared(cur, UNLINKED_PAYER, (session_id, user_id))
     
     results = cur.fetchall()
     cur.close()
@@ -365,9 +397,25 @@ def get_unlinked_splitwise_payer(session_id, user_id=1):
         'transactions': unlinked
     }
 
-def get_monthly_metrics(session_id, user_id=1):
+def count_spending_days(session_id, user_id=1):
     """
-    Main function - returns all metrics for a session
+    Count distinct days with bank spending (used for daily averages)
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    execute_prepared(cur, SPENDING_DAYS, (session_id, user_id))
+    
+    days = cur.fetchone()[0] or 0
+    
+    cur.close()
+    conn.close()
+    
+    return days
+
+def compute_monthly_metrics(session_id, user_id=1):
+    """
+    Recompute all metrics for a session from raw transaction rows
     """
     print(f"\n📊 Calculating metrics for session: {session_id}")
     
@@ -377,6 +425,7 @@ def get_monthly_metrics(session_id, user_id=1):
     category_breakdown = get_category_breakdown(session_id, user_id)
     transaction_stats = get_transaction_stats(session_id, user_id)
     unlinked_payer = get_unlinked_splitwise_payer(session_id, user_id)
+    spending_days = count_spending_days(session_id, user_id)
     
     return {
         'session_id': session_id,
@@ -385,9 +434,124 @@ def get_monthly_metrics(session_id, user_id=1):
         'monthly_float': monthly_float,
         'category_breakdown': category_breakdown,
         'transaction_stats': transaction_stats,
-        'unlinked_payer': unlinked_payer
+        'unlinked_payer': unlinked_payer,
+        'spending_days': spending_days
     }
 
+def refresh_session_metrics(session_id, user_id=1):
+    """
+    Recompute metrics and store them in the session_metrics snapshot
+    
+    Called at the end of the pipeline and after manual link, skip or
+    recategorize actions. Returns the snapshot as stored.
+    """
+    metrics = compute_monthly_metrics(session_id, user_id)
+    
+    # Dates in the unlinked payer list are stored as ISO strings
+    metrics = json.loads(json.dumps(metrics, default=str))
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    cur.execute("""
+        INSERT INTO session_metrics
+        (session_id, user_id, net_consumption, cash_outflow, monthly_float,
+         category_breakdown, transaction_stats, unlinked_payer, spending_days, computed_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (session_id) DO UPDATE
+        SET user_id = EXCLUDED.user_id,
+            net_consumption = EXCLUDED.net_consumption,
+            cash_outflow = EXCLUDED.cash_outflow,
+            monthly_float = EXCLUDED.monthly_float,
+            category_breakdown = EXCLUDED.category_breakdown,
+            transaction_stats = EXCLUDED.transaction_stats,
+            unlinked_payer = EXCLUDED.unlinked_payer,
+            spending_days = EXCLUDED.spending_days,
+            computed_at = EXCLUDED.computed_at
+    """, (
+        session_id,
+        user_id,
+        json.dumps(metrics['net_consumption']),
+        metrics['cash_outflow'],
+        metrics['monthly_float'],
+        json.dumps(metrics['category_breakdown']),
+        json.dumps(metrics['transaction_stats']),
+        json.dumps(metrics['unlinked_payer']),
+        metrics['spending_days']
+    ))
+    
+    conn.commit()
+    cur.close()
+    conn.close()
+    
+    return metrics
+
+def get_session_metrics_snapshot(session_id, user_id=1):
+    """
+    Read the stored metrics snapshot for a session (single PK lookup)
+    Returns None if the session has no snapshot yet
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    cur.execute("""
+        SELECT 
+            net_consumption,
+            cash_outflow,
+            monthly_float,
+            category_breakdown,
+            transaction_stats,
+            unlinked_payer,
+            spending_days
+        FROM session_metrics
+        WHERE session_id = %s AND user_id = %s
+    """, (session_id, user_id))
+    
+    row = cur.fetchone()
+    cur.close()
+    conn.close()
+    
+    if not row:
+        return None
+    
+    return {
+        'session_id': session_id,
+        'net_consumption': row[0],
+        'cash_outflow': float(row[1]),
+        'monthly_float': float(row[2]),
+        'category_breakdown': row[3],
+        'transaction_stats': row[4],
+        'unlinked_payer': row[5],
+        'spending_days': row[6]
+    }
+
+def get_monthly_metrics(session_id, user_id=1):
+    """
+    Main function - returns all metrics for a session
+    
+    Served from the session_metrics snapshot. Without one, a completed
+    session is computed and stored; a session still processing is computed
+    without storing, so a half-built snapshot is never served later.
+    """
+    metrics = get_session_metrics_snapshot(session_id, user_id)
+    
+    if metrics is None:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT status FROM upload_sessions WHERE id = %s AND user_id = %s
+        """, (session_id, user_id))
+        row = cur.fetchone()
+        cur.close()
+        conn.close()
+        
+        if row and row[0] == 'completed':
+            metrics = refresh_session_metrics(session_id, user_id)
+        else:
+            metrics = json.loads(json.dumps(compute_monthly_metrics(session_id, user_id), default=str))
+    
+    return metrics
+
 
 def print_report(metrics):
     """
@@ -507,7 +671,7 @@ if __name__ == "__main__":
     session_id = sys.argv[1]
     
     try:
-        metrics = get_monthly_metrics(session_id)
+        metrics = refresh_session_metrics(session_id)
         print_report(metrics)
     except Exception as e:
         print(f"❌ Error: {e}")
@@ -0,0 +1,159 @@
+"""
+Backfill Orchestrator
+Runs the analysis pipeline for many already-ingested sessions in parallel
+
+Adjacent months share work: the linker reads the neighbouring months' bank
+rows and the boundary stage links their edge-of-month Splitwise rows. So
+sessions run in waves where no two sessions in a wave are adjacent (or in
+the same month): first every other month, then the months in between.
+Within a wave, sessions run in a bounded process pool.
+
+Each worker uses at most BACKFILL_POOL_MAX connections: it waits for a
+pooled connection instead of opening a dedicated one, and skips background
+ML retrains (the API process's next retrain picks the new labels up through
+label_updated_at). Nested metric
+refreshes hold a second connection while the pipeline holds its own, so
+BACKFILL_POOL_MAX must stay at 2 or more.
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from app.config import Config
+from app.database.connection import get_db_connection
+
+
+def month_ordinal(selected_month):
+    """'2025-03' -> 2025 * 12 + 2"""
+    year, month = selected_month.split("-")
+    return int(year) * 12 + int(month) - 1
+
+
+def plan_waves(sessions):
+    """
+    Split sessions into waves that are safe to run concurrently
+
+    sessions: [(session_id, selected_month)]
+    Returns [[session_id, ...], ...] in execution order
+    """
+    waves = {}
+    seen_per_month = {}
+
+    for session_id, selected_month in sorted(sessions, key=lambda s: (s[1], s[0])):
+        ordinal = month_ordinal(selected_month)
+        # Re-uploads of the same month must not overlap either
+        repeat = seen_per_month.get(ordinal, 0)
+        seen_per_month[ordinal] = repeat + 1
+        waves.setdefault((repeat, ordinal % 2), []).append(session_id)
+
+    return [waves[key] for key in sorted(waves)]
+
+
+def load_backfill_sessions(user_id=1, session_ids=None):
+    """Sessions to backfill: the given ids, or every session still processing"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    if session_ids:
+        cur.execute("""
+            SELECT id, selected_month, bank_count + splitwise_count
+            FROM upload_sessions
+            WHERE user_id = %s AND id = ANY(%s)
+        """, (user_id, list(session_ids)))
+    else:
+        cur.execute("""
+            SELECT id, selected_month, bank_count + splitwise_count
+            FROM upload_sessions
+            WHERE user_id = %s AND status = 'processing'
+        """, (user_id,))
+
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+    return rows
+
+
+def _init_worker():
+    # Each worker process gets its own small pool (the parent's is not inherited)
+    # and never goes past it: no dedicated connections, no retrain threads
+    Config.DB_POOL_MIN = 1
+    Config.DB_POOL_MAX = Config.BACKFILL_POOL_MAX
+    Config.DB_POOL_WAIT = Config.BACKFILL_POOL_WAIT
+    Config.ML_BACKGROUND_RETRAIN = False
+
+
+def _run_session(session_id, user_id):
+    from app.services.linker import run_full_pipeline
+
+    start = time.perf_counter()
+    try:
+        run_full_pipeline(session_id, user_id)
+        error = None
+    except Exception as e:
+        error = str(e)
+
+    return {
+        'session_id': session_id,
+        'seconds': time.perf_counter() - start,
+        'error': error
+    }
+
+
+def run_backfill(user_id=1, session_ids=None, workers=None):
+    """
+    Run the full pipeline for every session, wave by wave
+
+    Returns per-session results plus overall timing and throughput.
+    Worker connections are bounded by workers * BACKFILL_POOL_MAX.
+    """
+    workers = workers or Config.BACKFILL_WORKERS
+    sessions = load_backfill_sessions(user_id, session_ids)
+
+    if not sessions:
+        print("✅ Nothing to backfill")
+        return {'sessions': [], 'total_seconds': 0.0, 'transactions': 0, 'transactions_per_second': 0.0}
+
+    row_counts = {session_id: count or 0 for session_id, _, count in sessions}
+    months = {session_id: month for session_id, month, _ in sessions}
+    waves = plan_waves([(session_id, month) for session_id, month, _ in sessions])
+
+    print(f"🚀 Backfilling {len(sessions)} sessions in {len(waves)} waves ({workers} workers)")
+
+    results = []
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        for number, wave in enumerate(waves, 1):
+            print(f"\n🌊 Wave {number}/{len(waves)}: {len(wave)} sessions")
+            wave_started = time.perf_counter()
+
+            futures = [pool.submit(_run_session, session_id, user_id) for session_id in wave]
+            for future in as_completed(futures):
+                result = future.result()
+                result['month'] = months[result['session_id']]
+                result['transactions'] = row_counts[result['session_id']]
+                result['transactions_per_second'] = (
+                    result['transactions'] / result['seconds'] if result['seconds'] else 0.0
+                )
+                results.append(result)
+
+                status = f"❌ {result['error']}" if result['error'] else "✅"
+                print(
+                    f"   {status} {result['month']} {result['session_id']}: "
+                    f"{result['seconds']:.1f}s, {result['transactions_per_second']:.0f} txn/s"
+                )
+
+            print(f"   Wave {number} done in {time.perf_counter() - wave_started:.1f}s")
+
+    total_seconds = time.perf_counter() - started
+    transactions = sum(row_counts.values())
+    failed = sum(1 for r in results if r['error'])
+
+    print(f"\n✅ Backfill complete: {len(results) - failed} ok, {failed} failed")
+    print(f"   {transactions} transactions in {total_seconds:.1f}s "
+          f"({transactions / total_seconds if total_seconds else 0:.0f} txn/s)")
+
+    return {
+        'sessions': sorted(results, key=lambda r: r['month']),
+        'total_seconds': total_seconds,
+        'transactions': transactions,
+        'transactions_per_second': transactions / total_seconds if total_seconds else 0.0
+    }
@@ -1,172 +1,304 @@
 from app.database.connection import get_db_connection
-from difflib import SequenceMatcher
 import re
 from psycopg2.extras import execute_values
+from app.services.link_writer import LinkWriter
+from app.services.similarity import SimilarityScorer, SETTLEMENT_PROFILE
+from app.services.linker_trace import LinkerTrace, DEFAULT_MAX_DETAILS, traced_pass, traced_sql
+from app.services.keyword_matcher import KeywordMatcher
+from app.services.category_writer import write_categories
+from app.services.merchant_memory import fill_merchant_keys, load_merchant_memory, learnable_key, learn_merchants
+from app.services.ml_categorizer import predict_categories, schedule_retrain
+from app.services.transfer_patterns import get_transfer_matcher
+from app.services.categorization_profiler import CategorizationProfile
+from app.config import Config
+from collections import Counter
+
+# Keyword categories, in priority order: the first keyword found in a description wins
+CATEGORY_KEYWORDS = {
+    'Food & Dining': [
+        'SWIGGY', 'ZOMATO', 'DUNZO', 'FRESHMENU', 'FAASOS', 'BEHROUZ',
+        'RESTAURANT', 'CAFE', 'COFFEE', 'KFC', 'MCDONALD', 'PIZZA', 
+        'DOMINO', 'SUBWAY', 'BURGER', 'STARBUCKS', 'CCD', 'BARISTA',
+        'HOTEL', 'DHABA', 'KITCHEN', 'CANTEEN', 'FOOD', 'DINING',
+        'BASKIN', 'DUNKIN', 'TACO BELL', 'HALDIRAM', 'BIRYANI',
+        'CHINESE', 'NORTH INDIAN', 'SOUTH INDIAN', 'CONTINENTAL'
+    ],
+    'Groceries': [
+        'INSTAMART', 'BLINKIT', 'ZEPTO', 'BIGBASKET', 'DMART', 
+        'SUPERMARKET', 'GROCERY', 'FRESH', 'VEGETABLES', 'FRUITS',
+        'RELIANCE FRESH', 'MORE MEGASTORE', 'SPAR', 'JIOMART'
+    ],
+    'Transport': [
+        'UBER', 'OLA', 'RAPIDO', 'METRO', 'IRCTC', 'BUS', 'PETROL', 
+        'FUEL', 'TRAIN', 'FLIGHT', 'AIRLINE', 'MAKEMYTRIP', 'GOIBIBO',
+        'CAB', 'TAXI', 'AUTO', 'INDIAN OIL', 'HP PETROL', 'BHARAT PETROLEUM',
+        'FASTAG', 'PARKING', 'TOLL'
+    ],
+    'Shopping': [
+        'AMAZON', 'FLIPKART', 'MYNTRA', 'AJIO', 'MEESHO', 'MALL',
+        'SHOP', 'STORE', 'RETAIL', 'NYKAA', 'LENSKART', 'CROMA',
+        'LIFESTYLE', 'WESTSIDE', 'PANTALOONS', 'MAX FASHION',
+        'DECATHLON', 'NIKE', 'ADIDAS'
+    ],
+    'Entertainment': [
+        'NETFLIX', 'PRIME', 'HOTSTAR', 'BOOKMYSHOW', 'PVR', 'INOX',
+        'SPOTIFY', 'YOUTUBE', 'CINEMA', 'MOVIE', 'GAME', 'GAMING',
+        'PLAY STORE', 'APP STORE', 'STEAM', 'XBOX', 'PLAYSTATION'
+    ],
+    'Bills & Utilities': [
+        'ELECTRICITY', 'WATER', 'GAS', 'BROADBAND', 'MOBILE', 'RECHARGE',
+        'AIRTEL', 'JIO', 'VODAFONE', 'BILL', 'TATA POWER', 'BSNL',
+        'ACT FIBERNET', 'HATHWAY', 'DTH', 'DISH TV'
+    ],
+    'Health': [
+        'PHARMACY', 'MEDICINE', 'APOLLO', 'MEDPLUS', 'HOSPITAL',
+        'DOCTOR', 'CLINIC', 'HEALTH', 'MEDICAL', '1MG', 'PHARMEASY',
+        'NETMEDS', 'DIAGNOSTIC', 'LAB TEST', 'PRACTO'
+    ],
+    'Investment': [
+        'GROWW', 'ZERODHA', 'ANGEL ONE', 'UPSTOX', 'SIP', 'MUTUAL FUND',
+        'STOCKS', 'KUVERA', 'COIN', 'SMALLCASE', 'ETF'
+    ],
+    'Education': [
+        'UDEMY', 'COURSERA', 'UNACADEMY', 'BYJU', 'SCHOOL', 'COLLEGE',
+        'TUITION', 'COURSE', 'BOOK', 'EXAM FEE'
+    ]
+}
+
+# Compiled once; matches every keyword in one pass per description
+KEYWORD_MATCHER = KeywordMatcher.from_groups(CATEGORY_KEYWORDS)
+
+# Debits within ±5% of the configured monthly rent are categorized as Rent
+RENT_TOLERANCE = 0.05
+
+MARK_TRANSFERS_SQL = """
+    UPDATE bank_transactions b
+    SET category = v.category, status = 'TRANSFER'
+    FROM (VALUES %s) AS v (id, category)
+    WHERE b.id = v.id
+      AND b.status = 'UNLINKED'
+"""
+
+
+def compile_family_matcher(family_members):
+    """
+    One matcher for every family name part ("Aai Patil" -> AAI, PATIL)
+    Parts under 3 characters ("MR", "MS") are skipped. None if nothing to match.
+    """
+    parts = [
+        (part, part)
+        for member in family_members or []
+        for part in member.upper().strip().split()
+        if len(part) >= 3
+    ]
+    return KeywordMatcher(parts) if parts else None
+
+
+# Precedence for bank rows once user rules have run, shared by
+# auto_categorize_bank_transactions (every stage, whole session) and
+# IngestCategorizer (one row at a time). Ingest skips 'ml' (the model lives
+# in the API process) and the 'Other' sweep, so the one difference between
+# the paths: a row with a keyword hit gets the keyword category at ingest,
+# where the post-pass would have let a confident ML prediction win.
+BANK_STAGES = ('family', 'rent', 'merchant_memory', 'ml', 'keywords', 'other')
+
+
+def rent_band(monthly_rent):
+    """(low, high) debit amounts counted as rent, or None without a configured rent"""
+    if not monthly_rent or monthly_rent <= 0:
+        return None
+    return monthly_rent * (1 - RENT_TOLERANCE), monthly_rent * (1 + RENT_TOLERANCE)
+
+
+class BankRowClassifier:
+    """
+    BANK_STAGES for one session's rows
+
+    family_matcher: compile_family_matcher() result (or None)
+    band: rent_band() result (or None)
+    memory: {merchant_key: category} from merchant memory
+    threshold: minimum ML confidence (Config.ML_CONFIDENCE_THRESHOLD)
+    """
+
+    def __init__(self, family_matcher, band, memory, threshold=None):
+        self.family_matcher = family_matcher
+        self.band = band
+        self.memory = memory
+        self.threshold = Config.ML_CONFIDENCE_THRESHOLD if threshold is None else threshold
+
+    def classify(self, description, amount, key, prediction=None, stages=BANK_STAGES):
+        """
+        (stage, category, hit) from the first of `stages` that decides the
+        row, or (None, None, None). hit is the matched family name part or
+        (keyword, category) for keywords; prediction is (category, confidence).
+        """
+        for stage in stages:
+            if stage == 'family':
+                name_part = self.family_matcher.match(description) if self.family_matcher else None
+                if name_part:
+                    return stage, 'Family Transfer', name_part
+
+            elif stage == 'rent':
+                if self.band and amount < 0 and self.band[0] <= abs(float(amount)) <= self.band[1]:
+                    return stage, 'Rent', None
+
+            elif stage == 'merchant_memory':
+                if key and key in self.memory:
+                    return stage, self.memory[key], None
+
+            elif stage == 'ml':
+                if prediction and prediction[0] and prediction[1] >= self.threshold:
+                    return stage, prediction[0], None
+
+            elif stage == 'keywords':
+                hit = KEYWORD_MATCHER.match_keyword(description)
+                if hit:
+                    return stage, hit[1], hit
+
+            elif stage == 'other':
+                return stage, 'Other', None
+
+        return None, None, None
+
 
 def apply_user_categorization_rules(session_id, user_id=1):
     """
     Apply user-defined categorization rules BEFORE keyword matching
     This gives user rules highest priority
     """
-    from app.services.categorization_rules import apply_user_rules_to_transaction
-    
-    conn = get_db_connection()
-    cur = conn.cursor()
+    from app.services.rule_engine import classify_session
     
     print("\n🎯 Applying User Categorization Rules...")
     
-    # Apply to bank transactions
-    cur.execute("""
-        SELECT id, description
-        FROM bank_transactions
-        WHERE upload_session_id = %s
-          AND user_id = %s
-          AND (category IS NULL OR category = 'Uncategorized')
-          AND status != 'TRANSFER'
-    """, (session_id, user_id))
-    
-    bank_txns = cur.fetchall()
-    bank_categorized = 0
-    
-    for txn_id, description in bank_txns:
-        matched_category = apply_user_rules_to_transaction(description, 'BANK', user_id)
-        if matched_category:
-            cur.execute("""
-                UPDATE bank_transactions
-                SET category = %s
-                WHERE id = %s
-            """, (matched_category, txn_id))
-            bank_categorized += 1
-    
-    conn.commit()
-    
-    # Apply to splitwise transactions
-    cur.execute("""
-        SELECT id, description
-        FROM splitwise_transactions
-        WHERE upload_session_id = %s
-          AND user_id = %s
-          AND (category IS NULL OR category = 'Uncategorized')
-    """, (session_id, user_id))
-    
-    split_txns = cur.fetchall()
-    split_categorized = 0
-    
-    for txn_id, description in split_txns:
-        matched_category = apply_user_rules_to_transaction(description, 'SPLITWISE', user_id)
-        if matched_category:
-            cur.execute("""
-                UPDATE splitwise_transactions
-                SET category = %s
-                WHERE id = %s
-            """, (matched_category, txn_id))
-            split_categorized += 1
-    
-    conn.commit()
+    # Rules compiled once per source, whole session matched in memory, bulk write-back
+    bank_categorized, split_categorized = classify_session(session_id, user_id)
     
     if bank_categorized > 0 or split_categorized > 0:
         print(f"   ✅ User rules: {bank_categorized} bank, {split_categorized} splitwise")
     
-    cur.close()
-    conn.close()
-    
     return bank_categorized + split_categorized
 
-def detect_settlements(user_id=1, session_id=None):
-    """Detect and mark settlement transactions"""
+def detect_settlements(user_id=1, session_id=None, dry_run=False, max_details=None):
+    """
+    Detect and mark settlement transactions
+
+    dry_run: write nothing and return a LinkerTrace dict (candidate counts,
+    choices, rejections, SQL vs matching time) instead of the count.
+    The trace summary lists the bank ids a real run would claim.
+    """
+    trace = LinkerTrace("settlements", max_details or DEFAULT_MAX_DETAILS) if dry_run else None
+    
     conn = get_db_connection()
     cur = conn.cursor()
     
-    print("\n🔍 Starting Settlement Detection...")
+    print(f"\n🔍 Starting Settlement Detection{' (dry run)' if dry_run else ''}...")
     
     # Step 1: Find Splitwise settlements (already marked during parsing)
-    cur.execute("""
-        SELECT id, date, total_cost, description
-        FROM splitwise_transactions
-        WHERE user_id = %s 
-          AND upload_session_id = %s
-          AND status = 'SETTLEMENT'
-    """, (user_id, session_id))
-    
-    settlement_candidates = cur.fetchall()
+    with traced_sql(trace):
+        cur.execute("""
+            SELECT id, date, total_cost, description
+            FROM splitwise_transactions
+            WHERE user_id = %s 
+              AND upload_session_id = %s
+              AND status = 'SETTLEMENT'
+        """, (user_id, session_id))
+        settlement_candidates = cur.fetchall()
+    
     print(f"📋 Found {len(settlement_candidates)} settlement entries in Splitwise")
     
-    if len(settlement_candidates) == 0:
+    if len(settlement_candidates) == 0 and not dry_run:
         print("✅ No settlements to process")
         cur.close()
         conn.close()
         return 0
     
-    settlements_marked = 0
+    # Links are buffered and written together once every settlement is matched
+    writer = LinkWriter(conn)
+    scorer = SimilarityScorer(SETTLEMENT_PROFILE)
     
     # Step 2: Process each settlement
-    for split_txn in settlement_candidates:
-        split_id, split_date, split_total, split_desc = split_txn
-        
-        if split_total is None:
-            print(f"⚠️ Skipping {split_desc} - no amount")
-            continue
-        
-        target_amount = float(split_total)
-        tolerance = target_amount * 0.02
-        
-        print(f"\n🔎 Processing: {split_desc} | ₹{target_amount} | {split_date}")
-        
-        # Step 3: Find matching Bank transaction
-        cur.execute("""
-            SELECT id, date, description
-            FROM bank_transactions
-            WHERE user_id = %s 
-              AND ABS(ABS(amount) - %s) <= %s
-              AND date >= (%s::date - INTERVAL '2 days')
-              AND date <= (%s::date + INTERVAL '2 days')
-              AND status = 'UNLINKED'
-        """, (user_id, target_amount, tolerance, split_date, split_date))
-        
-        bank_candidates = cur.fetchall()
-        
-        if len(bank_candidates) == 0:
-            print("   ⚠️ No matching bank transaction found")
-            continue
-        
-        # Step 4: Pick best match
-        if len(bank_candidates) == 1:
-            best_match = bank_candidates[0]
-            print("   ✓ Single match found")
-        else:
-            # Multiple matches - use name similarity
-            best_match = find_best_settlement_match(split_desc, bank_candidates)
-            print(f"   ✓ Best match from {len(bank_candidates)} candidates")
-        
-        if best_match:
-            bank_id = best_match[0]
+    with traced_pass(trace, "Settlement Match") as pass_trace:
+        for split_txn in settlement_candidates:
+            split_id, split_date, split_total, split_desc = split_txn
             
-            # Step 5: Mark both as Settlement and link them
-            cur.execute("""
-                UPDATE splitwise_transactions 
-                SET category = 'Settlement', 
-                    linked_bank_id = %s,
-                    status = 'LINKED'
-                WHERE id = %s
-            """, (bank_id, split_id))
+            if split_total is None:
+                print(f"⚠️ Skipping {split_desc} - no amount")
+                if pass_trace:
+                    pass_trace.reject(split_id, None, None, "no amount")
+                continue
             
-            cur.execute("""
-                UPDATE bank_transactions 
-                SET category = 'Settlement', 
-                    linked_splitwise_id = %s,
-                    status = 'TRANSFER'
-                WHERE id = %s
-            """, (split_id, bank_id))
+            target_amount = float(split_total)
+            tolerance = target_amount * 0.02
             
-            conn.commit()
-            settlements_marked += 1
+            print(f"\n🔎 Processing: {split_desc} | ₹{target_amount} | {split_date}")
             
-            print(f"   🔗 MARKED AS SETTLEMENT!")
-            print(f"      Splitwise ID: {split_id}, Bank ID: {bank_id}")
+            # Step 3: Find matching Bank transaction
+            with traced_sql(trace):
+                cur.execute("""
+                    SELECT id, date, description
+                    FROM bank_transactions
+                    WHERE user_id = %s 
+                      AND ABS(ABS(amount) - %s) <= %s
+                      AND date >= (%s::date - INTERVAL '2 days')
+                      AND date <= (%s::date + INTERVAL '2 days')
+                      AND status = 'UNLINKED'
+                """, (user_id, target_amount, tolerance, split_date, split_date))
+                rows = cur.fetchall()
+            
+            # Skip bank rows already claimed by an earlier settlement in this run
+            bank_candidates = [c for c in rows if not writer.is_claimed(bank_id=c[0])]
+            if pass_trace:
+                pass_trace.row(len(bank_candidates))
+            
+            if len(bank_candidates) == 0:
+                print("   ⚠️ No matching bank transaction found")
+                continue
+            
+            # Step 4: Pick best match
+            if len(bank_candidates) == 1:
+                best_match = bank_candidates[0]
+                print("   ✓ Single match found")
+            else:
+                # Multiple matches - use name similarity
+                best_match = find_best_settlement_match(split_desc, bank_candidates, scorer)
+                print(f"   ✓ Best match from {len(bank_candidates)} candidates")
+                if pass_trace:
+                    pass_trace.tie_break(split_id, best_match[0], [
+                        (c[0], scorer.score(split_desc, c[2])) for c in bank_candidates
+                    ])
+            
+            if best_match:
+                bank_id = best_match[0]
+                
+                # Step 5: Mark both as Settlement and link them
+                writer.link(
+                    split_id, bank_id,
+                    split_status='LINKED', bank_status='TRANSFER',
+                    split_category='Settlement', bank_category='Settlement'
+                )
+                if pass_trace:
+                    pass_trace.link()
+                
+                print(f"   🔗 {'WOULD MARK' if dry_run else 'MARKED'} AS SETTLEMENT!")
+                print(f"      Splitwise ID: {split_id}, Bank ID: {bank_id}")
+    
+    cur.close()
+    
+    if dry_run:
+        conn.close()
+        trace.summary = {
+            'session_id': session_id,
+            'settlement_rows': len(settlement_candidates),
+            'would_mark': len(writer),
+            'claimed_bank_ids': sorted(writer.claimed_bank_ids())
+        }
+        print(f"\n✅ Settlement dry run complete. Would mark {len(writer)} settlements.")
+        return trace.to_dict()
+    
+    settlements_marked = writer.flush()
     
     print(f"\n✅ Settlement Detection Complete. Marked {settlements_marked} settlements.")
     
-    cur.close()
     conn.close()
     
     return settlements_marked
@@ -174,187 +306,147 @@ def detect_settlements(user_id=1, session_id=None):
 def auto_categorize_bank_transactions(session_id, user_id=1):
     """
     Auto-categorize bank transactions with user config support
+    
+    Family, rent, merchant memory, ML, keywords and the 'Other' sweep share
+    one read of the session and one bulk write. Returns per-rule hit counts; each stage is
+    profiled into categorization_profiles.
     """
+    profile = CategorizationProfile('auto_categorize', session_id, user_id)
     
     # PRIORITY 1: Apply user rules first
-    apply_user_categorization_rules(session_id, user_id)
+    with profile.stage('user_rules'):
+        apply_user_categorization_rules(session_id, user_id)
     
     # PRIORITY 2: Get user config from session
     conn = get_db_connection()
     cur = conn.cursor()
     
-    cur.execute("""
-        SELECT user_config FROM upload_sessions WHERE id = %s
-    """, (session_id,))
-    
-    result = cur.fetchone()
-    user_config = {}
-    
-    if result and result[0]:
-        user_config = result[0]  # ✅ FIXED - Already a dict from JSONB
-    
-    family_members = user_config.get('family_members', [])
-    monthly_rent = user_config.get('monthly_rent')
-    
-    print(f"\n🎯 User Config: Family={family_members}, Rent={monthly_rent}")
-    
-    # Expanded keyword categories (same as before)
-    CATEGORY_KEYWORDS = {
-        'Food & Dining': [
-            'SWIGGY', 'ZOMATO', 'DUNZO', 'FRESHMENU', 'FAASOS', 'BEHROUZ',
-            'RESTAURANT', 'CAFE', 'COFFEE', 'KFC', 'MCDONALD', 'PIZZA', 
-            'DOMINO', 'SUBWAY', 'BURGER', 'STARBUCKS', 'CCD', 'BARISTA',
-            'HOTEL', 'DHABA', 'KITCHEN', 'CANTEEN', 'FOOD', 'DINING',
-            'BASKIN', 'DUNKIN', 'TACO BELL', 'HALDIRAM', 'BIRYANI',
-            'CHINESE', 'NORTH INDIAN', 'SOUTH INDIAN', 'CONTINENTAL'
-        ],
-        'Groceries': [
-            'INSTAMART', 'BLINKIT', 'ZEPTO', 'BIGBASKET', 'DMART', 
-            'SUPERMARKET', 'GROCERY', 'FRESH', 'VEGETABLES', 'FRUITS',
-            'RELIANCE FRESH', 'MORE MEGASTORE', 'SPAR', 'JIOMART'
-        ],
-        'Transport': [
-            'UBER', 'OLA', 'RAPIDO', 'METRO', 'IRCTC', 'BUS', 'PETROL', 
-            'FUEL', 'TRAIN', 'FLIGHT', 'AIRLINE', 'MAKEMYTRIP', 'GOIBIBO',
-            'CAB', 'TAXI', 'AUTO', 'INDIAN OIL', 'HP PETROL', 'BHARAT PETROLEUM',
-            'FASTAG', 'PARKING', 'TOLL'
-        ],
-        'Shopping': [
-            'AMAZON', 'FLIPKART', 'MYNTRA', 'AJIO', 'MEESHO', 'MALL',
-            'SHOP', 'STORE', 'RETAIL', 'NYKAA', 'LENSKART', 'CROMA',
-            'LIFESTYLE', 'WESTSIDE', 'PANTALOONS', 'MAX FASHION',
-            'DECATHLON', 'NIKE', 'ADIDAS'
-        ],
-        'Entertainment': [
-            'NETFLIX', 'PRIME', 'HOTSTAR', 'BOOKMYSHOW', 'PVR', 'INOX',
-            'SPOTIFY', 'YOUTUBE', 'CINEMA', 'MOVIE', 'GAME', 'GAMING',
-            'PLAY STORE', 'APP STORE', 'STEAM', 'XBOX', 'PLAYSTATION'
-        ],
-        'Bills & Utilities': [
-            'ELECTRICITY', 'WATER', 'GAS', 'BROADBAND', 'MOBILE', 'RECHARGE',
-            'AIRTEL', 'JIO', 'VODAFONE', 'BILL', 'TATA POWER', 'BSNL',
-            'ACT FIBERNET', 'HATHWAY', 'DTH', 'DISH TV'
-        ],
-        'Health': [
-            'PHARMACY', 'MEDICINE', 'APOLLO', 'MEDPLUS', 'HOSPITAL',
-            'DOCTOR', 'CLINIC', 'HEALTH', 'MEDICAL', '1MG', 'PHARMEASY',
-            'NETMEDS', 'DIAGNOSTIC', 'LAB TEST', 'PRACTO'
-        ],
-        'Investment': [
-            'GROWW', 'ZERODHA', 'ANGEL ONE', 'UPSTOX', 'SIP', 'MUTUAL FUND',
-            'STOCKS', 'KUVERA', 'COIN', 'SMALLCASE', 'ETF'
-        ],
-        'Education': [
-            'UDEMY', 'COURSERA', 'UNACADEMY', 'BYJU', 'SCHOOL', 'COLLEGE',
-            'TUITION', 'COURSE', 'BOOK', 'EXAM FEE'
-        ]
-    }
-    
-    total_categorized = 0
-    family_categorized = 0
-    rent_categorized = 0
-    
-    # 1. Family Transfer Detection (Fuzzy match)
-    if family_members:
-        for member in family_members:
-            member_upper = member.upper().strip()
-            
-            # Fuzzy search: match if ANY word from member name appears
-            name_parts = member_upper.split()
-            
-            for name_part in name_parts:
-                if len(name_part) >= 3:  # Skip very short words like "MR", "MS"
-                    cur.execute("""
-                        UPDATE bank_transactions
-                        SET category = 'Family Transfer'
-                        WHERE upload_session_id = %s
-                          AND user_id = %s
-                          AND (category IS NULL OR category = 'Uncategorized')
-                          AND status != 'TRANSFER'
-                          AND UPPER(description) LIKE %s
-                    """, (session_id, user_id, f'%{name_part}%'))
-                    
-                    count = cur.rowcount
-                    if count > 0:
-                        family_categorized += count
-                        print(f"   ✅ {count} → 'Family Transfer' (matched: {name_part})")
-                    
-                    conn.commit()
-    
-    # 2. Rent Detection (Amount-based with tolerance)
-    if monthly_rent and monthly_rent > 0:
-        tolerance = monthly_rent * 0.05  # ±5% tolerance
+    with profile.stage('load'):
+        fill_merchant_keys(cur, session_id, user_id)
         
         cur.execute("""
-            UPDATE bank_transactions
-            SET category = 'Rent'
+            SELECT user_config FROM upload_sessions WHERE id = %s
+        """, (session_id,))
+        
+        result = cur.fetchone()
+        user_config = {}
+        
+        if result and result[0]:
+            user_config = result[0]  # ✅ FIXED - Already a dict from JSONB
+        
+        family_members = user_config.get('family_members', [])
+        monthly_rent = user_config.get('monthly_rent')
+        
+        print(f"\n🎯 User Config: Family={family_members}, Rent={monthly_rent}")
+        
+        family_matcher = compile_family_matcher(family_members)
+        
+        # Single pass over the remaining rows in BANK_STAGES order
+        cur.execute("""
+            SELECT id, description, amount, merchant_key
+            FROM bank_transactions
             WHERE upload_session_id = %s
               AND user_id = %s
               AND (category IS NULL OR category = 'Uncategorized')
               AND status != 'TRANSFER'
-              AND amount < 0
-              AND ABS(ABS(amount) - %s) <= %s
-        """, (session_id, user_id, monthly_rent, tolerance))
-        
-        rent_categorized = cur.rowcount
-        if rent_categorized > 0:
-            print(f"   ✅ {rent_categorized} → 'Rent' (amount ≈ ₹{monthly_rent:,.0f})")
+        """, (session_id, user_id))
         
-        conn.commit()
-    
-    # 3. Keyword-based categorization
-    for category, keywords in CATEGORY_KEYWORDS.items():
-        for keyword in keywords:
-            cur.execute("""
-                UPDATE bank_transactions
-                SET category = %s
-                WHERE upload_session_id = %s
-                  AND user_id = %s
-                  AND (category IS NULL OR category = 'Uncategorized')
-                  AND status != 'TRANSFER'
-                  AND UPPER(description) LIKE %s
-            """, (category, session_id, user_id, f'%{keyword}%'))
-            
-            count = cur.rowcount
-            if count > 0:
-                total_categorized += count
-                print(f"   ✅ {count} → '{category}' (keyword: {keyword})")
+        rows = cur.fetchall()
+    
+    # Merchants categorized in earlier sessions (one indexed lookup)
+    with profile.stage('merchant_memory') as stage:
+        memory = load_merchant_memory(cur, user_id, [row[3] for row in rows])
+        stage['rows_scanned'] = len(rows)
+    
+    # Confident ML predictions beat keywords; computed for the whole batch at once
+    with profile.stage('ml_predict') as stage:
+        predictions = predict_categories(user_id, [row[1] for row in rows]) or [(None, 0.0)] * len(rows)
+        stage['rows_scanned'] = len(rows)
+    threshold = Config.ML_CONFIDENCE_THRESHOLD
+    classifier = BankRowClassifier(family_matcher, rent_band(monthly_rent), memory, threshold)
+    
+    assignments = []
+    learned = []
+    stage_counts = Counter()
+    family_hits = Counter()
+    keyword_hits = Counter()
+    
+    with profile.stage('match') as stage:
+        for (txn_id, description, amount, key), prediction in zip(rows, predictions):
+            decided_by, category, hit = classifier.classify(description, amount, key, prediction)
+            stage_counts[decided_by] += 1
+            assignments.append((txn_id, category))
             
-            conn.commit()
-    
-    # 4. Set remaining as 'Other'
-    cur.execute("""
-        UPDATE bank_transactions
-        SET category = 'Other'
-        WHERE upload_session_id = %s
-          AND user_id = %s
-          AND (category IS NULL OR category = 'Uncategorized')
-          AND status != 'TRANSFER'
-    """, (session_id, user_id))
-
-    other_count = cur.rowcount
+            if decided_by == 'family':
+                family_hits[hit] += 1
+            elif decided_by == 'keywords':
+                keyword_hits[hit] += 1
+                learned.append((learnable_key(description, hit[0]), hit[1]))
+        
+        stage.update(
+            rows_scanned=len(rows),
+            **{name: stage_counts[name] for name in BANK_STAGES}
+        )
+    
+    family_categorized = stage_counts['family']
+    rent_categorized = stage_counts['rent']
+    memory_categorized = stage_counts['merchant_memory']
+    ml_count = stage_counts['ml']
+    other_count = stage_counts['other']
+    for name_part, count in family_hits.items():
+        print(f"   ✅ {count} → 'Family Transfer' (matched: {name_part})")
+    if rent_categorized > 0:
+        print(f"   ✅ {rent_categorized} → 'Rent' (amount ≈ ₹{monthly_rent:,.0f})")
+    if memory_categorized > 0:
+        print(f"   🧠 {memory_categorized} → merchant memory (past sessions)")
+    if ml_count > 0:
+        print(f"   🤖 {ml_count} → ML categorizer (confidence ≥ {threshold:.0%})")
+    for (keyword, category), count in keyword_hits.items():
+        print(f"   ✅ {count} → '{category}' (keyword: {keyword})")
     if other_count > 0:
         print(f"   ℹ️  {other_count} → 'Other' (no keyword match)")
-        total_categorized += other_count
     
-    conn.commit()
+    # One bulk update for every assignment
+    with profile.stage('write'):
+        total_categorized = write_categories(cur, 'bank_transactions', assignments)
+        
+        # Next session these merchants skip the keyword engine
+        learn_merchants(cur, user_id, learned)
+        conn.commit()
+    
+    # Fold this session's categories into the ML model off the request path
+    schedule_retrain(user_id)
     
     print(f"\n✅ Categorization Complete:")
     print(f"   Family: {family_categorized}")
     print(f"   Rent: {rent_categorized}")
-    print(f"   Keywords: {total_categorized - family_categorized - rent_categorized}")
+    print(f"   Memory: {memory_categorized}")
+    print(f"   ML: {ml_count}")
+    print(f"   Keywords: {sum(keyword_hits.values())}")
+    print(f"   Other: {other_count}")
     print(f"   Total: {total_categorized}")
     
     cur.close()
     conn.close()
     
-    return total_categorized
+    profile.print_summary()
+    profile.save()
+    
+    return {
+        'total': total_categorized,
+        'memory': memory_categorized,
+        'family': dict(family_hits),
+        'rent': rent_categorized,
+        'ml': ml_count,
+        'keywords': {f"{category}: {keyword}": count for (keyword, category), count in keyword_hits.items()},
+        'other': other_count
+    }
 
-def find_best_settlement_match(split_desc, bank_candidates):
+def find_best_settlement_match(split_desc, bank_candidates, scorer=None):
     """
     Pick best bank transaction when multiple candidates exist.
     """
-    names = ['daksh', 'rk', 'prathamesh', 'goyal']
+    scorer = scorer or SimilarityScorer(SETTLEMENT_PROFILE)
     
     best_match = None
     highest_score = -1
@@ -362,18 +454,8 @@ def find_best_settlement_match(split_desc, bank_candidates):
     for candidate in bank_candidates:
         bank_id, bank_date, bank_desc = candidate  # 3 columns = 3 variables ✓
         
-        split_lower = split_desc.lower()
-        bank_lower = bank_desc.lower()
-        
-        # Check name matches
-        score = 0
-        for name in names:
-            if name in split_lower and name in bank_lower:
-                score = 0.9
-                break
-        
-        if score == 0:
-            score = SequenceMatcher(None, split_lower, bank_lower).ratio()
+        # Shared friend name scores 0.9, otherwise edit-distance similarity
+        score = scorer.score(split_desc, bank_desc)
         
         if score > highest_score:
             highest_score = score
@@ -383,38 +465,53 @@ def find_best_settlement_match(split_desc, bank_candidates):
 
 def detect_other_transfers(user_id=1, session_id=None):
     """Detect non-spending transactions like investments, CC payments"""
+    profile = CategorizationProfile('detect_transfers', session_id, user_id)
     conn = get_db_connection()
     cur = conn.cursor()
     
     print("\n💳 Detecting Other Non-Spending Transactions...")
     
-    transfer_patterns = {
-        'Investment': ['ZERODHA', 'GROWW', 'UPSTOX', 'KUVERA', 'COIN', 'SMALLCASE'],
-        'Credit Card': ['CREDIT CARD', 'CC PAYMENT', 'CRED', 'CARD BILL'],
-        'Savings': ['TO SAVINGS', 'FIXED DEPOSIT', 'FD ', 'RD '],
-        'Self Transfer': ['SELF TRANSFER', 'OWN ACCOUNT']
-    }
+    # Patterns live in transfer_patterns (global defaults + the user's own)
+    with profile.stage('load_patterns') as stage:
+        matcher = get_transfer_matcher(cur, user_id)
+        stage['patterns'] = len(matcher.keywords)
     
-    transfers_found = 0
+    # One pass over the session's UNLINKED rows; first matching pattern wins
+    with profile.stage('load'):
+        cur.execute("""
+            SELECT id, description
+            FROM bank_transactions
+            WHERE upload_session_id = %s
+              AND user_id = %s
+              AND status = 'UNLINKED'
+        """, (session_id, user_id))
+        rows = cur.fetchall()
     
-    for transfer_type, keywords in transfer_patterns.items():
-        for keyword in keywords:
-            cur.execute("""
-                UPDATE bank_transactions
-                SET category = %s, status = 'TRANSFER'
-                WHERE user_id = %s
-                  AND UPPER(description) LIKE %s
-                  AND status = 'UNLINKED'
-                  AND upload_session_id = %s
-            """, (transfer_type, user_id, f'%{keyword}%', session_id))
-            
-            count = cur.rowcount
-            if count > 0:
-                transfers_found += count
-                print(f"   ✓ Marked {count} as '{transfer_type}' (keyword: {keyword})")
-            
+    assignments = []
+    pattern_hits = Counter()
+    
+    with profile.stage('match') as stage:
+        for txn_id, description in rows:
+            hit = matcher.match_keyword(description)
+            if hit:
+                pattern_hits[hit] += 1
+                assignments.append((txn_id, hit[1]))
+        stage.update(rows_scanned=len(rows), matched=len(assignments))
+    
+    transfers_found = 0
+    if assignments:
+        with profile.stage('mark'):
+            execute_values(cur, MARK_TRANSFERS_SQL, assignments,
+                           template="(%s::integer, %s::text)", page_size=len(assignments))
+            transfers_found = cur.rowcount
             conn.commit()
     
+    # Same order as the patterns: type, then keyword
+    for keyword, transfer_type in zip(matcher.keywords, matcher.values):
+        count = pattern_hits.pop((keyword, transfer_type), 0)
+        if count > 0:
+            print(f"   ✓ Marked {count} as '{transfer_type}' (keyword: {keyword})")
+    
     if transfers_found == 0:
         print("   ℹ️  No investment/transfer patterns detected")
     
@@ -423,6 +520,9 @@ def detect_other_transfers(user_id=1, session_id=None):
     cur.close()
     conn.close()
     
+    profile.print_summary()
+    profile.save()
+    
     return transfers_found
 
 if __name__ == "__main__":
@@ -0,0 +1,153 @@
+"""
+Categorization Profiler
+Per-stage wall time, DB time, statement count and rows read/written for
+auto_categorize_bank_transactions and detect_other_transfers, stored per
+session in categorization_profiles so a change can be checked against the
+runs before it
+
+Statement and row counts come from track_queries (InstrumentedCursor), so
+stages that open their own connections are counted too. Stages that share
+one in-memory pass report their per-rule hits in `detail`.
+"""
+import json
+import uuid
+from contextlib import contextmanager
+from psycopg2.extras import execute_values
+from app.config import Config
+from app.database.connection import get_db_connection
+from app.database.instrumentation import track_queries
+
+
+class CategorizationProfile:
+    """Stages of one pipeline run, in execution order"""
+
+    def __init__(self, pipeline, session_id, user_id=1):
+        self.pipeline = pipeline
+        self.session_id = session_id
+        self.user_id = user_id
+        self.run_id = f"prof_{uuid.uuid4().hex[:12]}"
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Profile the block as one stage; yields a dict for stage-specific
+        counts (rows scanned by an in-memory pass, per-rule hits)
+        """
+        detail = {}
+        with track_queries(f"{self.pipeline}:{name}") as stats:
+            yield detail
+
+        self.stages.append({
+            'stage': name,
+            'wall_ms': round(stats.wall_time * 1000, 2),
+            'db_ms': round(stats.db_time * 1000, 2),
+            'statements': stats.query_count,
+            'rows_scanned': detail.pop('rows_scanned', stats.rows_read),
+            'rows_updated': detail.pop('rows_updated', stats.rows_written),
+            'detail': detail
+        })
+
+    @property
+    def wall_ms(self):
+        return round(sum(s['wall_ms'] for s in self.stages), 2)
+
+    def print_summary(self):
+        print(f"\n⏱️  {self.pipeline}: {self.wall_ms:.1f}ms")
+        for s in self.stages:
+            print(f"   {s['stage']:16} {s['wall_ms']:>8.1f}ms | {s['statements']:>3} stmts | "
+                  f"{s['rows_scanned']:>6} scanned | {s['rows_updated']:>6} updated")
+
+    def save(self):
+        """Persist the run (no-op when Config.PROFILE_CATEGORIZATION is off)"""
+        if not Config.PROFILE_CATEGORIZATION or not self.stages:
+            return None
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        # Diagnostics only: a failed insert must not fail categorization
+        try:
+            execute_values(cur, """
+                INSERT INTO categorization_profiles
+                (run_id, session_id, user_id, pipeline, stage, stage_order,
+                 wall_ms, db_ms, statements, rows_scanned, rows_updated, detail)
+                VALUES %s
+            """, [
+                (
+                    self.run_id, self.session_id, self.user_id, self.pipeline, s['stage'], i,
+                    s['wall_ms'], s['db_ms'], s['statements'], s['rows_scanned'], s['rows_updated'],
+                    json.dumps(s['detail'])
+                )
+                for i, s in enumerate(self.stages)
+            ])
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"⚠️ Could not save {self.pipeline} profile: {e}")
+            return None
+        finally:
+            cur.close()
+            conn.close()
+
+        return self.run_id
+
+
+def get_profiles(session_id, pipeline=None, runs=5):
+    """
+    The session's latest profiled runs, newest first, each with its stages
+
+    pipeline: 'auto_categorize' or 'detect_transfers' (default: both)
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        WITH latest AS (
+            SELECT run_id, MAX(created_at) AS created_at
+            FROM categorization_profiles
+            WHERE session_id = %s
+              AND (%s IS NULL OR pipeline = %s)
+            GROUP BY run_id
+            ORDER BY MAX(created_at) DESC
+            LIMIT %s
+        )
+        SELECT p.run_id, p.pipeline, p.user_id, p.stage, p.wall_ms, p.db_ms,
+               p.statements, p.rows_scanned, p.rows_updated, p.detail, l.created_at
+        FROM categorization_profiles p
+        JOIN latest l ON l.run_id = p.run_id
+        ORDER BY l.created_at DESC, p.run_id, p.stage_order
+    """, (session_id, pipeline, pipeline, runs))
+
+    profiles = []
+    by_run = {}
+    for row in cur.fetchall():
+        run = by_run.get(row[0])
+        if run is None:
+            run = by_run[row[0]] = {
+                'run_id': row[0],
+                'pipeline': row[1],
+                'user_id': row[2],
+                'created_at': row[10].isoformat() if row[10] else None,
+                'wall_ms': 0.0,
+                'statements': 0,
+                'stages': []
+            }
+            profiles.append(run)
+
+        run['wall_ms'] = round(run['wall_ms'] + row[4], 2)
+        run['statements'] += row[6]
+        run['stages'].append({
+            'stage': row[3],
+            'wall_ms': row[4],
+            'db_ms': row[5],
+            'statements': row[6],
+            'rows_scanned': row[7],
+            'rows_updated': row[8],
+            'detail': row[9] or {}
+        })
+
+    cur.close()
+    conn.close()
+
+    return profiles
@@ -3,6 +3,8 @@ User Categorization Rules Service
 Allows users to create and apply custom categorization rules
 """
 from app.database.connection import get_db_connection
+from app.database.text_search import description_contains, contains_pattern
+from app.services.rule_engine import get_compiled_rules, invalidate_rules
 import re
 
 def extract_merchant_pattern(description):
@@ -48,23 +50,23 @@ def count_similar_transactions(session_id, source, pattern, current_txn_id, user
     cur = conn.cursor()
     
     if source == 'BANK':
-        cur.execute("""
+        cur.execute(f"""
             SELECT COUNT(*)
             FROM bank_transactions
             WHERE upload_session_id = %s
               AND user_id = %s
               AND id != %s
-              AND UPPER(description) LIKE %s
-        """, (session_id, user_id, current_txn_id, f'%{pattern}%'))
+              AND {description_contains()}
+        """, (session_id, user_id, current_txn_id, contains_pattern(pattern)))
     else:
-        cur.execute("""
+        cur.execute(f"""
             SELECT COUNT(*)
             FROM splitwise_transactions
             WHERE upload_session_id = %s
               AND user_id = %s
               AND id != %s
-              AND UPPER(description) LIKE %s
-        """, (session_id, user_id, current_txn_id, f'%{pattern}%'))
+              AND {description_contains()}
+        """, (session_id, user_id, current_txn_id, contains_pattern(pattern)))
     
     count = cur.fetchone()[0]
     cur.close()
@@ -73,6 +75,67 @@ def count_similar_transactions(session_id, source, pattern, current_txn_id, user
     return count
 
 
+def count_similar_batch(session_id, source, transaction_ids, user_id=1):
+    """
+    count_similar_transactions for many transactions at once
+
+    One query for the descriptions, one grouped query for the counts: every
+    distinct merchant pattern is counted once over the session's rows, and
+    the requested rows each pattern matched are returned with it so every
+    transaction can exclude itself.
+
+    Returns {transaction_id: (pattern, count)}; unknown ids are left out.
+    """
+    table = 'bank_transactions' if source == 'BANK' else 'splitwise_transactions'
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute(f"""
+        SELECT id, description
+        FROM {table}
+        WHERE upload_session_id = %s
+          AND user_id = %s
+          AND id = ANY(%s)
+    """, (session_id, user_id, list(transaction_ids)))
+
+    patterns = {txn_id: extract_merchant_pattern(description) for txn_id, description in cur.fetchall()}
+    distinct = sorted({pattern for pattern in patterns.values() if pattern})
+
+    counts = {}
+    if distinct:
+        # Same UPPER(description) LIKE '%X%' shape as description_contains(),
+        # with the pattern taken from the joined list instead of a parameter
+        cur.execute(f"""
+            SELECT p.pattern,
+                   COUNT(t.id),
+                   ARRAY_AGG(t.id) FILTER (WHERE t.id = ANY(%s))
+            FROM unnest(%s::text[], %s::text[]) AS p(pattern, like_pattern)
+            JOIN {table} t
+              ON t.upload_session_id = %s
+             AND t.user_id = %s
+             AND UPPER(t.description) LIKE p.like_pattern
+            GROUP BY p.pattern
+        """, (
+            list(patterns), distinct, [contains_pattern(p) for p in distinct],
+            session_id, user_id
+        ))
+        counts = {pattern: (count, set(matched or [])) for pattern, count, matched in cur.fetchall()}
+
+    cur.close()
+    conn.close()
+
+    result = {}
+    for txn_id, pattern in patterns.items():
+        if not pattern:
+            result[txn_id] = (None, 0)
+            continue
+        count, matched = counts.get(pattern, (0, set()))
+        result[txn_id] = (pattern, count - (1 if txn_id in matched else 0))
+
+    return result
+
+
 def save_categorization_rule(user_id, pattern, category, match_type='contains', source='BOTH'):
     """
     Save user categorization rule to database
@@ -107,6 +170,9 @@ def save_categorization_rule(user_id, pattern, category, match_type='contains',
     cur.close()
     conn.close()
     
+    # Compiled rules for this user are stale now
+    invalidate_rules(user_id)
+    
     return True
 
 
@@ -119,23 +185,23 @@ def apply_rule_to_similar(session_id, source, pattern, category, current_txn_id,
     cur = conn.cursor()
     
     if source == 'BANK':
-        cur.execute("""
+        cur.execute(f"""
             UPDATE bank_transactions
             SET category = %s
             WHERE upload_session_id = %s
               AND user_id = %s
               AND id != %s
-              AND UPPER(description) LIKE %s
-        """, (category, session_id, user_id, current_txn_id, f'%{pattern}%'))
+              AND {description_contains()}
+        """, (category, session_id, user_id, current_txn_id, contains_pattern(pattern)))
     else:
-        cur.execute("""
+        cur.execute(f"""
             UPDATE splitwise_transactions
             SET category = %s
             WHERE upload_session_id = %s
               AND user_id = %s
               AND id != %s
-              AND UPPER(description) LIKE %s
-        """, (category, session_id, user_id, current_txn_id, f'%{pattern}%'))
+              AND {description_contains()}
+        """, (category, session_id, user_id, current_txn_id, contains_pattern(pattern)))
     
     count = cur.rowcount
     conn.commit()
@@ -181,34 +247,7 @@ def apply_user_rules_to_transaction(description, source, user_id=1):
     Check if any user rule matches this transaction
     Returns category if matched, None otherwise
     
-    Called during upload processing (in categorization.py)
+    Uses the user's compiled (cached) rules; for whole sessions use
+    rule_engine.classify_session instead of calling this per row
     """
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # Get rules for this source
-    cur.execute("""
-        SELECT pattern, category, match_type
-        FROM user_categorization_rules
-        WHERE user_id = %s
-          AND (source = %s OR source = 'BOTH')
-        ORDER BY created_at DESC
-    """, (user_id, source))
-    
-    rules = cur.fetchall()
-    cur.close()
-    conn.close()
-    
-    # Check each rule
-    for pattern, category, match_type in rules:
-        if match_type == 'contains':
-            if pattern.upper() in description.upper():
-                return category
-        elif match_type == 'exact':
-            if description.upper() == pattern.upper():
-                return category
-        elif match_type == 'starts_with':
-            if description.upper().startswith(pattern.upper()):
-                return category
-    
-    return None
\ No newline at end of file
+    return get_compiled_rules(user_id, source).classify(description)
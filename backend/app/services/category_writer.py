@@ -0,0 +1,33 @@
+"""
+Category Writer
+Writes many category assignments with one UPDATE ... FROM (VALUES ...)
+"""
+from psycopg2.extras import execute_values
+
+UPDATE_CATEGORY_SQL = """
+    UPDATE {table} t
+    SET category = v.category
+    FROM (VALUES %s) AS v (id, category)
+    WHERE t.id = v.id
+"""
+
+VALUES_TEMPLATE = "(%s::integer, %s::text)"
+
+TABLES = ('bank_transactions', 'splitwise_transactions')
+
+
+def write_categories(cur, table, assignments):
+    """
+    assignments: [(row_id, category)]. Does not commit.
+    Returns the number of rows updated.
+    """
+    if table not in TABLES:
+        raise ValueError(f"Unknown transactions table: {table}")
+    if not assignments:
+        return 0
+
+    execute_values(
+        cur, UPDATE_CATEGORY_SQL.format(table=table), assignments,
+        template=VALUES_TEMPLATE, page_size=len(assignments)
+    )
+    return cur.rowcount
@@ -0,0 +1,93 @@
+"""
+Ingest Categorizer
+Gives bank rows their category in the consumer's INSERT instead of
+rewriting them after the upload
+
+User rules, then categorization.BANK_STAGES without 'ml' and the 'Other'
+sweep (see ingest_stages()). Rows none of them decide stay 'Uncategorized'
+for auto_categorize_bank_transactions, which runs the full stage list.
+
+Rules and merchant memory are loaded fresh for every upload session rather
+than shared through a TTL cache: rules saved or corrections made in the API
+process since the last upload apply to the next one immediately.
+"""
+from app.services.categorization import BANK_STAGES, BankRowClassifier, compile_family_matcher, rent_band
+from app.services.merchant_memory import merchant_key, learnable_key, learn_merchants
+from app.services.rule_engine import CompiledRules, load_rules
+
+UNCATEGORIZED = 'Uncategorized'
+MAX_CACHED_SESSIONS = 64
+
+
+# The model lives in the API process; 'Other' is left to the post-pass sweep
+INGEST_SKIPPED = ('ml', 'other')
+
+
+def ingest_stages():
+    """BANK_STAGES ingest decides: every stage but INGEST_SKIPPED"""
+    return tuple(stage for stage in BANK_STAGES if stage not in INGEST_SKIPPED)
+
+
+class IngestCategorizer:
+    """Per-consumer cache of everything an upload session's rows are categorized with"""
+
+    def __init__(self):
+        self._sessions = {}
+
+    def _session_context(self, cur, user_id, session_id):
+        """
+        (compiled rules, classifier) for the session, loaded on its first row
+
+        The classifier's merchant memory also collects what this session's
+        rows teach it.
+        """
+        context = self._sessions.get(session_id)
+        if context is None:
+            cur.execute("SELECT user_config FROM upload_sessions WHERE id = %s", (session_id,))
+            row = cur.fetchone()
+            user_config = (row[0] if row else None) or {}
+
+            cur.execute("""
+                SELECT merchant_key, category
+                FROM merchant_category_memory
+                WHERE user_id = %s
+            """, (user_id,))
+            memory = dict(cur.fetchall())
+
+            context = (
+                CompiledRules(load_rules(user_id, 'BANK')),
+                BankRowClassifier(
+                    compile_family_matcher(user_config.get('family_members', [])),
+                    rent_band(user_config.get('monthly_rent')),
+                    memory
+                )
+            )
+
+            if len(self._sessions) >= MAX_CACHED_SESSIONS:
+                self._sessions.clear()
+            self._sessions[session_id] = context
+
+        return context
+
+    def categorize(self, cur, user_id, session_id, description, amount, key=None):
+        """
+        Category for a new bank row, or 'Uncategorized' to leave it to the post-pass
+
+        Keyword results are learned into merchant memory on `cur` (same
+        transaction as the INSERT).
+        """
+        rules, classifier = self._session_context(cur, user_id, session_id)
+
+        category = rules.classify(description)
+        if category:
+            return category
+
+        key = key or merchant_key(description)
+        stage, category, hit = classifier.classify(description, amount, key, stages=ingest_stages())
+        if category is None:
+            return UNCATEGORIZED
+
+        if stage == 'keywords':
+            classifier.memory.update(learn_merchants(cur, user_id, [(learnable_key(description, hit[0]), hit[1])]))
+
+        return category
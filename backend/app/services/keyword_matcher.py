@@ -0,0 +1,88 @@
+"""
+Keyword Matcher
+Aho-Corasick automaton over upper-cased keywords: one pass over a
+description finds every keyword it contains, and the keyword with the
+highest priority (lowest position in the list) wins
+"""
+
+
+class KeywordMatcher:
+    """
+    keywords: [(keyword, value)] in priority order. match() behaves like
+    trying `UPPER(description) LIKE '%KEYWORD%'` for each keyword in turn
+    and taking the first hit, but scans the text only once.
+    """
+
+    def __init__(self, keywords):
+        self.values = [value for _, value in keywords]
+        self.keywords = [keyword.upper() for keyword, _ in keywords]
+
+        # Node 0 is the root; best[node] = highest-priority keyword ending here
+        self._goto = [{}]
+        self._fail = [0]
+        self._best = [None]
+
+        for priority, keyword in enumerate(self.keywords):
+            node = 0
+            for char in keyword:
+                nxt = self._goto[node].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._best.append(None)
+                node = nxt
+            if self._best[node] is None:
+                self._best[node] = priority
+
+        self._build_failure_links()
+
+    def _build_failure_links(self):
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for char, child in self._goto[node].items():
+                queue.append(child)
+
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+
+                # A node also matches every keyword that ends at its failure node
+                inherited = self._best[self._fail[child]]
+                if inherited is not None and (self._best[child] is None or inherited < self._best[child]):
+                    self._best[child] = inherited
+
+    @classmethod
+    def from_groups(cls, groups):
+        """{value: [keyword, ...]} in priority order (dict order, then list order)"""
+        return cls([(keyword, value) for value, keywords in groups.items() for keyword in keywords])
+
+    def match_keyword(self, text):
+        """(keyword, value) of the highest-priority keyword in text, or None"""
+        if not text:
+            return None
+
+        goto, fail, best = self._goto, self._fail, self._best
+        node, found = 0, None
+
+        for char in text.upper():
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+
+            priority = best[node]
+            if priority is not None and (found is None or priority < found):
+                found = priority
+                if found == 0:
+                    break
+
+        if found is None:
+            return None
+        return self.keywords[found], self.values[found]
+
+    def match(self, text):
+        """Value of the highest-priority keyword in text, or None"""
+        hit = self.match_keyword(text)
+        return hit[1] if hit else None
@@ -0,0 +1,223 @@
+"""
+Assignment Linker
+Globally optimal alternative to the greedy three-pass linker
+
+Builds a sparse bipartite graph between Splitwise PAYER rows and unlinked
+bank rows (an edge only where some pass would accept the pair), splits it
+into connected components - in practice one per amount cluster - and solves
+each component as a minimum-cost assignment.
+
+Edges follow the greedy acceptance rules, including Pass 3's: a ±1 day
+"blind trust" edge only exists when it is the Splitwise row's only
+candidate within ±1 day, so ambiguous rows stay unlinked in both modes.
+"""
+from app.services.similarity import SimilarityScorer, LINKER_PROFILE
+from app.services.linker_trace import traced_pass
+
+# Cost of leaving a Splitwise row unlinked (edge cost is 1 - confidence)
+UNMATCHED_COST = 1.0
+NO_EDGE = float("inf")
+
+# Tie-breakers between otherwise equal edges (never change the recorded confidence)
+AMOUNT_PENALTY = 0.01   # per rupee of amount difference
+DAY_PENALTY = 0.001     # per day of date difference
+
+
+def score_pair(s_date, b_date, similarity, same_day_count, near_count=1):
+    """
+    Confidence and method for one candidate pair, or None if no pass accepts it
+
+    Mirrors the greedy tiers: same day, ±2 days with description >= 0.3,
+    ±1 day with description > 0.15 when the pair is the only candidate
+    within ±1 day (near_count).
+    """
+    days = abs((b_date - s_date).days)
+
+    if days == 0:
+        if same_day_count == 1:
+            return 1.00, "Assignment: Exact Match"
+        return 0.90 + (similarity * 0.10), "Assignment: Tie-Break"
+
+    if days <= 2 and similarity >= 0.3:
+        return 0.70 + (similarity * 0.15), "Assignment: Fuzzy Date"
+
+    if days <= 1 and similarity > 0.15 and near_count == 1:
+        return 0.60 + (similarity * 0.15), "Assignment: Blind Trust"
+
+    return None
+
+
+def build_graph(splitwise_txns, index, scorer, pass_trace=None):
+    """
+    Sparse edges {(split_id, bank_id): (cost, confidence, method)}
+
+    Candidates come from the same BankCandidateIndex as the greedy linker
+    (±1.00 amount, ±2 days).
+    """
+    edges = {}
+
+    for s_id, s_date, s_total, s_desc in splitwise_txns:
+        candidates = index.candidates(s_total, s_date, days=2)
+        same_day_count = sum(1 for c in candidates if c[1] == s_date)
+        near_count = sum(1 for c in candidates if abs((c[1] - s_date).days) <= 1)
+        if pass_trace:
+            pass_trace.row(len(candidates))
+
+        for b_id, b_date, b_desc in candidates:
+            similarity = scorer.score(b_desc, s_desc)
+            scored = score_pair(s_date, b_date, similarity, same_day_count, near_count)
+            if scored is None:
+                if pass_trace:
+                    pass_trace.reject(s_id, b_id, similarity, "no tier accepts date/description")
+                continue
+
+            confidence, method = scored
+            cost = (
+                (1.0 - confidence)
+                + index.amount_gap(b_id, s_total) * AMOUNT_PENALTY
+                + abs((b_date - s_date).days) * DAY_PENALTY
+            )
+            edges[(s_id, b_id)] = (cost, confidence, method)
+
+    return edges
+
+
+def connected_components(edges):
+    """Group edges into components: [(split_ids, bank_ids)], each list sorted"""
+    parent = {}
+
+    def find(node):
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for s_id, b_id in edges:
+        s_node, b_node = ('s', s_id), ('b', b_id)
+        parent.setdefault(s_node, s_node)
+        parent.setdefault(b_node, b_node)
+        root_s, root_b = find(s_node), find(b_node)
+        if root_s != root_b:
+            parent[root_b] = root_s
+
+    groups = {}
+    for node in parent:
+        splits, banks = groups.setdefault(find(node), ([], []))
+        (splits if node[0] == 's' else banks).append(node[1])
+
+    return [(sorted(splits), sorted(banks)) for splits, banks in groups.values()]
+
+
+def solve_assignment(cost):
+    """
+    Minimum-cost assignment (Hungarian algorithm, O(n²m))
+
+    cost: n x m matrix with n <= m. Returns assigned column for each row.
+    """
+    n = len(cost)
+    m = len(cost[0]) if n else 0
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    p = [0] * (m + 1)      # p[j]: row assigned to column j (1-based, 0 = free)
+    way = [0] * (m + 1)
+
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [NO_EDGE] * (m + 1)
+        used = [False] * (m + 1)
+
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            delta = NO_EDGE
+            j1 = 0
+            row = cost[i0 - 1]
+
+            for j in range(1, m + 1):
+                if used[j]:
+                    continue
+                cur = row[j - 1] - u[i0] - v[j]
+                if cur < minv[j]:
+                    minv[j] = cur
+                    way[j] = j0
+                if minv[j] < delta:
+                    delta = minv[j]
+                    j1 = j
+
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+
+            j0 = j1
+            if p[j0] == 0:
+                break
+
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    assignment = [None] * n
+    for j in range(1, m + 1):
+        if p[j]:
+            assignment[p[j] - 1] = j - 1
+    return assignment
+
+
+def plan_assignment_links(splitwise_txns, index, verbose=True, scorer=None, trace=None):
+    """
+    Optimal counterpart of linker.plan_links()
+
+    Returns [(split_id, bank_id, confidence, method)], the same shape the
+    greedy planner returns.
+    """
+    with traced_pass(trace, "Assignment") as pass_trace:
+        links = _plan(splitwise_txns, index, verbose, scorer or SimilarityScorer(LINKER_PROFILE), pass_trace)
+    return links
+
+
+def _plan(splitwise_txns, index, verbose, scorer, pass_trace):
+    edges = build_graph(splitwise_txns, index, scorer, pass_trace)
+    components = connected_components(edges)
+    links = []
+
+    if verbose:
+        print(f"\n🚀 Assignment: {len(edges)} candidate pairs in {len(components)} clusters")
+
+    for split_ids, bank_ids in components:
+        # One private "unmatched" column per Splitwise row keeps every row assignable
+        cost = []
+        for r, s_id in enumerate(split_ids):
+            row = [edges[(s_id, b_id)][0] if (s_id, b_id) in edges else NO_EDGE for b_id in bank_ids]
+            row.extend(UNMATCHED_COST if k == r else NO_EDGE for k in range(len(split_ids)))
+            cost.append(row)
+
+        for s_id, col in zip(split_ids, solve_assignment(cost)):
+            chosen = bank_ids[col] if col is not None and col < len(bank_ids) else None
+
+            if pass_trace:
+                options = [(b_id, edges[(s_id, b_id)][1]) for b_id in bank_ids if (s_id, b_id) in edges]
+                for b_id, confidence in options:
+                    if b_id != chosen:
+                        pass_trace.reject(s_id, b_id, confidence, "lost in global assignment")
+                if chosen is not None and len(options) > 1:
+                    pass_trace.tie_break(s_id, chosen, options)
+
+            if chosen is None:
+                continue
+
+            b_id = chosen
+            _, confidence, method = edges[(s_id, b_id)]
+            index.claim(b_id)
+            links.append((s_id, b_id, confidence, method))
+            if pass_trace:
+                pass_trace.link()
+
+            if verbose:
+                print(f"   🔗 LINKED! Split {s_id} <-> Bank {b_id} [{method}] ({confidence:.0%})")
+
+    return links
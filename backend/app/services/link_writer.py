@@ -0,0 +1,209 @@
+"""
+Link Writer
+Buffers Splitwise <-> bank link decisions and applies them set-based:
+one UPDATE ... FROM (VALUES ...) per table plus one INSERT into
+transaction_links, committed as one transaction
+
+Rows are only claimed while still UNLINKED. Another writer (backfill
+worker, relink, manual link) may claim a planned row between planning and
+flush; those decisions are dropped and the rest is written again (or, for
+all-or-nothing callers, a LinkConflictError names the rows)
+"""
+from psycopg2.extras import execute_values
+
+# NULL in a VALUES row means "leave the column as it is"
+UPDATE_SPLITWISE_SQL = """
+    UPDATE splitwise_transactions s
+    SET status = v.status,
+        linked_bank_id = v.bank_id,
+        match_confidence = COALESCE(v.confidence, s.match_confidence),
+        match_method = COALESCE(v.method, s.match_method),
+        category = COALESCE(v.category, s.category)
+    FROM (VALUES %s) AS v (split_id, bank_id, status, confidence, method, category)
+    WHERE s.id = v.split_id
+      AND s.status = 'UNLINKED'
+    RETURNING s.id
+"""
+
+UPDATE_BANK_SQL = """
+    UPDATE bank_transactions b
+    SET status = v.status,
+        linked_splitwise_id = v.split_id,
+        match_confidence = COALESCE(v.confidence, b.match_confidence),
+        match_method = COALESCE(v.method, b.match_method),
+        category = COALESCE(v.category, b.category)
+    FROM (VALUES %s) AS v (bank_id, split_id, status, confidence, method, category)
+    WHERE b.id = v.bank_id
+      AND b.status = 'UNLINKED'
+    RETURNING b.id
+"""
+
+VALUES_TEMPLATE = "(%s::integer, %s::integer, %s::text, %s::numeric, %s::text, %s::text)"
+
+# amount NULL = the link covers the whole Splitwise row (1:1)
+INSERT_LINKS_SQL = """
+    INSERT INTO transaction_links
+        (user_id, splitwise_id, bank_id, amount, match_confidence, match_method)
+    SELECT s.user_id, v.split_id, v.bank_id, v.amount, v.confidence, v.method
+    FROM (VALUES %s) AS v (split_id, bank_id, amount, confidence, method)
+    JOIN splitwise_transactions s ON s.id = v.split_id
+    ON CONFLICT (splitwise_id, bank_id) DO NOTHING
+"""
+
+LINK_VALUES_TEMPLATE = "(%s::integer, %s::integer, %s::numeric, %s::numeric, %s::text)"
+
+
+class LinkConflictError(ValueError):
+    """Planned rows were no longer UNLINKED at flush time"""
+
+    def __init__(self, split_ids, bank_ids):
+        self.split_ids = sorted(split_ids)
+        self.bank_ids = sorted(bank_ids)
+        super().__init__(
+            f"Already linked by another writer: Splitwise {self.split_ids}, Bank {self.bank_ids}"
+        )
+
+
+class LinkWriter:
+    """
+    Collects links during a run and writes them all in flush()
+
+    Callers that pick candidates from the database should skip rows already
+    claimed in this batch (see is_claimed) since buffered links are not yet
+    visible to their queries.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.conflicts = []
+        self._reset()
+
+    def _reset(self):
+        # One entry per decision: (split_rows, bank_rows, link_rows)
+        self._decisions = []
+        self._claimed_splitwise = set()
+        self._claimed_bank = set()
+
+    def __len__(self):
+        return len(self._decisions)
+
+    def _claim(self, split_ids, bank_ids):
+        taken = [s for s in split_ids if s in self._claimed_splitwise] + [b for b in bank_ids if b in self._claimed_bank]
+        if taken or len(set(split_ids)) != len(split_ids) or len(set(bank_ids)) != len(bank_ids):
+            raise ValueError(f"Splits {split_ids} / Banks {bank_ids} overlap links already in this batch")
+
+        self._claimed_splitwise.update(split_ids)
+        self._claimed_bank.update(bank_ids)
+
+    def link(self, split_id, bank_id, confidence=None, method=None,
+             split_status='LINKED', bank_status='LINKED',
+             split_category=None, bank_category=None):
+        """Buffer one 1:1 link; both rows point at each other once flushed"""
+        self._claim([split_id], [bank_id])
+
+        self._decisions.append((
+            [(split_id, bank_id, split_status, confidence, method, split_category)],
+            [(bank_id, split_id, bank_status, confidence, method, bank_category)],
+            [(split_id, bank_id, None, confidence, method)]
+        ))
+
+    def link_group(self, allocations, confidence=None, method=None):
+        """
+        Buffer a one-to-many link
+
+        allocations: [(split_id, bank_id, amount)] - every pair in the group
+        with the rupees of the bank payment attributed to that Splitwise row.
+        The legacy linked_* columns point at each row's largest counterpart.
+        """
+        split_ids = sorted({a[0] for a in allocations})
+        bank_ids = sorted({a[1] for a in allocations})
+        self._claim(split_ids, bank_ids)
+
+        def primary(key_index, other_index, key):
+            pairs = [a for a in allocations if a[key_index] == key]
+            return max(pairs, key=lambda a: (a[2], -a[other_index]))[other_index]
+
+        self._decisions.append((
+            [(split_id, primary(0, 1, split_id), 'LINKED', confidence, method, None) for split_id in split_ids],
+            [(bank_id, primary(1, 0, bank_id), 'LINKED', confidence, method, None) for bank_id in bank_ids],
+            [(split_id, bank_id, amount, confidence, method) for split_id, bank_id, amount in allocations]
+        ))
+
+    def is_claimed(self, bank_id=None, split_id=None):
+        return bank_id in self._claimed_bank or split_id in self._claimed_splitwise
+
+    def claimed_bank_ids(self):
+        return set(self._claimed_bank)
+
+    def _write(self, cur, decisions):
+        """
+        Apply decisions inside the open transaction
+
+        Returns (split_ids, bank_ids) that were no longer UNLINKED; both empty
+        means every row was claimed.
+        """
+        split_rows = [row for d in decisions for row in d[0]]
+        bank_rows = [row for d in decisions for row in d[1]]
+        link_rows = [row for d in decisions for row in d[2]]
+
+        updated_splits = execute_values(cur, UPDATE_SPLITWISE_SQL, split_rows,
+                                        template=VALUES_TEMPLATE, page_size=len(split_rows), fetch=True)
+        updated_banks = execute_values(cur, UPDATE_BANK_SQL, bank_rows,
+                                       template=VALUES_TEMPLATE, page_size=len(bank_rows), fetch=True)
+
+        if len(updated_splits) != len(split_rows) or len(updated_banks) != len(bank_rows):
+            return (
+                {row[0] for row in split_rows} - {row[0] for row in updated_splits},
+                {row[0] for row in bank_rows} - {row[0] for row in updated_banks}
+            )
+
+        execute_values(cur, INSERT_LINKS_SQL, link_rows,
+                       template=LINK_VALUES_TEMPLATE, page_size=len(link_rows))
+        return set(), set()
+
+    def flush(self, all_or_nothing=False):
+        """
+        Apply every buffered link in one transaction; returns link decisions written
+
+        Decisions touching rows another writer linked first are dropped and
+        recorded in self.conflicts, and the rest is written. With
+        all_or_nothing=True nothing is written and LinkConflictError is raised.
+        """
+        decisions = self._decisions
+        self.conflicts = []
+        if not decisions:
+            return 0
+
+        cur = self.conn.cursor()
+        try:
+            while decisions:
+                split_conflicts, bank_conflicts = self._write(cur, decisions)
+                if not split_conflicts and not bank_conflicts:
+                    self.conn.commit()
+                    break
+
+                if all_or_nothing:
+                    raise LinkConflictError(split_conflicts, bank_conflicts)
+                self.conn.rollback()
+
+                # Re-plan without the decisions that lost their rows
+                kept = []
+                for decision in decisions:
+                    if any(row[0] in split_conflicts for row in decision[0]) or \
+                            any(row[0] in bank_conflicts for row in decision[1]):
+                        self.conflicts.append(([row[0] for row in decision[0]], [row[0] for row in decision[1]]))
+                    else:
+                        kept.append(decision)
+                decisions = kept
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            cur.close()
+
+        for split_ids, bank_ids in self.conflicts:
+            print(f"   ⚠️ Skipped link Split {split_ids} <-> Bank {bank_ids}: already linked elsewhere")
+
+        self._reset()
+
+        return len(decisions)
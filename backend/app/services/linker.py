@@ -1,29 +1,29 @@
+import math
+from app.config import Config
 from app.database.connection import get_db_connection
-from difflib import SequenceMatcher
+from app.database.instrumentation import track_queries
+from app.services.link_writer import LinkWriter
+from app.services.similarity import SimilarityScorer, LINKER_PROFILE
+from app.services.linker_trace import LinkerTrace, DEFAULT_MAX_DETAILS, traced_pass, traced_sql
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
 
-def calculate_similarity(bank_desc, split_desc):
-    b_clean = bank_desc.lower()
-    for noise in ['upi', 'pos', 'txn', 'imps', 'neft', 'limited', 'private', 'ltd', 'pay for intent']:
-        b_clean = b_clean.replace(noise, '')
-    
-    s_clean = split_desc.lower()
-    b_tokens = set(b_clean.split())
-    s_tokens = set(s_clean.split())
-    
-    common = b_tokens.intersection(s_tokens)
-    if len(common) > 0:
-        return 0.85 + (0.05 * len(common)) 
-        
-    return SequenceMatcher(None, b_clean, s_clean).ratio()
+# Widest date window used by any pass (Pass 2: ±2 days)
+MAX_DATE_WINDOW = 2
+
+def calculate_similarity(bank_desc, split_desc, scorer=None):
+    """Linker similarity; pass the run's scorer to reuse its caches"""
+    return (scorer or SimilarityScorer(LINKER_PROFILE)).score(bank_desc, split_desc)
 
-def pick_best_candidate(s_desc, candidates, threshold=0.0, return_score=False):
+def pick_best_candidate(s_desc, candidates, threshold=0.0, return_score=False, scorer=None):
     """Pick best match with optional score return"""
     best_id = None
     highest_score = -1.0
     
     for c in candidates:
         c_id, c_date, c_desc = c
-        score = calculate_similarity(c_desc, s_desc)
+        score = calculate_similarity(c_desc, s_desc, scorer)
         
         if score > highest_score:
             highest_score = score
@@ -38,152 +38,362 @@ def pick_best_candidate(s_desc, candidates, threshold=0.0, return_score=False):
         return None, 0.0
     return None
 
-def link_transactions(cur, split_id, bank_id, method, confidence):
-    """Link two transactions with confidence tracking"""
-    cur.execute("""
-        UPDATE splitwise_transactions 
-        SET status = 'LINKED', 
-            linked_bank_id = %s,
-            match_confidence = %s,
-            match_method = %s
-        WHERE id = %s
-    """, (bank_id, confidence, method, split_id))
+def _as_decimal(value):
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+class BankCandidateIndex:
+    """
+    Unlinked bank transactions held in memory for one linker run
+
+    Rows are bucketed by (whole-rupee amount, date). A Splitwise amount only
+    matches bank amounts within ±1.00, so a lookup checks its own bucket and
+    the two neighbours for each day in the date window.
+    """
+
+    def __init__(self, bank_rows):
+        self._by_key = defaultdict(list)
+        self._amounts = {}
+        self._linked = set()
+
+        # Deterministic tie-breaks: candidates are always visited in id order
+        for b_id, b_date, b_amount, b_desc in sorted(bank_rows, key=lambda r: r[0]):
+            amount = abs(_as_decimal(b_amount))
+            self._by_key[(int(amount), b_date)].append((b_id, b_date, amount, b_desc))
+            self._amounts[b_id] = amount
+
+    def candidates(self, target_amount, target_date, days=0):
+        """Unclaimed rows with |amount| within 1.00 of target and date within ±days"""
+        target = _as_decimal(target_amount)
+        bucket = math.floor(target)
+        found = []
+
+        for offset in range(-days, days + 1):
+            day = target_date + timedelta(days=offset)
+            for b in (bucket - 1, bucket, bucket + 1):
+                for b_id, b_date, amount, b_desc in self._by_key.get((b, day), ()):
+                    if b_id not in self._linked and abs(amount - target) < 1:
+                        found.append((b_id, b_date, b_desc))
+
+        found.sort(key=lambda c: c[0])
+        return found
+
+    def amount_gap(self, bank_id, target_amount):
+        """Rupee difference between a bank row's |amount| and the target"""
+        return float(abs(self._amounts[bank_id] - _as_decimal(target_amount)))
+
+    def claim(self, bank_id):
+        self._linked.add(bank_id)
+
+def plan_links(splitwise_txns, index, verbose=True, scorer=None, trace=None):
+    """
+    Run the three matching passes in memory
+
+    splitwise_txns: (id, date, total_cost, description) rows, in date order
+    index: BankCandidateIndex over the user's unlinked bank rows
+    trace: optional LinkerTrace that records every decision (dry runs)
+    Returns [(split_id, bank_id, confidence, method)]
+    """
+    scorer = scorer or SimilarityScorer(LINKER_PROFILE)
+    links = []
+
+    def link(s_id, b_id, method, confidence, pass_trace):
+        index.claim(b_id)
+        links.append((s_id, b_id, confidence, method))
+        if pass_trace:
+            pass_trace.link()
+        if verbose:
+            print(f"   🔗 LINKED! Split {s_id} <-> Bank {b_id} [{method}] ({confidence:.0%})")
+
+    def all_scores(s_desc, candidates):
+        return [(c[0], calculate_similarity(c[2], s_desc, scorer)) for c in candidates]
+
+    # --- PASS 1: EXACT MATCH ---
+    if verbose:
+        print("\n🚀 Pass 1: Exact Match (Same Day, Same Amount)")
     
-    cur.execute("""
-        UPDATE bank_transactions 
-        SET status = 'LINKED', 
-            linked_splitwise_id = %s,
-            match_confidence = %s,
-            match_method = %s
-        WHERE id = %s
-    """, (split_id, confidence, method, bank_id))
+    unmatched_after_pass1 = []
+    
+    with traced_pass(trace, "Pass 1: Exact Match") as p1:
+        for s_txn in splitwise_txns:
+            s_id, s_date, s_total, s_desc = s_txn
+            candidates = index.candidates(s_total, s_date)
+            if p1:
+                p1.row(len(candidates))
+            
+            if len(candidates) == 1:
+                link(s_id, candidates[0][0], "Pass 1: Exact Match", 1.00, p1)
+            elif len(candidates) > 1:
+                best_id, similarity_score = pick_best_candidate(s_desc, candidates, return_score=True, scorer=scorer)
+                if best_id:
+                    if p1:
+                        p1.tie_break(s_id, best_id, all_scores(s_desc, candidates))
+                    link(s_id, best_id, "Pass 1: Tie-Break", 0.90 + (similarity_score * 0.10), p1)
+                else:
+                    unmatched_after_pass1.append(s_txn)
+            else:
+                unmatched_after_pass1.append(s_txn)
+
+    # --- PASS 2: FUZZY DATE ---
+    if verbose:
+        print("\n🚀 Pass 2: Fuzzy Date (±2 Days) + Description Match")
+    
+    unmatched_after_pass2 = []
+
+    with traced_pass(trace, "Pass 2: Fuzzy Date") as p2:
+        for s_txn in unmatched_after_pass1:
+            s_id, s_date, s_total, s_desc = s_txn
+            candidates = index.candidates(s_total, s_date, days=2)
+            if p2:
+                p2.row(len(candidates))
+            
+            best_id, similarity_score = pick_best_candidate(s_desc, candidates, threshold=0.3, return_score=True, scorer=scorer)
+
+            if best_id:
+                if p2 and len(candidates) > 1:
+                    p2.tie_break(s_id, best_id, all_scores(s_desc, candidates))
+                link(s_id, best_id, "Pass 2: Fuzzy Date", 0.70 + (similarity_score * 0.15), p2)
+            else:
+                if p2:
+                    for b_id, score in all_scores(s_desc, candidates):
+                        p2.reject(s_id, b_id, score, "description below 0.3")
+                unmatched_after_pass2.append(s_txn)
+
+    # --- PASS 3: BLIND TRUST ---
+    if verbose:
+        print("\n🚀 Pass 3: Blind Match (Strict Amount, Tight Date, Ignore Name)")
     
-    print(f"   🔗 LINKED! Split {split_id} <-> Bank {bank_id} [{method}] ({confidence:.0%})")
+    with traced_pass(trace, "Pass 3: Blind Trust") as p3:
+        for s_txn in unmatched_after_pass2:
+            s_id, s_date, s_total, s_desc = s_txn
+            candidates = index.candidates(s_total, s_date, days=1)
+            if p3:
+                p3.row(len(candidates))
+            
+            if len(candidates) == 1:
+                b_id, b_date, b_desc = candidates[0]
+                score = calculate_similarity(s_desc, b_desc, scorer)
+                if score > 0.15:
+                    link(s_id, b_id, "Pass 3: Blind Trust", 0.60 + (score * 0.15), p3)
+                elif p3:
+                    p3.reject(s_id, b_id, score, "description not above 0.15")
+            elif p3 and candidates:
+                for b_id, _, b_desc in candidates:
+                    p3.reject(s_id, b_id, calculate_similarity(s_desc, b_desc, scorer), "ambiguous: several candidates")
+
+    return links
+
+def load_bank_candidates(cur, user_id, splitwise_txns):
+    """All unlinked bank rows (any session) that some pass could match"""
+    if not splitwise_txns:
+        return []
+
+    window = timedelta(days=MAX_DATE_WINDOW)
+    dates = [s_txn[1] for s_txn in splitwise_txns]
+
+    cur.execute("""
+        SELECT id, date, amount, description
+        FROM bank_transactions
+        WHERE user_id = %s
+          AND status = 'UNLINKED'
+          AND date BETWEEN %s AND %s
+    """, (user_id, min(dates) - window, max(dates) + window))
+
+    return cur.fetchall()
 
-def run_linker(user_id=1, session_id=None):
-    """Link bank and splitwise transactions"""
+def plan_with_mode(splitwise_txns, index, mode, verbose=True, trace=None):
+    if mode == "assignment":
+        from app.services.link_assignment import plan_assignment_links
+        return plan_assignment_links(splitwise_txns, index, verbose=verbose, trace=trace)
+    return plan_links(splitwise_txns, index, verbose=verbose, trace=trace)
+
+def write_and_refresh(conn, links, session_id, user_id, released=()):
+    """
+    Flush links, then refresh metrics of any *other* session they touched
+
+    released: (split_id, bank_id) pairs unlinked beforehand; their sessions
+    are refreshed in the same pass. The current session's snapshot is
+    refreshed by the pipeline's last stage.
+    """
+    writer = LinkWriter(conn)
+    for s_id, b_id, confidence, method in links:
+        writer.link(s_id, b_id, confidence, method)
+    writer.flush()
+
+    pairs = list(links) + list(released)
+    refresh_other_sessions(conn, {pair[0] for pair in pairs}, {pair[1] for pair in pairs}, session_id, user_id)
+
+def refresh_other_sessions(conn, split_ids, bank_ids, session_id, user_id):
+    """Refresh session_metrics for sessions (other than this one) owning these rows"""
+    if not split_ids and not bank_ids:
+        return
+
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT upload_session_id FROM splitwise_transactions WHERE id = ANY(%s)
+        UNION
+        SELECT upload_session_id FROM bank_transactions WHERE id = ANY(%s)
+    """, (list(split_ids), list(bank_ids)))
+    other_sessions = sorted(row[0] for row in cur.fetchall() if row[0] != session_id)
+    cur.close()
+
+    if other_sessions:
+        from app.services.analytics import refresh_session_metrics
+        for other_session in other_sessions:
+            print(f"   🔄 Cross-session links: refreshing {other_session}")
+            refresh_session_metrics(other_session, user_id)
+
+def run_linker(user_id=1, session_id=None, mode=None, dry_run=False, exclude_bank_ids=(), max_details=None):
+    """
+    Link bank and splitwise transactions
+
+    mode: "greedy" (three passes in date order) or "assignment" (globally
+    optimal matching per amount cluster). Defaults to Config.LINKER_MODE.
+    Bank candidates come from any session, so rows near month edges can
+    link into the neighbouring month.
+
+    dry_run: write nothing and return a LinkerTrace dict instead.
+    exclude_bank_ids: bank rows to treat as already taken (e.g. by a
+    settlement dry run that ran first).
+    """
+    mode = mode or Config.LINKER_MODE
+    trace = LinkerTrace(f"linker:{mode}", max_details or DEFAULT_MAX_DETAILS) if dry_run else None
     
     conn = get_db_connection()
     cur = conn.cursor()
     
-    print("🔄 Starting System Linker...")
+    print(f"🔄 Starting System Linker ({mode}{', dry run' if dry_run else ''})...")
     
     # Get splitwise transactions where user PAID (role = PAYER, not settlement)
-    cur.execute("""
-        SELECT id, date, total_cost, description
-        FROM splitwise_transactions 
-        WHERE user_id = %s 
-          AND upload_session_id = %s
-          AND role = 'PAYER'
-          AND status = 'UNLINKED'
-        ORDER BY date
-    """, (user_id, session_id))
+    with traced_sql(trace):
+        cur.execute("""
+            SELECT id, date, total_cost, description
+            FROM splitwise_transactions 
+            WHERE user_id = %s 
+              AND upload_session_id = %s
+              AND role = 'PAYER'
+              AND status = 'UNLINKED'
+            ORDER BY date, id
+        """, (user_id, session_id))
+        splitwise_txns = cur.fetchall()
     
-    splitwise_txns = cur.fetchall()
     print(f"🔍 Found {len(splitwise_txns)} Splitwise entries to process.")
     
-    links_made = 0
+    # Load the candidate universe once, match in memory, write back set-based
+    with traced_sql(trace):
+        bank_rows = load_bank_candidates(cur, user_id, splitwise_txns)
+    cur.close()
     
-    # --- PASS 1: EXACT MATCH ---
-    print("\n🚀 Pass 1: Exact Match (Same Day, Same Amount)")
+    index = BankCandidateIndex(bank_rows)
+    for bank_id in exclude_bank_ids:
+        index.claim(bank_id)
     
-    unmatched_after_pass1 = []
+    links = plan_with_mode(splitwise_txns, index, mode, verbose=not dry_run, trace=trace)
     
-    for s_txn in splitwise_txns:
-        s_id, s_date, s_total, s_desc = s_txn
-        target_amount = float(s_total)
-        
-        cur.execute("""
-            SELECT id, date, description 
-            FROM bank_transactions 
-            WHERE user_id = %s 
-              AND status = 'UNLINKED'
-              AND ABS(ABS(amount) - %s) < 1.00
-              AND date = %s
-        """, (user_id, target_amount, s_date))
-        
-        candidates = cur.fetchall()
-        
-        if len(candidates) == 1:
-            b_id, b_date, b_desc = candidates[0]
-            confidence = 1.00
-            link_transactions(cur, s_id, b_id, "Pass 1: Exact Match", confidence)
-            links_made += 1
-            conn.commit()
-        elif len(candidates) > 1:
-            best_id, similarity_score = pick_best_candidate(s_desc, candidates, return_score=True)
-            if best_id:
-                confidence = 0.90 + (similarity_score * 0.10)
-                link_transactions(cur, s_id, best_id, "Pass 1: Tie-Break", confidence)
-                links_made += 1
-                conn.commit()
-            else:
-                unmatched_after_pass1.append(s_txn)
-        else:
-            unmatched_after_pass1.append(s_txn)
-
-    # --- PASS 2: FUZZY DATE ---
-    print("\n🚀 Pass 2: Fuzzy Date (±2 Days) + Description Match")
+    if dry_run:
+        conn.close()
+        trace.summary = {
+            'session_id': session_id,
+            'mode': mode,
+            'splitwise_rows': len(splitwise_txns),
+            'bank_candidates': len(bank_rows),
+            'would_link': len(links),
+            'link_rate': round(len(links) / len(splitwise_txns), 4) if splitwise_txns else None,
+            'links': [
+                {'split_id': s_id, 'bank_id': b_id, 'confidence': round(confidence, 3), 'method': method}
+                for s_id, b_id, confidence, method in links[:trace.max_details]
+            ]
+        }
+        print(f"\n✅ Linker dry run finished. Would link: {len(links)}")
+        return trace.to_dict()
     
-    unmatched_after_pass2 = []
+    write_and_refresh(conn, links, session_id, user_id)
 
-    for s_txn in unmatched_after_pass1:
-        s_id, s_date, s_total, s_desc = s_txn
-        target_amount = float(s_total)
-        
-        cur.execute("""
-            SELECT id, date, description 
-            FROM bank_transactions 
-            WHERE user_id = %s 
-              AND status = 'UNLINKED'
-              AND ABS(ABS(amount) - %s) < 1.00
-              AND date >= (%s::date - INTERVAL '2 days')
-              AND date <= (%s::date + INTERVAL '2 days')
-        """, (user_id, target_amount, s_date, s_date))
-        
-        candidates = cur.fetchall()
-        
-        best_id, similarity_score = pick_best_candidate(s_desc, candidates, threshold=0.3, return_score=True)
+    print(f"\n✅ Linker finished. Total Linked: {len(links)}")
+    conn.close()
 
-        if best_id:
-            confidence = 0.70 + (similarity_score * 0.15)
-            link_transactions(cur, s_id, best_id, "Pass 2: Fuzzy Date", confidence)
-            links_made += 1
-            conn.commit()
-        else:
-            unmatched_after_pass2.append(s_txn)
+def link_across_boundaries(user_id=1, session_id=None, mode=None):
+    """
+    Link adjacent months' Splitwise rows that fall just outside this session
 
-    # --- PASS 3: BLIND TRUST ---
-    print("\n🚀 Pass 3: Blind Match (Strict Amount, Tight Date, Ignore Name)")
+    A dinner on the 31st can hit the bank on the 1st. When the earlier month
+    was linked, this month's bank rows did not exist yet, so its boundary
+    Splitwise rows stayed UNLINKED. Only rows within MAX_DATE_WINDOW days of
+    this session's first/last day are loaded (served by the partial
+    UNLINKED date indexes), never the neighbouring months in full.
+    """
+    mode = mode or Config.LINKER_MODE
     
-    for s_txn in unmatched_after_pass2:
-        s_id, s_date, s_total, s_desc = s_txn
-        target_amount = float(s_total)
-        
-        cur.execute("""
-            SELECT id, date, description 
-            FROM bank_transactions 
-            WHERE user_id = %s 
-              AND status = 'UNLINKED'
-              AND ABS(ABS(amount) - %s) < 1.00
-              AND date >= (%s::date - INTERVAL '1 day')
-              AND date <= (%s::date + INTERVAL '1 day')
-        """, (user_id, target_amount, s_date, s_date))
-        
-        candidates = cur.fetchall()
-        
-        if len(candidates) == 1:
-            b_id, b_date, b_desc = candidates[0]
-            score = calculate_similarity(s_desc, b_desc)
-            if score > 0.15:
-                confidence = 0.60 + (score * 0.15)
-                link_transactions(cur, s_id, b_id, "Pass 3: Blind Trust", confidence)
-                links_made += 1
-                conn.commit()
-
-    print(f"\n✅ Linker finished. Total Linked: {links_made}")
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    cur.execute("SELECT start_date, end_date FROM upload_sessions WHERE id = %s", (session_id,))
+    session = cur.fetchone()
+    if not session:
+        cur.close()
+        conn.close()
+        return 0
+    
+    start_date, end_date = session
+    window = timedelta(days=MAX_DATE_WINDOW)
+    
+    print("\n🔄 Linking across month boundaries...")
+    
+    cur.execute("""
+        SELECT id, date, total_cost, description
+        FROM splitwise_transactions
+        WHERE user_id = %s
+          AND upload_session_id <> %s
+          AND role = 'PAYER'
+          AND status = 'UNLINKED'
+          AND (date BETWEEN %s AND %s OR date BETWEEN %s AND %s)
+        ORDER BY date, id
+    """, (
+        user_id, session_id,
+        start_date - window, start_date - timedelta(days=1),
+        end_date + timedelta(days=1), end_date + window
+    ))
+    
+    boundary_txns = cur.fetchall()
+    print(f"🔍 Found {len(boundary_txns)} unlinked Splitwise entries in adjacent months.")
+    
+    if not boundary_txns:
+        cur.close()
+        conn.close()
+        return 0
+    
+    index = BankCandidateIndex(load_bank_candidates(cur, user_id, boundary_txns))
+    links = plan_with_mode(boundary_txns, index, mode)
     cur.close()
+    
+    write_and_refresh(conn, links, session_id, user_id)
+    
+    print(f"\n✅ Boundary linking finished. Total Linked: {len(links)}")
     conn.close()
+    
+    return len(links)
+
+def explain_linker(session_id, user_id=1, mode=None, max_details=None):
+    """
+    Dry-run settlement detection and the linker for a session, writing nothing
+
+    Settlements run first (as in the pipeline) and the bank rows they would
+    claim are excluded from the linker's candidates.
+    """
+    from app.services.categorization import detect_settlements
+
+    settlements = detect_settlements(user_id, session_id, dry_run=True, max_details=max_details)
+    linker = run_linker(
+        user_id, session_id, mode,
+        dry_run=True,
+        exclude_bank_ids=settlements['summary']['claimed_bank_ids'],
+        max_details=max_details
+    )
+
+    return {
+        'session_id': session_id,
+        'settlements': settlements,
+        'linker': linker
+    }
 
 def run_full_pipeline(session_id, user_id=1):
     """Complete pipeline for specific upload session"""
@@ -192,17 +402,32 @@ def run_full_pipeline(session_id, user_id=1):
         detect_other_transfers,
         auto_categorize_bank_transactions
     )
+    from app.services.subset_linker import run_subset_linker
     
     print("=" * 60)
     print("🚀 RUNNING FULL FINANCIAL ANALYSIS PIPELINE")
     print(f"   Session: {session_id}")
     print("=" * 60)
     
-    # Run pipeline
-    settlements = detect_settlements(user_id, session_id)
-    run_linker(user_id, session_id)
-    other_transfers = detect_other_transfers(user_id, session_id)
-    auto_categorize_bank_transactions(session_id, user_id)
+    # Run pipeline (each stage tracked as its own unit of work)
+    with track_queries("pipeline", log_summary=True):
+        with track_queries("pipeline:detect_settlements", log_summary=True):
+            settlements = detect_settlements(user_id, session_id)
+        with track_queries("pipeline:run_linker", log_summary=True):
+            run_linker(user_id, session_id)
+        with track_queries("pipeline:link_boundaries", log_summary=True):
+            link_across_boundaries(user_id, session_id)
+        with track_queries("pipeline:subset_links", log_summary=True):
+            run_subset_linker(user_id, session_id)
+        with track_queries("pipeline:detect_other_transfers", log_summary=True):
+            other_transfers = detect_other_transfers(user_id, session_id)
+        with track_queries("pipeline:auto_categorize", log_summary=True):
+            auto_categorize_bank_transactions(session_id, user_id)
+        
+        # Snapshot metrics so analytics endpoints don't recompute them
+        from app.services.analytics import refresh_session_metrics
+        with track_queries("pipeline:refresh_metrics", log_summary=True):
+            refresh_session_metrics(session_id, user_id)
     
     # Mark session complete
     from app.services.session_manager import mark_session_complete
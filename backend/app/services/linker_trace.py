@@ -0,0 +1,151 @@
+"""
+Linker Trace
+Collects what the linker and settlement detection decided, and why, during a
+dry run: per-pass candidate counts, tie-breaks, rejected pairs with their
+scores, and time spent in SQL versus matching
+"""
+import time
+from contextlib import contextmanager
+
+DEFAULT_MAX_DETAILS = 200
+
+
+class PassTrace:
+    """Counters and capped decision lists for one matching pass"""
+
+    def __init__(self, name, max_details):
+        self.name = name
+        self.max_details = max_details
+        self.rows = 0
+        self.candidates = 0
+        self.no_candidates = 0
+        self.single_candidate = 0
+        self.multiple_candidates = 0
+        self.links = 0
+        self.tie_break_count = 0
+        self.rejected_count = 0
+        self.tie_breaks = []
+        self.rejected = []
+        self.seconds = 0.0
+        self.sql_seconds = 0.0
+
+    def row(self, candidate_count):
+        self.rows += 1
+        self.candidates += candidate_count
+        if candidate_count == 0:
+            self.no_candidates += 1
+        elif candidate_count == 1:
+            self.single_candidate += 1
+        else:
+            self.multiple_candidates += 1
+
+    def link(self):
+        self.links += 1
+
+    def tie_break(self, split_id, chosen_id, scores):
+        self.tie_break_count += 1
+        if len(self.tie_breaks) < self.max_details:
+            self.tie_breaks.append({
+                'split_id': split_id,
+                'chosen_bank_id': chosen_id,
+                'scores': [{'bank_id': b_id, 'score': round(score, 3)} for b_id, score in scores]
+            })
+
+    def reject(self, split_id, bank_id, score, reason):
+        self.rejected_count += 1
+        if len(self.rejected) < self.max_details:
+            self.rejected.append({
+                'split_id': split_id,
+                'bank_id': bank_id,
+                'score': round(score, 3) if score is not None else None,
+                'reason': reason
+            })
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'rows': self.rows,
+            'candidates': self.candidates,
+            'rows_without_candidates': self.no_candidates,
+            'rows_with_one_candidate': self.single_candidate,
+            'rows_with_many_candidates': self.multiple_candidates,
+            'links': self.links,
+            'tie_break_count': self.tie_break_count,
+            'rejected_count': self.rejected_count,
+            'tie_breaks': self.tie_breaks,
+            'rejected': self.rejected,
+            'sql_ms': round(self.sql_seconds * 1000, 2),
+            'matching_ms': round((self.seconds - self.sql_seconds) * 1000, 2)
+        }
+
+
+class LinkerTrace:
+    """Trace of one dry run (linker or settlement detection)"""
+
+    def __init__(self, name, max_details=DEFAULT_MAX_DETAILS):
+        self.name = name
+        self.max_details = max_details
+        self.passes = []
+        self._current = None
+        self.sql_seconds = 0.0
+        self.started_at = time.perf_counter()
+        self.summary = {}
+
+    @contextmanager
+    def sql(self):
+        """Time a block of database work"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.sql_seconds += elapsed
+            if self._current is not None:
+                self._current.sql_seconds += elapsed
+
+    @contextmanager
+    def pass_(self, name):
+        """Time a matching pass and collect its decisions"""
+        trace = PassTrace(name, self.max_details)
+        self.passes.append(trace)
+        self._current = trace
+        start = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            trace.seconds = time.perf_counter() - start
+            self._current = None
+
+    def to_dict(self):
+        wall = time.perf_counter() - self.started_at
+        matching = sum(p.seconds - p.sql_seconds for p in self.passes)
+        return {
+            'name': self.name,
+            'dry_run': True,
+            'wall_ms': round(wall * 1000, 2),
+            'sql_ms': round(self.sql_seconds * 1000, 2),
+            'matching_ms': round(matching * 1000, 2),
+            'links': sum(p.links for p in self.passes),
+            'summary': self.summary,
+            'passes': [p.to_dict() for p in self.passes]
+        }
+
+
+@contextmanager
+def traced_pass(trace, name):
+    """trace.pass_(name), or a no-op yielding None when not tracing"""
+    if trace is None:
+        yield None
+    else:
+        with trace.pass_(name) as pass_trace:
+            yield pass_trace
+
+
+@contextmanager
+def traced_sql(trace):
+    """trace.sql(), or a no-op when not tracing"""
+    if trace is None:
+        yield
+    else:
+        with trace.sql():
+            yield
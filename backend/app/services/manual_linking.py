@@ -3,36 +3,38 @@ Manual Linking Service
 Helps users link unmatched Splitwise PAYER transactions to bank transactions
 """
 from app.database.connection import get_db_connection
-from difflib import SequenceMatcher
+from app.database.prepared import register_statement, execute_prepared
+from app.services.analytics import refresh_session_metrics
+from app.services.link_writer import LinkWriter
+from app.services.similarity import SimilarityScorer, MANUAL_PROFILE
 
-def calculate_text_similarity(text1, text2):
+# Runs once per unmatched Splitwise row when building suggestions
+POTENTIAL_MATCHES = register_statement("manual_potential_matches", """
+    SELECT 
+        id, date, description, amount, category
+    FROM bank_transactions
+    WHERE upload_session_id = $1
+      AND user_id = $2
+      AND status = 'UNLINKED'
+      AND amount < 0
+      AND ABS(amount) BETWEEN $3::numeric AND $4::numeric
+      AND date >= ($5::date - INTERVAL '5 days')
+      AND date <= ($5::date + INTERVAL '5 days')
+    ORDER BY date DESC
+    LIMIT 10
+""")
+
+SPLITWISE_STATUS = register_statement("manual_splitwise_status", """
+    SELECT status FROM splitwise_transactions 
+    WHERE id = $1 AND upload_session_id = $2 AND user_id = $3
+""")
+
+def calculate_text_similarity(text1, text2, scorer=None):
     """Calculate similarity between two strings (0-1)"""
-    if not text1 or not text2:
-        return 0.0
-    
-    # Clean texts
-    t1 = text1.lower().strip()
-    t2 = text2.lower().strip()
-    
-    # Remove common noise words
-    noise_words = ['upi', 'pos', 'txn', 'imps', 'neft', 'limited', 'private', 'ltd']
-    for noise in noise_words:
-        t1 = t1.replace(noise, '')
-        t2 = t2.replace(noise, '')
-    
-    # Token overlap
-    tokens1 = set(t1.split())
-    tokens2 = set(t2.split())
-    common = tokens1.intersection(tokens2)
-    
-    if len(common) > 0:
-        return 0.7 + (0.1 * min(len(common), 3))  # Max 1.0
-    
-    # Sequence matching
-    return SequenceMatcher(None, t1, t2).ratio()
+    return (scorer or SimilarityScorer(MANUAL_PROFILE)).score(text1, text2)
 
 
-def calculate_match_score(splitwise_txn, bank_txn):
+def calculate_match_score(splitwise_txn, bank_txn, scorer=None):
     """
     Calculate match score between splitwise and bank transaction
     Returns: (score, reasons)
@@ -78,7 +80,8 @@ def calculate_match_score(splitwise_txn, bank_txn):
     # 3. Description similarity (30% weight)
     text_score = calculate_text_similarity(
         bank_txn['description'],
-        splitwise_txn['description']
+        splitwise_txn['description'],
+        scorer
     )
     score += text_score * 0.30
     
@@ -90,7 +93,7 @@ def calculate_match_score(splitwise_txn, bank_txn):
     return round(score, 2), ", ".join(reasons)
 
 
-def find_potential_matches(splitwise_txn, session_id, user_id=1):
+def find_potential_matches(splitwise_txn, session_id, user_id=1, scorer=None):
     """
     Find potential bank matches for a splitwise transaction
     Returns top 3 candidates with scores
@@ -105,20 +108,7 @@ def find_potential_matches(splitwise_txn, session_id, user_id=1):
     amount_min = split_amount * 0.85
     amount_max = split_amount * 1.15
     
-    cur.execute("""
-        SELECT 
-            id, date, description, amount, category
-        FROM bank_transactions
-        WHERE upload_session_id = %s
-          AND user_id = %s
-          AND status = 'UNLINKED'
-          AND amount < 0
-          AND ABS(amount) BETWEEN %s AND %s
-          AND date >= (%s::date - INTERVAL '5 days')
-          AND date <= (%s::date + INTERVAL '5 days')
-        ORDER BY date DESC
-        LIMIT 10
-    """, (session_id, user_id, amount_min, amount_max, split_date, split_date))
+    execute_prepared(cur, POTENTIAL_MATCHES, (session_id, user_id, amount_min, amount_max, split_date))
     
     candidates = []
     for row in cur.fetchall():
@@ -131,7 +121,7 @@ def find_potential_matches(splitwise_txn, session_id, user_id=1):
         }
         
         # Calculate match score
-        score, reason = calculate_match_score(splitwise_txn, bank_txn)
+        score, reason = calculate_match_score(splitwise_txn, bank_txn, scorer)
         
         candidates.append({
             'id': bank_txn['id'],
@@ -170,6 +160,9 @@ def get_unmatched_splitwise(session_id, user_id=1):
         ORDER BY date DESC
     """, (session_id, user_id))
     
+    # One scorer for the whole request: bank descriptions are tokenized once
+    scorer = SimilarityScorer(MANUAL_PROFILE)
+    
     unmatched = []
     for row in cur.fetchall():
         split_txn = {
@@ -182,7 +175,7 @@ def get_unmatched_splitwise(session_id, user_id=1):
         }
         
         # Find potential matches
-        suggested_matches = find_potential_matches(split_txn, session_id, user_id)
+        suggested_matches = find_potential_matches(split_txn, session_id, user_id, scorer)
         
         # Determine if we should pre-select
         preselect_id = None
@@ -210,68 +203,77 @@ def link_transactions_manual(splitwise_id, bank_id, session_id, user_id=1):
     """
     Manually link a splitwise transaction to a bank transaction
     """
+    link_transactions_manual_bulk([(splitwise_id, bank_id)], session_id, user_id)
+    return True
+
+
+def link_transactions_manual_bulk(pairs, session_id, user_id=1):
+    """
+    Manually link many (splitwise_id, bank_id) pairs at once
+
+    All pairs are validated up front; if any is invalid nothing is linked.
+    The bank side takes the Splitwise row's category.
+    Returns the number of links written.
+    """
+    if not pairs:
+        return 0
+    
+    splitwise_ids = [pair[0] for pair in pairs]
+    bank_ids = [pair[1] for pair in pairs]
+    
+    if len(set(splitwise_ids)) != len(pairs) or len(set(bank_ids)) != len(pairs):
+        raise ValueError("Each transaction can only be linked once")
+    
     conn = get_db_connection()
     cur = conn.cursor()
     
-    # Verify both transactions exist and are unlinked
+    # Verify all transactions exist and are unlinked (one query per table)
     cur.execute("""
-        SELECT status FROM splitwise_transactions 
-        WHERE id = %s AND upload_session_id = %s AND user_id = %s
-    """, (splitwise_id, session_id, user_id))
+        SELECT id, status, category FROM splitwise_transactions
+        WHERE id = ANY(%s) AND upload_session_id = %s AND user_id = %s
+    """, (splitwise_ids, session_id, user_id))
+    splitwise_rows = {row[0]: row for row in cur.fetchall()}
     
-    split_result = cur.fetchone()
-    if not split_result:
-        cur.close()
-        conn.close()
-        raise ValueError("Splitwise transaction not found")
+    cur.execute("""
+        SELECT id, status FROM bank_transactions
+        WHERE id = ANY(%s) AND upload_session_id = %s AND user_id = %s
+    """, (bank_ids, session_id, user_id))
+    bank_rows = {row[0]: row for row in cur.fetchall()}
     
-    if split_result[0] != 'UNLINKED':
-        cur.close()
-        conn.close()
-        raise ValueError("Splitwise transaction already linked")
+    cur.close()
     
-    cur.execute("""
-        SELECT status FROM bank_transactions 
-        WHERE id = %s AND upload_session_id = %s AND user_id = %s
-    """, (bank_id, session_id, user_id))
+    errors = []
+    for splitwise_id, bank_id in pairs:
+        if splitwise_id not in splitwise_rows:
+            errors.append(f"Splitwise transaction {splitwise_id} not found")
+        elif splitwise_rows[splitwise_id][1] != 'UNLINKED':
+            errors.append(f"Splitwise transaction {splitwise_id} already linked")
+        
+        if bank_id not in bank_rows:
+            errors.append(f"Bank transaction {bank_id} not found")
+        elif bank_rows[bank_id][1] != 'UNLINKED':
+            errors.append(f"Bank transaction {bank_id} already linked")
     
-    bank_result = cur.fetchone()
-    if not bank_result:
-        cur.close()
+    if errors:
         conn.close()
-        raise ValueError("Bank transaction not found")
-    
-    if bank_result[0] != 'UNLINKED':
-        cur.close()
+        raise ValueError("; ".join(errors))
+    
+    writer = LinkWriter(conn)
+    for splitwise_id, bank_id in pairs:
+        writer.link(
+            splitwise_id, bank_id,
+            confidence=1.0, method='manual',
+            bank_category=splitwise_rows[splitwise_id][2]
+        )
+    try:
+        # Rows may have been linked since the check above; then nothing is written
+        linked = writer.flush(all_or_nothing=True)
+    finally:
         conn.close()
-        raise ValueError("Bank transaction already linked")
-    
-    # Update splitwise transaction
-    cur.execute("""
-        UPDATE splitwise_transactions
-        SET status = 'LINKED',
-            linked_bank_id = %s,
-            match_confidence = 1.0,
-            match_method = 'manual'
-        WHERE id = %s
-    """, (bank_id, splitwise_id))
-    
-    # Update bank transaction
-    cur.execute("""
-        UPDATE bank_transactions
-        SET status = 'LINKED',
-            linked_splitwise_id = %s,
-            match_confidence = 1.0,
-            match_method = 'manual',
-            category = (SELECT category FROM splitwise_transactions WHERE id = %s)
-        WHERE id = %s
-    """, (splitwise_id, splitwise_id, bank_id))
     
-    conn.commit()
-    cur.close()
-    conn.close()
+    refresh_session_metrics(session_id, user_id)
     
-    return True
+    return linked
 
 
 def skip_transaction(splitwise_id, reason, session_id, user_id=1):
@@ -282,10 +284,7 @@ def skip_transaction(splitwise_id, reason, session_id, user_id=1):
     cur = conn.cursor()
     
     # Verify transaction exists
-    cur.execute("""
-        SELECT status FROM splitwise_transactions 
-        WHERE id = %s AND upload_session_id = %s AND user_id = %s
-    """, (splitwise_id, session_id, user_id))
+    execute_prepared(cur, SPLITWISE_STATUS, (splitwise_id, session_id, user_id))
     
     result = cur.fetchone()
     if not result:
@@ -305,4 +304,6 @@ def skip_transaction(splitwise_id, reason, session_id, user_id=1):
     cur.close()
     conn.close()
     
+    refresh_session_metrics(session_id, user_id)
+    
     return True
\ No newline at end of file
@@ -0,0 +1,223 @@
+"""
+Merchant Memory
+Remembers merchant -> category per user across sessions so merchants seen
+before are categorized without the keyword engine. Memory runs after the
+session-config detectors (family, rent), which it must never override.
+
+- merchant_key(): normalized merchant, stored on bank rows at ingest
+- 'correction' entries come from manual re-categorization and always win;
+  'auto' entries are learned from keyword matches and never replace them
+- An 'auto' entry only changes category once a different keyword category
+  has recurred RELEARN_HITS times across separate learn calls
+- Only keyword hits inside the merchant segment are learned, and never for
+  person-like UPI payees (a name that happens to contain a keyword)
+- Amount- or config-driven categories (Rent) and fallbacks (Other) are never learned
+"""
+import re
+from collections import Counter, defaultdict
+from psycopg2.extras import execute_values
+from app.database.connection import get_db_connection
+
+NEVER_LEARN = ('Other', 'Rent', 'Uncategorized')
+
+_PREFIX = re.compile(r'^(?:UPI|POS|IMPS|NEFT|RTGS|ATM|ACH|NACH)[-/: ]+')
+_HANDLE = re.compile(r'[\w.]*@\w+')
+_SEPARATOR = re.compile(r'[-/.|*]')
+_WORD = re.compile(r'[A-Z][A-Z&]+')
+
+MAX_KEY_WORDS = 3
+
+# Words that mark a UPI payee as a business rather than a person
+BUSINESS_WORDS = frozenset({
+    'LTD', 'LIMITED', 'PVT', 'PRIVATE', 'LLP', 'INC', 'CORP', 'CORPORATION', 'COMPANY',
+    'INDIA', 'ENTERPRISES', 'ENTERPRISE', 'TRADERS', 'TRADING', 'SERVICES', 'SOLUTIONS',
+    'TECHNOLOGIES', 'RETAIL', 'STORE', 'STORES', 'MART', 'SHOP', 'AGENCY', 'AGENCIES',
+    'FOODS', 'CAFE', 'RESTAURANT', 'HOTEL', 'BAKERY', 'MEDICAL', 'MEDICALS', 'PHARMACY',
+    'CHEMIST', 'HOSPITAL', 'CLINIC', 'PETROLEUM', 'FUELS', 'MOTORS', 'TRAVELS'
+})
+
+# Observations of a different category before an 'auto' entry switches to it
+RELEARN_HITS = 3
+
+LOAD_MEMORY_SQL = """
+    SELECT merchant_key, category
+    FROM merchant_category_memory
+    WHERE user_id = %s
+      AND merchant_key = ANY(%s)
+"""
+
+# The same category adds support; a different one is held as pending and
+# only replaces the entry once it recurs (pending in an earlier call, and
+# RELEARN_HITS observations in total). Corrections are never touched.
+LEARN_SQL = """
+    INSERT INTO merchant_category_memory AS m (user_id, merchant_key, category, source, hits)
+    VALUES %s
+    ON CONFLICT (user_id, merchant_key) DO UPDATE
+    SET category = CASE
+            WHEN m.category = EXCLUDED.category THEN m.category
+            WHEN m.pending_category = EXCLUDED.category
+             AND m.pending_hits + EXCLUDED.hits >= {relearn} THEN EXCLUDED.category
+            ELSE m.category
+        END,
+        hits = CASE
+            WHEN m.category = EXCLUDED.category THEN m.hits + EXCLUDED.hits
+            WHEN m.pending_category = EXCLUDED.category
+             AND m.pending_hits + EXCLUDED.hits >= {relearn} THEN m.pending_hits + EXCLUDED.hits
+            ELSE m.hits
+        END,
+        pending_category = CASE
+            WHEN m.category = EXCLUDED.category THEN NULL
+            WHEN m.pending_category = EXCLUDED.category
+             AND m.pending_hits + EXCLUDED.hits >= {relearn} THEN NULL
+            ELSE EXCLUDED.category
+        END,
+        pending_hits = CASE
+            WHEN m.category = EXCLUDED.category THEN 0
+            WHEN m.pending_category = EXCLUDED.category
+             AND m.pending_hits + EXCLUDED.hits >= {relearn} THEN 0
+            WHEN m.pending_category = EXCLUDED.category THEN m.pending_hits + EXCLUDED.hits
+            ELSE EXCLUDED.hits
+        END,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE m.source = 'auto'
+    RETURNING merchant_key, category
+""".format(relearn=RELEARN_HITS)
+
+CORRECTION_SQL = """
+    INSERT INTO merchant_category_memory (user_id, merchant_key, category, source, hits)
+    VALUES (%s, %s, %s, 'correction', 1)
+    ON CONFLICT (user_id, merchant_key) DO UPDATE
+    SET category = EXCLUDED.category,
+        source = 'correction',
+        hits = merchant_category_memory.hits + 1,
+        pending_category = NULL,
+        pending_hits = 0,
+        updated_at = CURRENT_TIMESTAMP
+"""
+
+
+def _merchant_segment(description):
+    """Upper-cased text up to the first separator, payment prefix and UPI handles removed"""
+    text = _PREFIX.sub('', description.upper().strip())
+    text = _HANDLE.sub(' ', text)
+    return _SEPARATOR.split(text, 1)[0]
+
+
+def merchant_key(description):
+    """
+    Normalized merchant for memory lookups, or None if there is no usable name
+
+    Examples:
+    - "UPI-SWIGGY LIMITED-4021..." → "SWIGGY LIMITED"
+    - "POS DMART READY" → "DMART READY"
+    - "UPI-98xxxxxx10@ybl" → None (bare UPI handle)
+    """
+    if not description:
+        return None
+
+    segment = _merchant_segment(description)
+    key = ' '.join(_WORD.findall(segment)[:MAX_KEY_WORDS])
+    return key if len(key) >= 3 else None
+
+
+def learnable_key(description, keyword):
+    """
+    merchant_key() if a keyword hit on this description may be learned, else None
+
+    The keyword must lie inside the merchant segment (not in a reference or
+    location tail), and the payee must not look like a person: a UPI payee
+    of two or three plain words with no business word ("UPI-ROHAN UBEROI").
+    """
+    if not description or not keyword:
+        return None
+
+    segment = _merchant_segment(description)
+    if _SEPARATOR.split(keyword.upper(), 1)[0] not in segment:
+        return None
+
+    words = _WORD.findall(segment)
+    if (
+        description.upper().lstrip().startswith('UPI')
+        and 2 <= len(words) <= 3
+        and not BUSINESS_WORDS.intersection(words)
+    ):
+        return None
+
+    return merchant_key(description)
+
+
+def fill_merchant_keys(cur, session_id, user_id):
+    """Set merchant_key on rows ingested before the column existed"""
+    cur.execute("""
+        SELECT id, description
+        FROM bank_transactions
+        WHERE upload_session_id = %s
+          AND user_id = %s
+          AND merchant_key IS NULL
+    """, (session_id, user_id))
+
+    keys = [(txn_id, merchant_key(description)) for txn_id, description in cur.fetchall()]
+    keys = [(txn_id, key) for txn_id, key in keys if key]
+    if not keys:
+        return 0
+
+    execute_values(cur, """
+        UPDATE bank_transactions b
+        SET merchant_key = v.merchant_key
+        FROM (VALUES %s) AS v (id, merchant_key)
+        WHERE b.id = v.id
+    """, keys, template="(%s::integer, %s::text)", page_size=len(keys))
+
+    return len(keys)
+
+
+def load_merchant_memory(cur, user_id, keys):
+    """{merchant_key: category} for the given keys"""
+    keys = sorted({key for key in keys if key})
+    if not keys:
+        return {}
+
+    cur.execute(LOAD_MEMORY_SQL, (user_id, keys))
+    return dict(cur.fetchall())
+
+
+def learn_merchants(cur, user_id, pairs):
+    """
+    Remember auto-categorized merchants. pairs: [(learnable_key, category)];
+    pairs without a key are skipped. The most frequent category per
+    merchant is offered to LEARN_SQL with its count. Does not commit.
+
+    Returns {merchant_key: category} as stored after the write (entries
+    protected by a correction are left out).
+    """
+    votes = defaultdict(Counter)
+    for key, category in pairs:
+        if key and category not in NEVER_LEARN:
+            votes[key][category] += 1
+
+    if not votes:
+        return {}
+
+    rows = []
+    for key, counter in votes.items():
+        category, count = counter.most_common(1)[0]
+        rows.append((user_id, key, category, 'auto', count))
+
+    stored = execute_values(cur, LEARN_SQL, rows, page_size=len(rows), fetch=True)
+    return dict(stored)
+
+
+def remember_correction(user_id, description, category):
+    """Record a manual re-categorization; it takes precedence over learned entries"""
+    key = merchant_key(description)
+    if not key or category in NEVER_LEARN:
+        return False
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute(CORRECTION_SQL, (user_id, key, category))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    return True
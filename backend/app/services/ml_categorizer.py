@@ -0,0 +1,312 @@
+"""
+ML Categorizer
+Multinomial naive Bayes over hashed word and character n-grams, trained on
+the user's own categorized bank history. CPU only, NumPy only, no network.
+
+- Batch inference: one vectorization and one matrix gather per session
+- predict() returns (category, confidence); callers only accept predictions
+  at or above Config.ML_CONFIDENCE_THRESHOLD and fall back to keywords.
+  Confidence is the NB posterior scaled by the share of the row's features
+  seen in training: raw NB posteriors are near 1.0 even for merchants the
+  model has never seen, which would otherwise override the keyword engine
+- Models are cached per user; retraining runs on a background thread and
+  swaps the new model in when done (NB training is just counting, so rows
+  whose label changed are folded in instead of refitting everything)
+- Rows are picked by bank_transactions.label_updated_at (set by a trigger
+  whenever category or status changes), not by id, so rows labelled or
+  corrected after they were first seen are trained on. The model remembers
+  the label each row was counted under and moves it on relabel
+"""
+import re
+import zlib
+import threading
+from datetime import timedelta
+import numpy as np
+from app.config import Config
+from app.database.connection import get_db_connection
+from app.database.streaming import stream_rows
+
+# Fallbacks and amount/config-driven labels say nothing about the description
+NEVER_TRAIN = ('Other', 'Uncategorized', 'Rent', 'Settlement')
+
+ALPHA = 1.0             # Laplace smoothing
+CHAR_NGRAM = 3
+
+# Re-read this far behind the watermark: a transaction's timestamp is its
+# start, so a slow writer can commit rows stamped before the last read
+LABEL_LAG = timedelta(minutes=5)
+
+_HANDLE = re.compile(r'[\w.]*@\w+')
+_TOKEN = re.compile(r'[A-Z]{2,}')
+
+# Every row whose label changed since the watermark; trainable() decides
+# whether it counts, so rows relabelled to a fallback are removed again
+TRAINING_SQL = """
+    SELECT id, description, category, status, label_updated_at
+    FROM bank_transactions
+    WHERE user_id = %s
+      AND (%s::timestamp IS NULL OR label_updated_at > %s)
+    ORDER BY label_updated_at, id
+"""
+
+
+def trainable(description, category, status):
+    return bool(description) and category is not None and category not in NEVER_TRAIN and status != 'TRANSFER'
+
+
+
+def description_features(description, mask):
+    """Hashed feature ids: word unigrams, word bigrams and char trigrams"""
+    tokens = _TOKEN.findall(_HANDLE.sub(' ', (description or '').upper()))
+
+    features = [f"w:{t}" for t in tokens]
+    features += [f"b:{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    for token in tokens:
+        padded = f" {token} "
+        features += [f"c:{padded[i:i + CHAR_NGRAM]}" for i in range(len(padded) - CHAR_NGRAM + 1)]
+
+    return [zlib.crc32(f.encode()) & mask for f in features]
+
+
+class NaiveBayesCategorizer:
+    """Multinomial NB over a fixed hashed feature space (2 ** hash_bits columns)"""
+
+    def __init__(self, hash_bits=None):
+        self.hash_bits = hash_bits or Config.ML_HASH_BITS
+        self.mask = (1 << self.hash_bits) - 1
+        self.categories = []
+        self._index = {}
+        self.class_count = np.zeros(0)
+        self.feature_count = np.zeros((0, 1 << self.hash_bits))
+        self.labels = {}                 # row id -> category it is counted under
+        self.trained_until = None        # label_updated_at watermark
+        self._log_prior = None
+        self._log_prob = None
+        self._seen = None
+
+    def _vectorize(self, descriptions):
+        """(row, column) index arrays for a batch, one entry per feature occurrence; identical descriptions hashed once"""
+        cache = {}
+        rows, cols = [], []
+        for r, description in enumerate(descriptions):
+            features = cache.get(description)
+            if features is None:
+                features = cache[description] = description_features(description, self.mask)
+            rows.extend([r] * len(features))
+            cols.extend(features)
+        return np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+
+    def _class_ids(self, labels):
+        for label in labels:
+            if label not in self._index:
+                self._index[label] = len(self.categories)
+                self.categories.append(label)
+
+        grow = len(self.categories) - len(self.class_count)
+        if grow:
+            self.class_count = np.concatenate([self.class_count, np.zeros(grow)])
+            self.feature_count = np.vstack([self.feature_count, np.zeros((grow, self.feature_count.shape[1]))])
+
+        return np.asarray([self._index[label] for label in labels], dtype=np.int64)
+
+    def partial_fit(self, descriptions, labels, weight=1):
+        """Add a batch of labelled descriptions to the counts (weight=-1 removes them)"""
+        if not descriptions:
+            return self
+
+        class_ids = self._class_ids(labels)
+        rows, cols = self._vectorize(descriptions)
+
+        np.add.at(self.class_count, class_ids, weight)
+        np.add.at(self.feature_count, (class_ids[rows], cols), weight)
+
+        self._log_prior = None
+        return self
+
+    def update_rows(self, rows):
+        """
+        Apply label changes: rows are (id, description, category, status)
+
+        New trainable rows are added, relabelled rows move to their new
+        category, rows that stopped being trainable are removed.
+        """
+        add, remove = ([], []), ([], [])
+        for row_id, description, category, status in rows:
+            old = self.labels.get(row_id)
+            new = category if trainable(description, category, status) else None
+            if old == new:
+                continue
+            if old is not None:
+                remove[0].append(description)
+                remove[1].append(old)
+                del self.labels[row_id]
+            if new is not None:
+                add[0].append(description)
+                add[1].append(new)
+                self.labels[row_id] = new
+
+        self.partial_fit(*remove, weight=-1)
+        self.partial_fit(*add)
+        return self
+
+    @property
+    def trained_rows(self):
+        return len(self.labels)
+
+    def _finalize(self):
+        if self._log_prior is None:
+            smoothed = self.feature_count + ALPHA
+            self._log_prob = np.log(smoothed) - np.log(smoothed.sum(axis=1, keepdims=True))
+            # A category whose rows were all relabelled keeps a column with prior -inf
+            with np.errstate(divide='ignore'):
+                self._log_prior = np.log(self.class_count) - np.log(self.class_count.sum())
+            self._seen = self.feature_count.sum(axis=0) > 0
+
+    @property
+    def ready(self):
+        return self.trained_rows >= Config.ML_MIN_TRAINING_ROWS and np.count_nonzero(self.class_count) >= 2
+
+    def predict(self, descriptions):
+        """[(category, confidence)] for every description, in one vectorized pass"""
+        if not descriptions:
+            return []
+
+        self._finalize()
+        rows, cols = self._vectorize(descriptions)
+        n = len(descriptions)
+
+        # Joint log-likelihood: prior + sum of log P(feature | class) per row.
+        # Rows are contiguous in `rows`, so each row's sum is one reduceat segment.
+        nnz = np.bincount(rows, minlength=n)
+        scores = np.tile(self._log_prior, (n, 1))
+        filled = nnz > 0
+        if filled.any():
+            starts = np.concatenate([[0], np.cumsum(nnz)[:-1]])[filled]
+            scores[filled] += np.add.reduceat(self._log_prob[:, cols].T, starts, axis=0)
+
+        known = np.bincount(rows, weights=self._seen[cols], minlength=n) / np.maximum(nnz, 1)
+
+        scores -= scores.max(axis=1, keepdims=True)
+        probs = np.exp(scores)
+        probs /= probs.sum(axis=1, keepdims=True)
+
+        best = probs.argmax(axis=1)
+        confidence = probs[np.arange(n), best] * known
+        return [(self.categories[c], float(p)) for c, p in zip(best, confidence)]
+
+
+_models = {}
+_retraining = set()
+_pending = {}           # user_id -> full, for retrains requested while one runs
+_lock = threading.Lock()
+
+
+def _train(user_id, model):
+    """Fold the user's label changes since model.trained_until into model"""
+    since = model.trained_until - LABEL_LAG if model.trained_until else None
+    conn = get_db_connection()
+    batch = []
+
+    try:
+        for row_id, description, category, status, updated_at in stream_rows(
+            conn, TRAINING_SQL, (user_id, since, since)
+        ):
+            batch.append((row_id, description, category, status))
+            model.trained_until = updated_at
+
+            if len(batch) >= Config.STREAM_ITERSIZE:
+                model.update_rows(batch)
+                batch = []
+
+        model.update_rows(batch)
+    finally:
+        conn.close()
+
+    return model
+
+
+def get_model(user_id):
+    """The user's model, trained on first use; None if there is too little history"""
+    with _lock:
+        model = _models.get(user_id)
+
+    if model is None:
+        model = _train(user_id, NaiveBayesCategorizer())
+        with _lock:
+            _models.setdefault(user_id, model)
+
+    return model if model.ready else None
+
+
+def _retrain_once(user_id, full):
+    with _lock:
+        current = _models.get(user_id)
+
+    if full or current is None:
+        model = _train(user_id, NaiveBayesCategorizer())
+    else:
+        # Train a copy so predictions keep using the old model meanwhile
+        model = NaiveBayesCategorizer(current.hash_bits)
+        model.categories = list(current.categories)
+        model._index = dict(current._index)
+        model.class_count = current.class_count.copy()
+        model.feature_count = current.feature_count.copy()
+        model.labels = dict(current.labels)
+        model.trained_until = current.trained_until
+        model = _train(user_id, model)
+
+    with _lock:
+        _models[user_id] = model
+    print(f"🤖 ML categorizer retrained for user {user_id}: {model.trained_rows} rows, {len(model.categories)} categories")
+
+
+def _retrain(user_id, full):
+    """Retrain, then once more for each batch of requests that came in meanwhile"""
+    while True:
+        try:
+            _retrain_once(user_id, full)
+        except Exception as e:
+            print(f"⚠️ ML categorizer retrain failed for user {user_id}: {e}")
+
+        with _lock:
+            if user_id not in _pending:
+                _retraining.discard(user_id)
+                return
+            full = _pending.pop(user_id)
+
+
+def schedule_retrain(user_id, full=False):
+    """
+    Retrain in the background (one retrain per user at a time)
+
+    full=False folds in rows whose category or status changed since the
+    last training (new rows and corrections alike); full=True rebuilds the
+    model from every row. A request made while a retrain is running is
+    queued and runs right after it (a queued full retrain wins).
+    """
+    if not Config.ML_CATEGORIZER or not Config.ML_BACKGROUND_RETRAIN:
+        return False
+
+    with _lock:
+        if user_id in _retraining:
+            _pending[user_id] = _pending.get(user_id, False) or full
+            return True
+        _retraining.add(user_id)
+
+    threading.Thread(target=_retrain, args=(user_id, full), daemon=True).start()
+    return True
+
+
+def predict_categories(user_id, descriptions):
+    """
+    [(category, confidence)] per description, or None when the classifier
+    is disabled or the user has too little history yet
+    """
+    if not Config.ML_CATEGORIZER or not descriptions:
+        return None
+
+    model = get_model(user_id)
+    if model is None:
+        return None
+
+    return model.predict(descriptions)
@@ -0,0 +1,359 @@
+"""
+Recategorization Jobs
+Apply a category rule or correction to every session of a user in the
+background: one set-based UPDATE per chunk of sessions, progress stored in
+recategorization_jobs, metrics refreshed only for sessions that changed,
+and a cancel flag checked between chunks
+
+The job's session list and completed-chunk count are stored with it, so
+recover_jobs() can resume jobs whose process died from their last completed
+chunk, or fail them when Config.RECATEGORIZE_RESUME is off. A running job
+records its owner (host:pid) and refreshes heartbeat_at as it goes; only
+jobs whose heartbeat is older than Config.RECATEGORIZE_STALE_SECONDS are
+recovered, so a job still running in a sibling worker is never taken over.
+"""
+import os
+import socket
+import uuid
+import threading
+import time
+from datetime import datetime
+from app.config import Config
+from app.database.connection import get_db_connection
+from app.database.text_search import description_contains, contains_pattern
+
+SOURCES = ('BANK', 'SPLITWISE', 'BOTH')
+MATCH_TYPES = ('contains', 'exact', 'starts_with')
+FINISHED = ('completed', 'failed', 'cancelled')
+UNFINISHED = ('queued', 'resuming', 'running')
+
+TABLES = {
+    'BANK': 'bank_transactions',
+    'SPLITWISE': 'splitwise_transactions',
+}
+
+
+def _match_condition(match_type, pattern):
+    """(SQL condition, parameter) with the same semantics as the rule engine"""
+    if match_type == 'exact':
+        return "UPPER(description) = %s", pattern.upper()
+    if match_type == 'starts_with':
+        return description_contains(), contains_pattern(pattern)[1:]
+    return description_contains(), contains_pattern(pattern)
+
+
+def _update_sql(table, match_type):
+    # Transfers keep their transfer category; rows already right are skipped
+    condition, _ = _match_condition(match_type, '')
+    transfer_filter = "AND status != 'TRANSFER'" if table == 'bank_transactions' else ""
+    return f"""
+        UPDATE {table}
+        SET category = %s
+        WHERE user_id = %s
+          AND upload_session_id = ANY(%s)
+          AND {condition}
+          AND category IS DISTINCT FROM %s
+          {transfer_filter}
+        RETURNING upload_session_id
+    """
+
+
+def _set_job(cur, job_id, **fields):
+    assignments = ", ".join(f"{column} = %s" for column in fields)
+    cur.execute(
+        f"UPDATE recategorization_jobs SET {assignments} WHERE id = %s",
+        (*fields.values(), job_id)
+    )
+
+
+def _owner():
+    """This process, as recorded in recategorization_jobs.owner"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class OwnershipLost(Exception):
+    """The job was recovered by another process (our heartbeat went stale)"""
+
+
+def _heartbeat(cur, conn, job_id):
+    """Refresh the job's heartbeat and commit; returns cancel_requested"""
+    cur.execute("""
+        UPDATE recategorization_jobs
+        SET heartbeat_at = CURRENT_TIMESTAMP
+        WHERE id = %s AND owner = %s
+        RETURNING cancel_requested
+    """, (job_id, _owner()))
+    row = cur.fetchone()
+    conn.commit()
+
+    if row is None:
+        raise OwnershipLost(job_id)
+    return row[0]
+
+
+def start_job(user_id, pattern, category, source='BANK', match_type='contains'):
+    """Queue a cross-session recategorization and start it in the background; returns the job id"""
+    if source not in SOURCES:
+        raise ValueError(f"source must be one of {', '.join(SOURCES)}")
+    if match_type not in MATCH_TYPES:
+        raise ValueError(f"match_type must be one of {', '.join(MATCH_TYPES)}")
+    if not pattern or not pattern.strip():
+        raise ValueError("pattern must not be empty")
+
+    job_id = f"recat_{uuid.uuid4().hex[:12]}"
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO recategorization_jobs
+        (id, user_id, pattern, category, source, match_type, status, owner, heartbeat_at)
+        VALUES (%s, %s, %s, %s, %s, %s, 'queued', %s, CURRENT_TIMESTAMP)
+    """, (job_id, user_id, pattern, category, source, match_type, _owner()))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    thread = threading.Thread(target=run_job, args=(job_id,), daemon=True)
+    thread.start()
+    print(f"🔄 Recategorization job started: {job_id} ('{pattern}' → {category})")
+
+    return job_id
+
+
+def run_job(job_id):
+    """
+    Process a job chunk by chunk until done or cancelled
+
+    A job that already has a session list (recovered from a dead process)
+    resumes after its last completed chunk; metrics of sessions changed by
+    that chunk but not yet refreshed are refreshed first. The job must be
+    owned by this process; it stops quietly if another process takes it over.
+    """
+    from app.services.analytics import refresh_session_metrics
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    try:
+        cur.execute("""
+            SELECT user_id, pattern, category, source, match_type,
+                   session_ids, processed_sessions, updated_rows, pending_refresh
+            FROM recategorization_jobs
+            WHERE id = %s
+        """, (job_id,))
+        (user_id, pattern, category, source, match_type,
+         session_ids, processed, updated_rows, pending_refresh) = cur.fetchone()
+
+        if session_ids is None:
+            cur.execute("""
+                SELECT id FROM upload_sessions
+                WHERE user_id = %s
+                ORDER BY start_date DESC
+            """, (user_id,))
+            session_ids = [row[0] for row in cur.fetchall()]
+            processed, updated_rows = 0, 0
+
+            _set_job(
+                cur, job_id, status='running', started_at=datetime.now(),
+                total_sessions=len(session_ids), session_ids=session_ids
+            )
+            conn.commit()
+        else:
+            print(f"🔁 Resuming recategorization job {job_id} at session {processed}/{len(session_ids)}")
+            _set_job(cur, job_id, status='running')
+            conn.commit()
+
+            for session_id in pending_refresh or []:
+                refresh_session_metrics(session_id, user_id)
+                _heartbeat(cur, conn, job_id)
+            _set_job(cur, job_id, pending_refresh=[])
+            conn.commit()
+
+        tables = list(TABLES.values()) if source == 'BOTH' else [TABLES[source]]
+        _, parameter = _match_condition(match_type, pattern)
+        chunk_size = Config.RECATEGORIZE_CHUNK_SESSIONS
+        updated_rows = updated_rows or 0
+
+        for start in range(processed or 0, len(session_ids), chunk_size):
+            if _heartbeat(cur, conn, job_id):
+                _set_job(cur, job_id, status='cancelled', finished_at=datetime.now())
+                conn.commit()
+                print(f"⏹️  Recategorization job {job_id} cancelled")
+                return
+
+            chunk = session_ids[start:start + chunk_size]
+            changed_sessions = set()
+
+            for table in tables:
+                cur.execute(_update_sql(table, match_type), (category, user_id, chunk, parameter, category))
+                changed = [row[0] for row in cur.fetchall()]
+                updated_rows += len(changed)
+                changed_sessions.update(changed)
+
+            # The chunk's updates and its progress commit together
+            cur.execute("""
+                UPDATE recategorization_jobs
+                SET processed_sessions = %s,
+                    updated_rows = %s,
+                    affected_sessions = affected_sessions + %s,
+                    pending_refresh = %s
+                WHERE id = %s
+            """, (start + len(chunk), updated_rows, len(changed_sessions), sorted(changed_sessions), job_id))
+            conn.commit()
+
+            # Only sessions whose rows changed need new aggregates
+            for session_id in changed_sessions:
+                refresh_session_metrics(session_id, user_id)
+                _heartbeat(cur, conn, job_id)
+            _set_job(cur, job_id, pending_refresh=[])
+            conn.commit()
+
+        _set_job(cur, job_id, status='completed', finished_at=datetime.now())
+        conn.commit()
+        print(f"✅ Recategorization job {job_id} completed: {updated_rows} rows updated")
+
+        # Bank categories changed outside the normal flow: fold them into the model
+        if updated_rows and source in ('BANK', 'BOTH'):
+            from app.services.ml_categorizer import schedule_retrain
+            schedule_retrain(user_id)
+
+    except OwnershipLost:
+        conn.rollback()
+        print(f"⚠️ Recategorization job {job_id} was taken over by another process; stopping")
+
+    except Exception as e:
+        conn.rollback()
+        _set_job(cur, job_id, status='failed', error=str(e), finished_at=datetime.now())
+        conn.commit()
+        print(f"❌ Recategorization job {job_id} failed: {e}")
+
+    finally:
+        cur.close()
+        conn.close()
+
+
+def recover_jobs():
+    """
+    Pick up unfinished jobs whose owner stopped sending heartbeats
+
+    With Config.RECATEGORIZE_RESUME each job is claimed for this process and
+    resumed in the background from its last completed chunk; otherwise it
+    is marked failed. Jobs are claimed in one UPDATE, so two processes
+    recovering at the same time never both take a job. Returns the job ids.
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    stale = """
+        status IN %s
+        AND (heartbeat_at IS NULL OR heartbeat_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second')
+    """
+    if Config.RECATEGORIZE_RESUME:
+        cur.execute(f"""
+            UPDATE recategorization_jobs
+            SET status = 'resuming', owner = %s, heartbeat_at = CURRENT_TIMESTAMP
+            WHERE {stale}
+            RETURNING id
+        """, (_owner(), UNFINISHED, Config.RECATEGORIZE_STALE_SECONDS))
+    else:
+        cur.execute(f"""
+            UPDATE recategorization_jobs
+            SET status = 'failed', error = 'Interrupted: owner process stopped', finished_at = %s
+            WHERE {stale}
+            RETURNING id
+        """, (datetime.now(), UNFINISHED, Config.RECATEGORIZE_STALE_SECONDS))
+    job_ids = [row[0] for row in cur.fetchall()]
+
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    if not job_ids:
+        return []
+
+    if Config.RECATEGORIZE_RESUME:
+        for job_id in job_ids:
+            threading.Thread(target=run_job, args=(job_id,), daemon=True).start()
+        print(f"🔁 Resuming {len(job_ids)} interrupted recategorization job(s)")
+    else:
+        print(f"⚠️ Marked {len(job_ids)} interrupted recategorization job(s) as failed")
+
+    return job_ids
+
+
+def start_recovery_loop():
+    """
+    Run recover_jobs() now and then every RECATEGORIZE_STALE_SECONDS in a
+    daemon thread, so jobs of a worker that dies later are picked up too
+    """
+    def loop():
+        while True:
+            try:
+                recover_jobs()
+            except Exception as e:
+                print(f"⚠️ Could not recover recategorization jobs: {e}")
+            time.sleep(Config.RECATEGORIZE_STALE_SECONDS)
+
+    threading.Thread(target=loop, daemon=True).start()
+
+
+def get_job(job_id, user_id=None):
+    """Job status and progress as a dict, or None"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        SELECT id, user_id, pattern, category, source, match_type, status,
+               total_sessions, processed_sessions, affected_sessions, updated_rows,
+               cancel_requested, error, created_at, started_at, finished_at
+        FROM recategorization_jobs
+        WHERE id = %s
+    """, (job_id,))
+    row = cur.fetchone()
+    cur.close()
+    conn.close()
+
+    if not row or (user_id is not None and row[1] != user_id):
+        return None
+
+    total, processed = row[7], row[8]
+    return {
+        'job_id': row[0],
+        'user_id': row[1],
+        'pattern': row[2],
+        'category': row[3],
+        'source': row[4],
+        'match_type': row[5],
+        'status': row[6],
+        'total_sessions': total,
+        'processed_sessions': processed,
+        'affected_sessions': row[9],
+        'updated_rows': row[10],
+        'progress': round(processed / total, 4) if total else (1.0 if row[6] in FINISHED else 0.0),
+        'cancel_requested': row[11],
+        'error': row[12],
+        'created_at': row[13].isoformat() if row[13] else None,
+        'started_at': row[14].isoformat() if row[14] else None,
+        'finished_at': row[15].isoformat() if row[15] else None
+    }
+
+
+def cancel_job(job_id, user_id=None):
+    """Ask a running job to stop after its current chunk; False if unknown or already finished"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        UPDATE recategorization_jobs
+        SET cancel_requested = TRUE
+        WHERE id = %s
+          AND (%s IS NULL OR user_id = %s)
+          AND status NOT IN %s
+    """, (job_id, user_id, user_id, FINISHED))
+    requested = cur.rowcount > 0
+
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    return requested
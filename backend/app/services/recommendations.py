@@ -3,7 +3,7 @@ Recommendations Service
 Generates personalized financial recommendations
 """
 from app.database.connection import get_db_connection
-from app.services.analytics import get_category_breakdown
+from app.services.analytics import get_monthly_metrics
 from app.services.recurring_detection import get_recurring_summary
 import re
 
@@ -55,8 +55,8 @@ def get_category_comparison(session_id, user_id=1):
     print(f"🔍 DEBUG: Comparing {current_month} vs {prev_month}")  # DEBUG
     
     # Get category breakdowns
-    current_categories = get_category_breakdown(session_id, user_id)
-    prev_categories = get_category_breakdown(prev_session_id, user_id)
+    current_categories = get_monthly_metrics(session_id, user_id)['category_breakdown']
+    prev_categories = get_monthly_metrics(prev_session_id, user_id)['category_breakdown']
     
     print(f"🔍 DEBUG: Current categories: {len(current_categories)}")  # DEBUG
     print(f"🔍 DEBUG: Previous categories: {len(prev_categories)}")  # DEBUG
@@ -3,7 +3,7 @@ Recurring Expense Detection
 Detects subscription and recurring payment patterns
 """
 from app.database.connection import get_db_connection
-from collections import defaultdict
+from app.database.streaming import stream_rows
 from datetime import datetime, timedelta
 import re
 
@@ -39,12 +39,11 @@ def detect_recurring_expenses(user_id=1):
     Returns list of recurring subscriptions
     """
     conn = get_db_connection()
-    cur = conn.cursor()
     
     # Get all bank transactions (last 6 months for better detection)
     six_months_ago = (datetime.now() - timedelta(days=180)).strftime('%Y-%m-%d')
     
-    cur.execute("""
+    rows = stream_rows(conn, """
         SELECT 
             id, date, description, amount, category
         FROM bank_transactions
@@ -55,49 +54,54 @@ def detect_recurring_expenses(user_id=1):
         ORDER BY description, date
     """, (user_id, six_months_ago))
     
-    all_txns = cur.fetchall()
-    cur.close()
-    conn.close()
-    
-    # Group by merchant pattern
-    merchant_groups = defaultdict(list)
-    for txn_id, date, description, amount, category in all_txns:
+    # Group by merchant pattern, keeping only running aggregates per merchant
+    # (the average interval of date-sorted rows is (last - first) / (n - 1))
+    merchant_stats = {}
+    for txn_id, date, description, amount, category in rows:
         merchant = extract_merchant_pattern(description)
-        if merchant:
-            merchant_groups[merchant].append({
-                'id': txn_id,
-                'date': date,
-                'amount': abs(float(amount)),
-                'description': description,
+        if not merchant:
+            continue
+        
+        amount = abs(float(amount))
+        stats = merchant_stats.get(merchant)
+        
+        if stats is None:
+            merchant_stats[merchant] = {
+                'count': 1,
+                'first_date': date,
+                'last_date': date,
+                'total': amount,
+                'min_amount': amount,
+                'max_amount': amount,
                 'category': category
-            })
+            }
+            continue
+        
+        stats['count'] += 1
+        stats['total'] += amount
+        stats['min_amount'] = min(stats['min_amount'], amount)
+        stats['max_amount'] = max(stats['max_amount'], amount)
+        if date < stats['first_date']:
+            stats['first_date'] = date
+            stats['category'] = category
+        if date > stats['last_date']:
+            stats['last_date'] = date
+    
+    conn.close()
     
     # Detect recurring patterns
     recurring = []
     
-    for merchant, txns in merchant_groups.items():
-        if len(txns) < 3:  # Need at least 3 transactions
-            continue
-        
-        # Sort by date
-        txns.sort(key=lambda x: x['date'])
-        
-        # Calculate intervals between transactions
-        intervals = []
-        for i in range(1, len(txns)):
-            days = (txns[i]['date'] - txns[i-1]['date']).days
-            intervals.append(days)
-        
-        if not intervals:
+    for merchant, stats in merchant_stats.items():
+        if stats['count'] < 3:  # Need at least 3 transactions
             continue
         
         # Check if intervals are consistent (monthly = 28-32 days)
-        avg_interval = sum(intervals) / len(intervals)
+        avg_interval = (stats['last_date'] - stats['first_date']).days / (stats['count'] - 1)
         
         # Check amount consistency (±10% variation)
-        amounts = [t['amount'] for t in txns]
-        avg_amount = sum(amounts) / len(amounts)
-        amount_variance = max(amounts) - min(amounts)
+        avg_amount = stats['total'] / stats['count']
+        amount_variance = stats['max_amount'] - stats['min_amount']
         amount_variance_pct = (amount_variance / avg_amount) * 100 if avg_amount > 0 else 100
         
         # Determine if recurring
@@ -110,11 +114,11 @@ def detect_recurring_expenses(user_id=1):
                 'frequency': 'monthly',
                 'interval_days': round(avg_interval),
                 'average_amount': round(avg_amount, 2),
-                'transaction_count': len(txns),
-                'total_spent': sum(amounts),
-                'first_date': txns[0]['date'].isoformat(),
-                'last_date': txns[-1]['date'].isoformat(),
-                'category': txns[0]['category'] or 'Other'
+                'transaction_count': stats['count'],
+                'total_spent': stats['total'],
+                'first_date': stats['first_date'].isoformat(),
+                'last_date': stats['last_date'].isoformat(),
+                'category': stats['category'] or 'Other'
             })
     
     # Sort by average amount (highest first)
@@ -0,0 +1,294 @@
+"""
+Incremental Re-linker
+Re-links only the neighbourhood of changed transactions (late uploads,
+late Splitwise exports, edits) instead of rerunning the whole pipeline
+
+Changed rows that are already linked are re-checked first: an automatic
+1:1 link is re-scored with the linker's acceptance tiers and a subset group
+re-summed; links that no longer qualify are released and their rows are
+re-planned with the rest. Manual links and settlements are left alone.
+
+Neighbourhood of a changed row = unlinked rows on the other side whose
+amount is within ±1.00 and date within the linker's ±2 day window. Both
+lookups join against a VALUES list of the changed rows, so the work done
+scales with the number of changes, not with the session size.
+"""
+from psycopg2.extras import execute_values
+from app.config import Config
+from app.database.connection import get_db_connection
+from app.services.linker import (
+    BankCandidateIndex,
+    MAX_DATE_WINDOW,
+    plan_with_mode,
+    write_and_refresh
+)
+from app.services.link_assignment import score_pair
+from app.services.similarity import SimilarityScorer, LINKER_PROFILE
+from app.services.subset_linker import (
+    SPLIT_PAYMENT, COMBINED_PAYMENT, TOLERANCE_PAISE, DATE_WINDOW, to_paise
+)
+
+# Methods written by the 1:1 linkers (greedy passes, assignment mode)
+AUTO_PAIR_METHODS = ('Pass ', 'Assignment:')
+
+# Links touching the given rows, with both rows' current values
+LINKS_SQL = """
+    SELECT l.splitwise_id, l.bank_id, l.match_method,
+           s.date, s.total_cost, s.description,
+           b.date, b.amount, b.description
+    FROM transaction_links l
+    JOIN splitwise_transactions s ON s.id = l.splitwise_id
+    JOIN bank_transactions b ON b.id = l.bank_id
+    WHERE l.user_id = %s
+      AND (l.splitwise_id = ANY(%s) OR l.bank_id = ANY(%s))
+"""
+
+RELEASE_SPLITWISE_SQL = """
+    UPDATE splitwise_transactions
+    SET status = 'UNLINKED', linked_bank_id = NULL, match_confidence = NULL, match_method = NULL
+    WHERE user_id = %s AND id = ANY(%s) AND status = 'LINKED'
+"""
+
+RELEASE_BANK_SQL = """
+    UPDATE bank_transactions
+    SET status = 'UNLINKED', linked_splitwise_id = NULL, match_confidence = NULL, match_method = NULL
+    WHERE user_id = %s AND id = ANY(%s) AND status = 'LINKED'
+"""
+
+DELETE_LINKS_SQL = """
+    DELETE FROM transaction_links l
+    USING (VALUES %s) AS v (split_id, bank_id)
+    WHERE l.splitwise_id = v.split_id AND l.bank_id = v.bank_id
+"""
+
+CHANGED_SPLITWISE_SQL = """
+    SELECT id, date, total_cost, description
+    FROM splitwise_transactions
+    WHERE user_id = %s AND id = ANY(%s)
+      AND role = 'PAYER' AND status = 'UNLINKED'
+"""
+
+CHANGED_BANK_SQL = """
+    SELECT id, date, amount, description
+    FROM bank_transactions
+    WHERE user_id = %s AND id = ANY(%s)
+      AND status = 'UNLINKED'
+"""
+
+# Unlinked PAYER rows that could match any of the changed bank rows
+NEAR_BANK_SQL = """
+    SELECT DISTINCT s.id, s.date, s.total_cost, s.description
+    FROM splitwise_transactions s
+    JOIN unnest(%s::date[], %s::numeric[]) AS v (date, amount)
+      ON s.date BETWEEN v.date - %s AND v.date + %s
+     AND ABS(s.total_cost - v.amount) < 1.00
+    WHERE s.user_id = %s
+      AND s.role = 'PAYER'
+      AND s.status = 'UNLINKED'
+"""
+
+# Unlinked bank rows that could match any of the Splitwise rows being re-linked
+NEAR_SPLITWISE_SQL = """
+    SELECT DISTINCT b.id, b.date, b.amount, b.description
+    FROM bank_transactions b
+    JOIN unnest(%s::date[], %s::numeric[]) AS v (date, amount)
+      ON b.date BETWEEN v.date - %s AND v.date + %s
+     AND ABS(ABS(b.amount) - v.amount) < 1.00
+    WHERE b.user_id = %s
+      AND b.status = 'UNLINKED'
+"""
+
+def _neighbours(cur, sql, user_id, rows):
+    if not rows:
+        return []
+    window = int(MAX_DATE_WINDOW)
+    cur.execute(sql, (
+        [row[1] for row in rows], [abs(row[2]) for row in rows],
+        window, window, user_id
+    ))
+    return cur.fetchall()
+
+
+def _pair_qualifies(link, scorer):
+    """Would the 1:1 linker still accept this pair with its current values?"""
+    _, _, _, s_date, s_total, s_desc, b_date, b_amount, b_desc = link
+    if abs(abs(float(b_amount)) - float(s_total)) >= 1.00:
+        return False
+    return score_pair(s_date, b_date, scorer.score(b_desc, s_desc), 1) is not None
+
+
+def _group_qualifies(links, method):
+    """Does a subset group still sum to its hub row within tolerance and window?"""
+    if method == SPLIT_PAYMENT:
+        hub_paise, hub_date = to_paise(links[0][4]), links[0][3]
+        parts = {link[1]: (to_paise(link[7]), link[6]) for link in links}
+    else:
+        hub_paise, hub_date = to_paise(links[0][7]), links[0][6]
+        parts = {link[0]: (to_paise(link[4]), link[3]) for link in links}
+
+    total = sum(paise for paise, _ in parts.values())
+    return (
+        len(parts) >= 2
+        and abs(total - hub_paise) <= TOLERANCE_PAISE
+        and all(abs((day - hub_date).days) <= DATE_WINDOW for _, day in parts.values())
+    )
+
+
+def release_stale_links(cur, user_id, splitwise_ids, bank_ids):
+    """
+    Unlink changed rows whose links no longer qualify
+
+    Returns (released_pairs, kept_links): the (split_id, bank_id) pairs
+    removed, and how many links of changed rows were manual or settlements
+    and therefore not re-checked. The caller commits.
+    """
+    cur.execute(LINKS_SQL, (user_id, list(splitwise_ids), list(bank_ids)))
+    links = cur.fetchall()
+
+    # Subset links: re-check the whole group around its hub row
+    split_hubs = {link[0] for link in links if link[2] == SPLIT_PAYMENT}
+    bank_hubs = {link[1] for link in links if link[2] == COMBINED_PAYMENT}
+    groups = {}
+    if split_hubs or bank_hubs:
+        cur.execute(LINKS_SQL, (user_id, list(split_hubs), list(bank_hubs)))
+        for link in cur.fetchall():
+            if link[2] == SPLIT_PAYMENT and link[0] in split_hubs:
+                groups.setdefault((SPLIT_PAYMENT, link[0]), []).append(link)
+            elif link[2] == COMBINED_PAYMENT and link[1] in bank_hubs:
+                groups.setdefault((COMBINED_PAYMENT, link[1]), []).append(link)
+
+    scorer = SimilarityScorer(LINKER_PROFILE)
+    released, kept = [], 0
+
+    for link in links:
+        method = link[2] or ''
+        if method.startswith(AUTO_PAIR_METHODS):
+            if not _pair_qualifies(link, scorer):
+                released.append(link)
+        elif method not in (SPLIT_PAYMENT, COMBINED_PAYMENT):
+            kept += 1
+
+    for (method, _), group in groups.items():
+        if not _group_qualifies(group, method):
+            released.extend(group)
+
+    pairs = sorted({(link[0], link[1]) for link in released})
+    if pairs:
+        cur.execute(RELEASE_SPLITWISE_SQL, (user_id, sorted({p[0] for p in pairs})))
+        cur.execute(RELEASE_BANK_SQL, (user_id, sorted({p[1] for p in pairs})))
+        execute_values(cur, DELETE_LINKS_SQL, pairs, template="(%s::integer, %s::integer)", page_size=len(pairs))
+        for split_id, bank_id in pairs:
+            print(f"   ✂️  Released Split {split_id} <-> Bank {bank_id} (no longer matches)")
+
+    return pairs, kept
+
+
+def session_rows(session_id, user_id, splitwise_ids, bank_ids):
+    """The subset of the given ids that belong to this session and user"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        SELECT id FROM splitwise_transactions
+        WHERE upload_session_id = %s AND user_id = %s AND id = ANY(%s)
+    """, (session_id, user_id, list(splitwise_ids)))
+    splitwise_ids = [row[0] for row in cur.fetchall()]
+
+    cur.execute("""
+        SELECT id FROM bank_transactions
+        WHERE upload_session_id = %s AND user_id = %s AND id = ANY(%s)
+    """, (session_id, user_id, list(bank_ids)))
+    bank_ids = [row[0] for row in cur.fetchall()]
+
+    cur.close()
+    conn.close()
+
+    return sorted(splitwise_ids), sorted(bank_ids)
+
+
+def changed_since(session_id, since, user_id=1):
+    """Ids of rows added to a session after `since` (late uploads / exports)"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        SELECT id FROM splitwise_transactions
+        WHERE upload_session_id = %s AND user_id = %s AND created_at > %s
+    """, (session_id, user_id, since))
+    splitwise_ids = [row[0] for row in cur.fetchall()]
+
+    cur.execute("""
+        SELECT id FROM bank_transactions
+        WHERE upload_session_id = %s AND user_id = %s AND created_at > %s
+    """, (session_id, user_id, since))
+    bank_ids = [row[0] for row in cur.fetchall()]
+
+    cur.close()
+    conn.close()
+
+    return splitwise_ids, bank_ids
+
+
+def relink_changed(user_id=1, splitwise_ids=(), bank_ids=(), mode=None):
+    """
+    Re-run linking for the neighbourhood of the given changed rows
+
+    Links of changed rows that no longer qualify are released first (see
+    release_stale_links). Splitwise rows considered: the changed or
+    released rows now UNLINKED plus any unlinked PAYER rows near a changed,
+    unlinked bank row. Bank candidates: unlinked rows near those Splitwise
+    rows. Metrics are refreshed for every session the links touch.
+    Returns a summary dict.
+    """
+    mode = mode or Config.LINKER_MODE
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    print(f"🔄 Incremental re-link: {len(splitwise_ids)} Splitwise / {len(bank_ids)} bank rows changed")
+
+    released, kept = release_stale_links(cur, user_id, splitwise_ids, bank_ids)
+    conn.commit()
+
+    # Both sides of a released link are re-planned
+    split_ids = set(splitwise_ids) | {pair[0] for pair in released}
+    bank_ids_all = set(bank_ids) | {pair[1] for pair in released}
+
+    changed_splits = []
+    if split_ids:
+        cur.execute(CHANGED_SPLITWISE_SQL, (user_id, sorted(split_ids)))
+        changed_splits = cur.fetchall()
+
+    changed_banks = []
+    if bank_ids_all:
+        cur.execute(CHANGED_BANK_SQL, (user_id, sorted(bank_ids_all)))
+        changed_banks = cur.fetchall()
+
+    # Splitwise rows to (re)consider, in the linker's date order
+    splits = {row[0]: row for row in changed_splits}
+    for row in _neighbours(cur, NEAR_BANK_SQL, user_id, changed_banks):
+        splits.setdefault(row[0], row)
+    splitwise_txns = sorted(splits.values(), key=lambda r: (r[1], r[0]))
+
+    bank_rows = _neighbours(cur, NEAR_SPLITWISE_SQL, user_id, splitwise_txns)
+    cur.close()
+
+    print(f"🔍 Neighbourhood: {len(splitwise_txns)} Splitwise rows, {len(bank_rows)} bank candidates")
+
+    links = plan_with_mode(splitwise_txns, BankCandidateIndex(bank_rows), mode)
+
+    # session_id=None: refresh every session the new or released links touch, once
+    write_and_refresh(conn, links, None, user_id, released)
+    conn.close()
+
+    print(f"✅ Incremental re-link finished. Released: {len(released)}, new links: {len(links)}")
+
+    return {
+        'changed_splitwise': len(splitwise_ids),
+        'changed_bank': len(bank_ids),
+        'released_links': len(released),
+        'links_not_rechecked': kept,
+        'splitwise_considered': len(splitwise_txns),
+        'bank_candidates': len(bank_rows),
+        'links': len(links)
+    }
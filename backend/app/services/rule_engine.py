@@ -0,0 +1,181 @@
+"""
+Rule Engine
+Compiles a user's categorization rules once per source into combined
+matchers (one automaton for every 'contains' rule, hash lookups for
+'exact' and 'starts_with') and classifies whole sessions in one pass
+
+Priority is unchanged: the newest matching rule wins, whatever its type.
+Compiled rules are cached per (user, source); save_categorization_rule
+invalidates them and Config.RULE_CACHE_TTL bounds staleness across processes.
+"""
+import time
+import threading
+from app.config import Config
+from app.database.connection import get_db_connection
+from app.services.keyword_matcher import KeywordMatcher
+from app.services.category_writer import write_categories
+
+SOURCES = ('BANK', 'SPLITWISE')
+MATCH_TYPES = ('contains', 'exact', 'starts_with')
+
+_cache = {}
+_lock = threading.Lock()
+
+
+class CompiledRules:
+    """
+    rules: [(pattern, category, match_type)] newest first.
+    classify() returns the category of the first rule that matches.
+    """
+
+    def __init__(self, rules):
+        self.categories = []
+        self.rule_count = 0
+        self._always = None          # '' as contains / starts_with matches anything
+        contains = []
+        self._exact = {}
+        self._prefixes = {}          # {length: {prefix: rank}}
+
+        for pattern, category, match_type in rules:
+            if match_type not in MATCH_TYPES or pattern is None:
+                continue
+
+            rank = len(self.categories)
+            self.categories.append(category)
+            pattern = pattern.upper()
+
+            if match_type == 'exact':
+                self._exact.setdefault(pattern, rank)
+            elif not pattern:
+                if self._always is None:
+                    self._always = rank
+            elif match_type == 'contains':
+                contains.append((pattern, rank))
+            else:
+                self._prefixes.setdefault(len(pattern), {}).setdefault(pattern, rank)
+
+        self.rule_count = len(self.categories)
+        self._contains = KeywordMatcher(contains) if contains else None
+
+    def classify(self, description):
+        """Category of the highest-priority matching rule, or None"""
+        if description is None:
+            return None
+
+        text = description.upper()
+        best = self._always
+
+        def consider(rank):
+            nonlocal best
+            if rank is not None and (best is None or rank < best):
+                best = rank
+
+        consider(self._exact.get(text))
+        for length, prefixes in self._prefixes.items():
+            consider(prefixes.get(text[:length]))
+        if self._contains:
+            consider(self._contains.match(text))
+
+        return self.categories[best] if best is not None else None
+
+
+def load_rules(user_id, source):
+    """Rules for a source (including 'BOTH'), newest first"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        SELECT pattern, category, match_type
+        FROM user_categorization_rules
+        WHERE user_id = %s
+          AND (source = %s OR source = 'BOTH')
+        ORDER BY created_at DESC, id DESC
+    """, (user_id, source))
+
+    rules = cur.fetchall()
+    cur.close()
+    conn.close()
+
+    return rules
+
+
+def get_compiled_rules(user_id, source):
+    """Cached CompiledRules for (user, source), recompiled after TTL or invalidation"""
+    key = (user_id, source)
+    now = time.monotonic()
+
+    with _lock:
+        entry = _cache.get(key)
+        if entry and now - entry[0] < Config.RULE_CACHE_TTL:
+            return entry[1]
+
+    compiled = CompiledRules(load_rules(user_id, source))
+
+    with _lock:
+        _cache[key] = (now, compiled)
+
+    return compiled
+
+
+def invalidate_rules(user_id=None):
+    """Drop compiled rules for one user (or everyone)"""
+    with _lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            for key in [k for k in _cache if k[0] == user_id]:
+                del _cache[key]
+
+
+def classify_session(session_id, user_id=1):
+    """
+    Apply user rules to a session's uncategorized rows
+
+    One read per table, in-memory matching, one bulk UPDATE per table,
+    one commit. Returns (bank_categorized, splitwise_categorized).
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    cur.execute("""
+        SELECT id, description
+        FROM bank_transactions
+        WHERE upload_session_id = %s
+          AND user_id = %s
+          AND (category IS NULL OR category = 'Uncategorized')
+          AND status != 'TRANSFER'
+    """, (session_id, user_id))
+    bank_rows = cur.fetchall()
+
+    cur.execute("""
+        SELECT id, description
+        FROM splitwise_transactions
+        WHERE upload_session_id = %s
+          AND user_id = %s
+          AND (category IS NULL OR category = 'Uncategorized')
+    """, (session_id, user_id))
+    split_rows = cur.fetchall()
+
+    counts = []
+    for table, source, rows in (
+        ('bank_transactions', 'BANK', bank_rows),
+        ('splitwise_transactions', 'SPLITWISE', split_rows)
+    ):
+        compiled = get_compiled_rules(user_id, source) if rows else None
+        if not compiled or not compiled.rule_count:
+            counts.append(0)
+            continue
+
+        assignments = []
+        for txn_id, description in rows:
+            category = compiled.classify(description)
+            if category:
+                assignments.append((txn_id, category))
+
+        counts.append(write_categories(cur, table, assignments))
+
+    conn.commit()
+    cur.close()
+    conn.close()
+
+    return counts[0], counts[1]
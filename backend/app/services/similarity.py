@@ -0,0 +1,143 @@
+"""
+Description Similarity
+Shared scorer for linker, settlement detection and manual-link suggestions
+
+A SimilarityScorer lives for one run: each description is cleaned and
+tokenized once into a frozenset of interned token ids and pair scores are
+memoized. The character-level fallback is difflib's SequenceMatcher.ratio(),
+exactly as before, so the linker and settlement thresholds keep their
+meaning; one matcher is kept per second description so its index is built
+once and reused for every description compared against it.
+"""
+from collections import namedtuple
+from difflib import SequenceMatcher
+
+SimilarityProfile = namedtuple("SimilarityProfile", [
+    "noise_words",       # Substrings removed before comparing
+    "clean_other",       # Also strip noise from the second description
+    "strip",             # Trim surrounding whitespace before comparing
+    "empty_zero",        # Score 0.0 when either description is empty
+    "token_base",        # Score when at least one token is shared (None = no token rule)
+    "token_step",        # Added per shared token
+    "token_cap",         # Max shared tokens counted (None = no cap)
+    "shared_names",      # Names that score `name_score` when present in both
+    "name_score",
+])
+
+LINKER_PROFILE = SimilarityProfile(
+    noise_words=('upi', 'pos', 'txn', 'imps', 'neft', 'limited', 'private', 'ltd', 'pay for intent'),
+    clean_other=False,
+    strip=False,
+    empty_zero=False,
+    token_base=0.85,
+    token_step=0.05,
+    token_cap=None,
+    shared_names=(),
+    name_score=0.0,
+)
+
+MANUAL_PROFILE = SimilarityProfile(
+    noise_words=('upi', 'pos', 'txn', 'imps', 'neft', 'limited', 'private', 'ltd'),
+    clean_other=True,
+    strip=True,
+    empty_zero=True,
+    token_base=0.7,
+    token_step=0.1,
+    token_cap=3,
+    shared_names=(),
+    name_score=0.0,
+)
+
+SETTLEMENT_PROFILE = SimilarityProfile(
+    noise_words=(),
+    clean_other=False,
+    strip=False,
+    empty_zero=False,
+    token_base=None,
+    token_step=0.0,
+    token_cap=None,
+    shared_names=('daksh', 'rk', 'prathamesh', 'goyal'),
+    name_score=0.9,
+)
+
+
+class SimilarityScorer:
+    """Per-run description similarity with tokenization and pair caches"""
+
+    def __init__(self, profile=LINKER_PROFILE):
+        self.profile = profile
+        self._token_ids = {}
+        self._prepared = {}
+        self._scores = {}
+        self._matchers = {}
+
+    def _prepare(self, text, clean):
+        key = (text, clean)
+        prepared = self._prepared.get(key)
+        if prepared is not None:
+            return prepared
+
+        cleaned = text.lower()
+        if self.profile.strip:
+            cleaned = cleaned.strip()
+        if clean:
+            for noise in self.profile.noise_words:
+                cleaned = cleaned.replace(noise, '')
+
+        token_ids = self._token_ids
+        tokens = frozenset(token_ids.setdefault(t, len(token_ids)) for t in cleaned.split())
+
+        prepared = (cleaned, tokens)
+        self._prepared[key] = prepared
+        return prepared
+
+    def _ratio(self, cleaned, other_cleaned):
+        """SequenceMatcher(None, cleaned, other_cleaned).ratio(), reusing the index of other_cleaned"""
+        matcher = self._matchers.get(other_cleaned)
+        if matcher is None:
+            matcher = self._matchers[other_cleaned] = SequenceMatcher(None, b=other_cleaned)
+        matcher.set_seq1(cleaned)
+        return matcher.ratio()
+
+    def score(self, text, other):
+        """
+        Similarity of `text` (noise-stripped) against `other`
+
+        Argument order matters only for profiles with clean_other=False.
+        Without empty_zero, blank descriptions go through SequenceMatcher
+        like any other (two blanks score 1.0), as the linker and settlement
+        scorers always did; None counts as blank.
+        """
+        if not text or not other:
+            if self.profile.empty_zero:
+                return 0.0
+            text, other = text or '', other or ''
+
+        key = (text, other)
+        cached = self._scores.get(key)
+        if cached is not None:
+            return cached
+
+        profile = self.profile
+        cleaned, tokens = self._prepare(text, True)
+        other_cleaned, other_tokens = self._prepare(other, profile.clean_other)
+
+        result = None
+
+        for name in profile.shared_names:
+            if name in cleaned and name in other_cleaned:
+                result = profile.name_score
+                break
+
+        if result is None and profile.token_base is not None:
+            common = len(tokens & other_tokens)
+            if common:
+                if profile.token_cap is not None:
+                    common = min(common, profile.token_cap)
+                result = profile.token_base + profile.token_step * common
+
+        if result is None:
+            result = self._ratio(cleaned, other_cleaned)
+
+        self._scores[key] = result
+        return result
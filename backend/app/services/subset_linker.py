@@ -0,0 +1,254 @@
+"""
+Subset Linker
+One-to-many links for whatever the 1:1 linker left unlinked
+
+- Split payment: one Splitwise expense paid with several bank debits
+  (a dinner settled with two UPI transfers)
+- Combined payment: one bank debit covering several Splitwise expenses
+
+Each target gets at most MAX_CANDIDATES nearby rows; a meet-in-the-middle
+search over subsets of 2..MAX_PARTS rows finds every sum within ₹1 of the
+target. Both limits are hard, so the search never exceeds
+2 x 2^(MAX_CANDIDATES/2) partial sums per target.
+
+An amount match alone is weak evidence, so a group is only linked when
+exactly one subset fits and at least one of its parts shares a description
+with the target (MIN_SIMILARITY, the 1:1 linker's Pass 2 threshold).
+Targets with several fitting subsets are reported as ambiguous instead.
+"""
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+from itertools import combinations
+from app.database.connection import get_db_connection
+from app.services.link_writer import LinkWriter
+from app.services.similarity import SimilarityScorer, LINKER_PROFILE
+
+MAX_CANDIDATES = 16
+MAX_PARTS = 4
+DATE_WINDOW = 2
+TOLERANCE_PAISE = 99     # |sum - target| < ₹1.00, same as the 1:1 linker
+MIN_SIMILARITY = 0.3     # At least one part must describe the same payment
+MAX_ALTERNATIVES = 5     # Subsets listed for an ambiguous target
+
+# Ceiling per group size, scaled by the best part's description similarity
+CONFIDENCE_BY_PARTS = {2: 0.70, 3: 0.65, 4: 0.60}
+
+SPLIT_PAYMENT = "Subset: Split Payment"
+COMBINED_PAYMENT = "Subset: Combined Payment"
+
+
+def to_paise(amount):
+    return int(round(abs(float(amount)) * 100))
+
+
+def _subset_sums(items, max_parts):
+    """Every subset of items with at most max_parts members: [(sum, size, keys)]"""
+    sums = []
+    for size in range(0, min(max_parts, len(items)) + 1):
+        for combo in combinations(items, size):
+            sums.append((sum(paise for _, paise in combo), size, tuple(key for key, _ in combo)))
+    return sums
+
+
+def find_subsets(target_paise, items, max_parts=MAX_PARTS):
+    """
+    Every subset of 2..max_parts items whose paise sum is within tolerance of target
+
+    items: [(key, paise)], at most MAX_CANDIDATES, in preference order.
+    Returns [keys], fewest parts first, then the closest sum, then earlier
+    items. Each subset appears once (its split into halves is unique).
+    """
+    items = items[:MAX_CANDIDATES]
+    half = len(items) // 2
+    left = _subset_sums(items[:half], max_parts)
+    right = sorted(_subset_sums(items[half:], max_parts))
+    right_sums = [r[0] for r in right]
+    order = {key: i for i, (key, _) in enumerate(items)}
+
+    found = []
+    for l_sum, l_size, l_keys in left:
+        lo = target_paise - TOLERANCE_PAISE - l_sum
+        hi = target_paise + TOLERANCE_PAISE - l_sum
+
+        i = bisect_left(right_sums, lo)
+        while i < len(right) and right_sums[i] <= hi:
+            r_sum, r_size, r_keys = right[i]
+            i += 1
+
+            size = l_size + r_size
+            if size < 2 or size > max_parts:
+                continue
+
+            keys = l_keys + r_keys
+            found.append(((size, abs(l_sum + r_sum - target_paise), sorted(order[k] for k in keys)), list(keys)))
+
+    found.sort()
+    return [keys for _, keys in found]
+
+
+def find_subset(target_paise, items, max_parts=MAX_PARTS):
+    """The preferred fitting subset (see find_subsets), or None"""
+    subsets = find_subsets(target_paise, items, max_parts)
+    return subsets[0] if subsets else None
+
+
+def _by_date(rows):
+    index = defaultdict(list)
+    for row in rows:
+        index[row[1]].append(row)
+    return index
+
+
+def _nearby(index, target_date, claimed, max_paise, paise_of):
+    """Unclaimed rows within DATE_WINDOW days, nearest first, smaller than the target"""
+    found = []
+    for offset in range(-DATE_WINDOW, DATE_WINDOW + 1):
+        for row in index.get(target_date + timedelta(days=offset), ()):
+            paise = paise_of(row)
+            if row[0] not in claimed and 0 < paise < max_paise:
+                found.append((abs(offset), row[0], paise))
+    found.sort()
+    return [(key, paise) for _, key, paise in found[:MAX_CANDIDATES]]
+
+
+def _decide(subsets, similarity_of):
+    """
+    (keys, confidence) for the only fitting subset if a part's description
+    matches the target; (None, None) otherwise
+
+    similarity_of(key): description similarity of that part to the target
+    """
+    if len(subsets) != 1:
+        return None, None
+
+    keys = subsets[0]
+    similarity = max(similarity_of(key) for key in keys)
+    if similarity < MIN_SIMILARITY:
+        return None, None
+
+    return keys, round(CONFIDENCE_BY_PARTS[len(keys)] * min(similarity, 1.0), 2)
+
+
+def plan_subset_links(splitwise_txns, bank_rows, scorer=None):
+    """
+    Plan one-to-many links
+
+    splitwise_txns: unlinked PAYER rows (id, date, total_cost, description)
+    bank_rows: unlinked debits (id, date, amount, description)
+    Returns (groups, ambiguous):
+    - groups: [(allocations, confidence, method)] where allocations is
+      [(split_id, bank_id, amount)], ready for LinkWriter.link_group()
+    - ambiguous: [{'method', 'splitwise_id' or 'bank_id', 'fitting_subsets',
+      'subsets'}] for targets that several subsets fit; nothing is linked for them
+    """
+    scorer = scorer or SimilarityScorer(LINKER_PROFILE)
+    groups, ambiguous = [], []
+    claimed_splits, claimed_banks = set(), set()
+    banks_by_date = _by_date(bank_rows)
+    splits_by_date = _by_date(splitwise_txns)
+    bank_paise = {row[0]: to_paise(row[2]) for row in bank_rows}
+    split_paise = {row[0]: to_paise(row[2]) for row in splitwise_txns}
+    bank_desc = {row[0]: row[3] for row in bank_rows}
+    split_desc = {row[0]: row[3] for row in splitwise_txns}
+
+    # One Splitwise expense <- several bank debits
+    for s_id, s_date, s_total, s_text in sorted(splitwise_txns, key=lambda r: (r[1], r[0])):
+        target = split_paise[s_id]
+        candidates = _nearby(banks_by_date, s_date, claimed_banks, target + TOLERANCE_PAISE, lambda r: bank_paise[r[0]])
+        subsets = find_subsets(target, candidates)
+        if len(subsets) > 1:
+            ambiguous.append({
+                'method': SPLIT_PAYMENT, 'splitwise_id': s_id,
+                'fitting_subsets': len(subsets), 'subsets': subsets[:MAX_ALTERNATIVES]
+            })
+            continue
+
+        bank_ids, confidence = _decide(subsets, lambda b_id: scorer.score(bank_desc[b_id], s_text))
+        if not bank_ids:
+            continue
+
+        claimed_splits.add(s_id)
+        claimed_banks.update(bank_ids)
+        groups.append((
+            [(s_id, b_id, bank_paise[b_id] / 100) for b_id in bank_ids],
+            confidence,
+            SPLIT_PAYMENT
+        ))
+
+    # One bank debit -> several Splitwise expenses
+    for b_id, b_date, _, b_text in sorted(bank_rows, key=lambda r: (r[1], r[0])):
+        if b_id in claimed_banks:
+            continue
+
+        target = bank_paise[b_id]
+        candidates = _nearby(splits_by_date, b_date, claimed_splits, target + TOLERANCE_PAISE, lambda r: split_paise[r[0]])
+        subsets = find_subsets(target, candidates)
+        if len(subsets) > 1:
+            ambiguous.append({
+                'method': COMBINED_PAYMENT, 'bank_id': b_id,
+                'fitting_subsets': len(subsets), 'subsets': subsets[:MAX_ALTERNATIVES]
+            })
+            continue
+
+        split_ids, confidence = _decide(subsets, lambda s_id: scorer.score(b_text, split_desc[s_id]))
+        if not split_ids:
+            continue
+
+        claimed_banks.add(b_id)
+        claimed_splits.update(split_ids)
+        groups.append((
+            [(s_id, b_id, split_paise[s_id] / 100) for s_id in split_ids],
+            confidence,
+            COMBINED_PAYMENT
+        ))
+
+    return groups, ambiguous
+
+
+def run_subset_linker(user_id=1, session_id=None):
+    """Link this session's leftover Splitwise PAYER rows one-to-many"""
+    from app.services.linker import load_bank_candidates, refresh_other_sessions
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    print("\n🧩 Subset Linker: split and combined payments...")
+
+    cur.execute("""
+        SELECT id, date, total_cost, description
+        FROM splitwise_transactions
+        WHERE user_id = %s
+          AND upload_session_id = %s
+          AND role = 'PAYER'
+          AND status = 'UNLINKED'
+        ORDER BY date, id
+    """, (user_id, session_id))
+    splitwise_txns = cur.fetchall()
+
+    bank_rows = [row for row in load_bank_candidates(cur, user_id, splitwise_txns) if row[2] < 0]
+    cur.close()
+
+    groups, ambiguous = plan_subset_links(splitwise_txns, bank_rows)
+
+    for entry in ambiguous:
+        target = f"Split {entry['splitwise_id']}" if 'splitwise_id' in entry else f"Bank {entry['bank_id']}"
+        print(f"   ⚠️  {entry['method']}: {target} ambiguous, {entry['fitting_subsets']} subsets fit - not linked")
+
+    writer = LinkWriter(conn)
+    for allocations, confidence, method in groups:
+        writer.link_group(allocations, confidence, method)
+        print(f"   🔗 {method}: Split {sorted({a[0] for a in allocations})} <-> Bank {sorted({a[1] for a in allocations})} ({confidence:.0%})")
+    linked = writer.flush()
+
+    refresh_other_sessions(
+        conn,
+        [a[0] for allocations, _, _ in groups for a in allocations],
+        [a[1] for allocations, _, _ in groups for a in allocations],
+        session_id, user_id
+    )
+
+    print(f"✅ Subset Linker finished. Groups linked: {linked}, ambiguous: {len(ambiguous)}")
+    conn.close()
+
+    return linked
@@ -0,0 +1,77 @@
+"""
+Transfer Patterns
+Narration patterns that mark a bank row as non-spending (investments,
+credit card bills, savings, self transfers), stored in the
+transfer_patterns table and compiled into one KeywordMatcher per user
+
+Rows with user_id NULL apply to everyone; a user's own rows are added to
+them. Lower priority wins; reset_schema seeds DEFAULT_TRANSFER_PATTERNS.
+"""
+import time
+import threading
+from app.config import Config
+from app.services.keyword_matcher import KeywordMatcher
+
+# (transfer_type, pattern) in priority order
+DEFAULT_TRANSFER_PATTERNS = [
+    ('Investment', 'ZERODHA'),
+    ('Investment', 'GROWW'),
+    ('Investment', 'UPSTOX'),
+    ('Investment', 'KUVERA'),
+    ('Investment', 'COIN'),
+    ('Investment', 'SMALLCASE'),
+    ('Credit Card', 'CREDIT CARD'),
+    ('Credit Card', 'CC PAYMENT'),
+    ('Credit Card', 'CRED'),
+    ('Credit Card', 'CARD BILL'),
+    ('Savings', 'TO SAVINGS'),
+    ('Savings', 'FIXED DEPOSIT'),
+    ('Savings', 'FD '),
+    ('Savings', 'RD '),
+    ('Self Transfer', 'SELF TRANSFER'),
+    ('Self Transfer', 'OWN ACCOUNT'),
+]
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def load_transfer_patterns(cur, user_id):
+    """[(transfer_type, pattern)] for a user, highest priority first"""
+    cur.execute("""
+        SELECT transfer_type, pattern
+        FROM transfer_patterns
+        WHERE active
+          AND (user_id IS NULL OR user_id = %s)
+        ORDER BY priority, id
+    """, (user_id,))
+    return cur.fetchall()
+
+
+def get_transfer_matcher(cur, user_id):
+    """
+    Cached KeywordMatcher whose match_keyword() returns (pattern, transfer_type)
+    Reloaded after Config.RULE_CACHE_TTL seconds
+    """
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(user_id)
+        if entry and now - entry[0] < Config.RULE_CACHE_TTL:
+            return entry[1]
+
+    patterns = load_transfer_patterns(cur, user_id)
+    matcher = KeywordMatcher([(pattern, transfer_type) for transfer_type, pattern in patterns])
+
+    with _lock:
+        _cache[user_id] = (now, matcher)
+
+    return matcher
+
+
+def invalidate_transfer_patterns(user_id=None):
+    """Drop cached matchers after editing transfer_patterns"""
+    with _lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
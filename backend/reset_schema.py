@@ -3,7 +3,9 @@
 Reset database schema - Drop all tables and create fresh ones
 """
 import psycopg2
+from psycopg2.extras import execute_values
 from app.database.connection import DB_CONFIG
+from app.services.transfer_patterns import DEFAULT_TRANSFER_PATTERNS
 
 def reset_schema():
     """Drop all tables and recreate with new schema"""
@@ -18,6 +20,12 @@ def reset_schema():
     
     # Drop old tables (order matters - FK constraints)
     tables_to_drop = [
+        "transaction_links",
+        "recategorization_jobs",
+        "categorization_profiles",
+        "merchant_category_memory",
+        "transfer_patterns",
+        "session_metrics",
         "bank_transactions", 
         "splitwise_transactions",
         "user_categorization_rules",
@@ -67,6 +75,93 @@ def reset_schema():
         )
     """)
     print("   ✅ Created user_categorization_rules")
+
+    # Create merchant_category_memory table (merchant -> category learned across sessions)
+    # source: 'correction' (manual, wins) or 'auto' (learned from keyword matches)
+    # pending_*: a different auto category seen since, adopted once it recurs
+    cur.execute("""
+        CREATE TABLE merchant_category_memory (
+            user_id INTEGER NOT NULL,
+            merchant_key VARCHAR(100) NOT NULL,
+            category VARCHAR(100) NOT NULL,
+            source VARCHAR(20) NOT NULL DEFAULT 'auto',
+            hits INTEGER NOT NULL DEFAULT 1,
+            pending_category VARCHAR(100),
+            pending_hits INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, merchant_key)
+        )
+    """)
+    print("   ✅ Created merchant_category_memory")
+
+    # Create transfer_patterns table (narrations that mark non-spending rows)
+    # user_id NULL = applies to every user; lower priority wins
+    cur.execute("""
+        CREATE TABLE transfer_patterns (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER,
+            transfer_type VARCHAR(50) NOT NULL,
+            pattern VARCHAR(100) NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 100,
+            active BOOLEAN NOT NULL DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    execute_values(cur, """
+        INSERT INTO transfer_patterns (transfer_type, pattern, priority) VALUES %s
+    """, [(transfer_type, pattern, i) for i, (transfer_type, pattern) in enumerate(DEFAULT_TRANSFER_PATTERNS)])
+    print(f"   ✅ Created transfer_patterns ({len(DEFAULT_TRANSFER_PATTERNS)} default patterns)")
+
+    # Create recategorization_jobs table (background cross-session recategorize)
+    # session_ids: sessions to process, in order (processed_sessions = done prefix)
+    # pending_refresh: sessions changed by the last chunk whose metrics are not refreshed yet
+    # owner/heartbeat_at: process running the job and its last sign of life
+    cur.execute("""
+        CREATE TABLE recategorization_jobs (
+            id VARCHAR(50) PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            pattern VARCHAR(200) NOT NULL,
+            category VARCHAR(100) NOT NULL,
+            source VARCHAR(20) NOT NULL DEFAULT 'BANK',
+            match_type VARCHAR(50) NOT NULL DEFAULT 'contains',
+            status VARCHAR(20) NOT NULL DEFAULT 'queued',
+            total_sessions INTEGER DEFAULT 0,
+            processed_sessions INTEGER DEFAULT 0,
+            affected_sessions INTEGER DEFAULT 0,
+            updated_rows INTEGER DEFAULT 0,
+            session_ids TEXT[],
+            pending_refresh TEXT[],
+            owner VARCHAR(100),
+            heartbeat_at TIMESTAMP,
+            cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    """)
+    print("   ✅ Created recategorization_jobs")
+
+    # Create categorization_profiles table (one row per stage per profiled run)
+    cur.execute("""
+        CREATE TABLE categorization_profiles (
+            id SERIAL PRIMARY KEY,
+            run_id VARCHAR(50) NOT NULL,
+            session_id VARCHAR(50),
+            user_id INTEGER NOT NULL,
+            pipeline VARCHAR(50) NOT NULL,
+            stage VARCHAR(50) NOT NULL,
+            stage_order INTEGER NOT NULL,
+            wall_ms REAL NOT NULL,
+            db_ms REAL NOT NULL,
+            statements INTEGER NOT NULL DEFAULT 0,
+            rows_scanned INTEGER NOT NULL DEFAULT 0,
+            rows_updated INTEGER NOT NULL DEFAULT 0,
+            detail JSONB,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    print("   ✅ Created categorization_profiles")
     
     # Create splitwise_transactions table (first, because bank references it)
     cur.execute("""
@@ -105,6 +200,7 @@ def reset_schema():
             amount NUMERIC(10, 2) NOT NULL,
             description TEXT,
             category VARCHAR(100) DEFAULT 'Uncategorized',
+            merchant_key VARCHAR(100),
             
             status VARCHAR(50) DEFAULT 'UNLINKED',
             linked_splitwise_id INTEGER,
@@ -112,12 +208,32 @@ def reset_schema():
             match_method VARCHAR(50),
             
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            label_updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
             
             FOREIGN KEY (linked_splitwise_id) REFERENCES splitwise_transactions(id) ON DELETE SET NULL
         )
     """)
     print("   ✅ Created bank_transactions")
     
+    # label_updated_at follows every category/status change, whichever code
+    # path writes it (the ML categorizer trains on rows changed since its last run)
+    cur.execute("""
+        CREATE OR REPLACE FUNCTION touch_label_updated_at() RETURNS trigger AS $$
+        BEGIN
+            NEW.label_updated_at := CURRENT_TIMESTAMP;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    cur.execute("""
+        CREATE TRIGGER trg_bank_label_updated
+        BEFORE UPDATE OF category, status ON bank_transactions
+        FOR EACH ROW
+        WHEN (OLD.category IS DISTINCT FROM NEW.category OR OLD.status IS DISTINCT FROM NEW.status)
+        EXECUTE FUNCTION touch_label_updated_at()
+    """)
+    print("   ✅ Created bank_transactions label trigger")
+    
     # Add FK from splitwise to bank (circular reference, so added after both tables exist)
     cur.execute("""
         ALTER TABLE splitwise_transactions
@@ -126,10 +242,48 @@ def reset_schema():
     """)
     print("   ✅ Added foreign key constraints")
     
+    # Create transaction_links table (every Splitwise <-> bank link, incl. one-to-many)
+    # linked_bank_id / linked_splitwise_id keep the primary counterpart for 1:1 readers
+    cur.execute("""
+        CREATE TABLE transaction_links (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            splitwise_id INTEGER NOT NULL REFERENCES splitwise_transactions(id) ON DELETE CASCADE,
+            bank_id INTEGER NOT NULL REFERENCES bank_transactions(id) ON DELETE CASCADE,
+            amount NUMERIC(10, 2),
+            match_confidence NUMERIC(3, 2),
+            match_method VARCHAR(50),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (splitwise_id, bank_id)
+        )
+    """)
+    print("   ✅ Created transaction_links")
+    
+    # Create session_metrics table (per-session analytics snapshot)
+    cur.execute("""
+        CREATE TABLE session_metrics (
+            session_id VARCHAR(50) PRIMARY KEY REFERENCES upload_sessions(id) ON DELETE CASCADE,
+            user_id INTEGER NOT NULL,
+            net_consumption JSONB NOT NULL,
+            cash_outflow NUMERIC(12, 2) NOT NULL,
+            monthly_float NUMERIC(12, 2) NOT NULL,
+            category_breakdown JSONB NOT NULL,
+            transaction_stats JSONB NOT NULL,
+            unlinked_payer JSONB NOT NULL,
+            spending_days INTEGER NOT NULL DEFAULT 0,
+            computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    print("   ✅ Created session_metrics")
+    
     print("\n" + "="*60)
     print("📊 CREATING INDEXES")
     print("="*60)
     
+    # Trigram support for UPPER(description) LIKE '%X%' substring searches
+    cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    print("   ✅ Enabled pg_trgm extension")
+    
     # Bank transaction indexes
     bank_indexes = [
         "CREATE INDEX idx_bank_user_session ON bank_transactions(user_id, upload_session_id)",
@@ -137,7 +291,11 @@ def reset_schema():
         "CREATE INDEX idx_bank_status ON bank_transactions(status)",
         "CREATE INDEX idx_bank_amount ON bank_transactions(amount) WHERE amount < 0",
         "CREATE INDEX idx_bank_category ON bank_transactions(category)",
-        "CREATE INDEX idx_bank_linked_splitwise ON bank_transactions(linked_splitwise_id) WHERE linked_splitwise_id IS NOT NULL"
+        "CREATE INDEX idx_bank_linked_splitwise ON bank_transactions(linked_splitwise_id) WHERE linked_splitwise_id IS NOT NULL",
+        "CREATE INDEX idx_bank_description_trgm ON bank_transactions USING gin (UPPER(description) gin_trgm_ops)",
+        "CREATE INDEX idx_bank_unlinked_user_date ON bank_transactions(user_id, date) WHERE status = 'UNLINKED'",
+        "CREATE INDEX idx_bank_user_merchant ON bank_transactions(user_id, merchant_key) WHERE merchant_key IS NOT NULL",
+        "CREATE INDEX idx_bank_user_label_updated ON bank_transactions(user_id, label_updated_at)"
     ]
     
     for idx_sql in bank_indexes:
@@ -151,7 +309,9 @@ def reset_schema():
         "CREATE INDEX idx_split_status ON splitwise_transactions(status)",
         "CREATE INDEX idx_split_role ON splitwise_transactions(role)",
         "CREATE INDEX idx_split_category ON splitwise_transactions(category)",
-        "CREATE INDEX idx_split_linked_bank ON splitwise_transactions(linked_bank_id) WHERE linked_bank_id IS NOT NULL"
+        "CREATE INDEX idx_split_linked_bank ON splitwise_transactions(linked_bank_id) WHERE linked_bank_id IS NOT NULL",
+        "CREATE INDEX idx_split_description_trgm ON splitwise_transactions USING gin (UPPER(description) gin_trgm_ops)",
+        "CREATE INDEX idx_split_unlinked_payer_date ON splitwise_transactions(user_id, date) WHERE status = 'UNLINKED' AND role = 'PAYER'"
     ]
     
     for idx_sql in split_indexes:
@@ -168,6 +328,18 @@ def reset_schema():
     cur.execute("CREATE INDEX idx_rules_pattern ON user_categorization_rules(pattern)")
     print("   ✅ Created user_categorization_rules indexes")
     
+    # Transaction links indexes (UNIQUE already covers splitwise_id lookups)
+    cur.execute("CREATE INDEX idx_links_bank ON transaction_links(bank_id)")
+    print("   ✅ Created transaction_links indexes")
+
+    # Recategorization jobs indexes
+    cur.execute("CREATE INDEX idx_recat_jobs_user_created ON recategorization_jobs(user_id, created_at)")
+    print("   ✅ Created recategorization_jobs indexes")
+
+    # Categorization profiles indexes
+    cur.execute("CREATE INDEX idx_cat_profiles_session ON categorization_profiles(session_id, created_at)")
+    print("   ✅ Created categorization_profiles indexes")
+    
     print("\n" + "="*60)
     print("✅ SCHEMA RESET COMPLETE!")
     print("="*60)
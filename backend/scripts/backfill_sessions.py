@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Backfill many months at once
+
+Runs the analysis pipeline for already-ingested sessions in parallel waves
+(adjacent months never run at the same time) and prints per-session timing.
+
+Usage: python scripts/backfill_sessions.py [session_id ...] [--workers N] [--user U]
+       (no session ids = every session still in 'processing')
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.backfill import run_backfill
+
+
+def main():
+    args = sys.argv[1:]
+    workers, user_id = None, 1
+
+    if '--workers' in args:
+        i = args.index('--workers')
+        workers = int(args[i + 1])
+        del args[i:i + 2]
+    if '--user' in args:
+        i = args.index('--user')
+        user_id = int(args[i + 1])
+        del args[i:i + 2]
+
+    report = run_backfill(user_id, args or None, workers)
+
+    print("\n📊 PER-SESSION TIMING")
+    print("=" * 70)
+    print(f"{'month':8} | {'session':22} | {'seconds':>8} | {'txns':>6} | {'txn/s':>7}")
+    print("-" * 70)
+    for r in report['sessions']:
+        print(
+            f"{r['month']:8} | {r['session_id']:22} | {r['seconds']:>8.1f} | "
+            f"{r['transactions']:>6} | {r['transactions_per_second']:>7.0f}"
+            + (f"  ❌ {r['error']}" if r['error'] else "")
+        )
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Benchmark description substring search as history grows
+
+Builds a scratch table with the same UPPER(description) trigram index as
+bank_transactions, grows it from 10k to 5M rows and times the query shapes
+used by categorization, the similar-transaction preview and the chatbot
+keyword filter, with and without the trigram index.
+
+Usage: python scripts/benchmark_description_search.py [size ...] [--keep]
+"""
+import sys
+import os
+import time
+import statistics
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.database.connection import get_db_connection
+from app.database.text_search import description_contains, contains_pattern
+
+TABLE = "bench_description_search"
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 5_000_000]
+USER_ID = 1
+CURRENT_SESSION = "session_bench_current"
+NEEDLE = "BENCHNEEDLE CAFE"   # Fixed number of rows, independent of history size
+NEEDLE_ROWS = 50
+SESSION_ROWS = 300
+RUNS = 5
+
+MERCHANTS = [
+    'SWIGGY', 'ZOMATO', 'UBER', 'OLA', 'AMAZON', 'FLIPKART', 'BLINKIT',
+    'ZEPTO', 'NETFLIX', 'AIRTEL', 'APOLLO', 'IRCTC', 'DMART', 'MYNTRA'
+]
+
+QUERIES = {
+    'history keyword (chatbot)': (
+        f"SELECT COUNT(*) FROM {TABLE} WHERE user_id = %s AND {description_contains()}",
+        lambda: (USER_ID, contains_pattern(NEEDLE))
+    ),
+    'session pattern (similar-count)': (
+        f"SELECT COUNT(*) FROM {TABLE} WHERE upload_session_id = %s AND user_id = %s AND {description_contains()}",
+        lambda: (CURRENT_SESSION, USER_ID, contains_pattern('SWIGGY'))
+    ),
+}
+
+
+def setup_table(cur):
+    cur.execute(f"DROP TABLE IF EXISTS {TABLE}")
+    cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    cur.execute(f"""
+        CREATE TABLE {TABLE} (
+            id BIGSERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            upload_session_id VARCHAR(50) NOT NULL,
+            description TEXT
+        )
+    """)
+    cur.execute(f"CREATE INDEX idx_{TABLE}_user_session ON {TABLE}(user_id, upload_session_id)")
+    cur.execute(f"CREATE INDEX idx_{TABLE}_trgm ON {TABLE} USING gin (UPPER(description) gin_trgm_ops)")
+
+    # Rows whose count must stay constant as history grows
+    cur.execute(f"""
+        INSERT INTO {TABLE} (user_id, upload_session_id, description)
+        SELECT %s, 'session_bench_old', %s || ' ' || g
+        FROM generate_series(1, %s) g
+    """, (USER_ID, NEEDLE, NEEDLE_ROWS))
+    cur.execute(f"""
+        INSERT INTO {TABLE} (user_id, upload_session_id, description)
+        SELECT %s, %s, (%s::text[])[1 + (g %% %s)] || '-' || substr(md5(g::text), 1, 10)
+        FROM generate_series(1, %s) g
+    """, (USER_ID, CURRENT_SESSION, MERCHANTS, len(MERCHANTS), SESSION_ROWS))
+
+
+def grow_to(cur, target):
+    cur.execute(f"SELECT COUNT(*) FROM {TABLE}")
+    current = cur.fetchone()[0]
+    if current >= target:
+        return
+
+    # Older months: one session per 1,000 rows, random merchant + reference noise
+    cur.execute(f"""
+        INSERT INTO {TABLE} (user_id, upload_session_id, description)
+        SELECT
+            %s,
+            'session_bench_' || (g / 1000),
+            'UPI-' || (%s::text[])[1 + floor(random() * %s)::int] || '-' || substr(md5(random()::text), 1, 12)
+        FROM generate_series(%s, %s) g
+    """, (USER_ID, MERCHANTS, len(MERCHANTS), current + 1, target))
+    cur.execute(f"ANALYZE {TABLE}")
+
+
+def time_query(cur, sql, params):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        cur.execute(sql, params)
+        cur.fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def uses_trigram_index(cur, sql, params):
+    cur.execute("EXPLAIN " + sql, params)
+    plan = "\n".join(row[0] for row in cur.fetchall())
+    return f"idx_{TABLE}_trgm" in plan
+
+
+def run_benchmark(sizes, keep=False):
+    conn = get_db_connection()
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    print("\n📊 DESCRIPTION SEARCH BENCHMARK")
+    print("=" * 78)
+
+    setup_table(cur)
+
+    print(f"{'rows':>10} | {'query':32} | {'trgm ms':>8} | {'no-idx ms':>9} | index")
+    print("-" * 78)
+
+    for size in sizes:
+        grow_to(cur, size)
+
+        for name, (sql, make_params) in QUERIES.items():
+            params = make_params()
+
+            indexed_ms = time_query(cur, sql, params)
+            used_index = uses_trigram_index(cur, sql, params)
+
+            cur.execute("SET enable_bitmapscan = off")
+            cur.execute("SET enable_indexscan = off")
+            seq_ms = time_query(cur, sql, params)
+            cur.execute("RESET enable_bitmapscan")
+            cur.execute("RESET enable_indexscan")
+
+            print(f"{size:>10,} | {name:32} | {indexed_ms:>8.2f} | {seq_ms:>9.2f} | {'✅' if used_index else '—'}")
+
+    if not keep:
+        cur.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+    cur.close()
+    conn.close()
+
+    print("=" * 78)
+    print("✅ Benchmark complete")
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    sizes = [int(a) for a in args] if args else DEFAULT_SIZES
+    run_benchmark(sorted(sizes), keep='--keep' in sys.argv)
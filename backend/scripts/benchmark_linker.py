@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Benchmark: linker scalability against a real database
+
+Generates paired bank / Splitwise history with known ground-truth links,
+loads it into the configured Postgres under a throwaway user, runs
+settlement detection and the linker for every month, and reports wall
+time, queries issued, precision and recall per dataset size.
+
+Synthetic noise (on top of benchmark_linker_assignment.synthetic_month):
+posting delays of 0-2 days, paise rounding, narration variants (UPI
+handles, reference suffixes, truncation, case), decoy debits at popular
+amounts, unpaid Splitwise rows, and settlements received as bank credits.
+
+Sizes are transactions per user (bank + Splitwise rows). Benchmark data is
+deleted afterwards unless --keep is given.
+
+Usage: python scripts/benchmark_linker.py [size ...] [--mode greedy|assignment] [--seed S] [--keep]
+"""
+import sys
+import os
+import io
+import time
+import random
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+from decimal import Decimal
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from psycopg2.extras import execute_values
+from app.config import Config
+from app.database.connection import get_db_connection
+from app.database.instrumentation import track_queries
+from app.services.linker import run_linker
+from app.services.categorization import detect_settlements
+from scripts.benchmark_linker_assignment import synthetic_month
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+PAIRS_PER_MONTH = 400
+ROWS_PER_PAIR = 2.42          # Splitwise row + ~0.92 bank row + 0.5 decoy
+SETTLEMENTS_PER_MONTH = 6
+BENCH_USER_BASE = 900000      # One throwaway user per size, far from real ids
+FIRST_MONTH = date(2016, 1, 1)
+
+FRIENDS = ['Aditi Rao', 'Rohan Mehta', 'Sneha Kulkarni', 'Kunal Shah', 'Neha Joshi']
+
+
+def narration_variant(rng, description):
+    """The same merchant as different banks / apps print it"""
+    roll = rng.random()
+    if roll < 0.15:
+        return f"{description}/{rng.randrange(10**11, 10**12)}"
+    if roll < 0.25:
+        return description[:18]
+    if roll < 0.35:
+        return description.lower()
+    return description
+
+
+def month_start(offset):
+    year, month = divmod(FIRST_MONTH.month - 1 + offset, 12)
+    return date(FIRST_MONTH.year + year, month + 1, 1)
+
+
+def settlement_rows(rng, start, next_id):
+    """Settlements received from friends and the bank credits that paid them"""
+    splitwise_rows, bank_rows, truth = [], [], {}
+
+    for _ in range(SETTLEMENTS_PER_MONTH):
+        s_id, b_id = next(next_id), next(next_id)
+        friend = rng.choice(FRIENDS)
+        s_date = start + timedelta(days=rng.randrange(28))
+        amount = Decimal(rng.randrange(20000, 500000)) / 100
+
+        splitwise_rows.append((s_id, s_date, amount, f"{friend} paid Prathamesh P."))
+        bank_rows.append((
+            b_id,
+            s_date + timedelta(days=rng.choice([0, 0, 1, 2])),
+            amount,
+            f"UPI-{friend.upper()}-{rng.randrange(10**9)}@okaxis"
+        ))
+        truth[s_id] = b_id
+
+    return splitwise_rows, bank_rows, truth
+
+
+def generate(size, rng):
+    """[(month_start, splitwise_rows, settlement_rows, bank_rows)] and the truth maps"""
+    months = max(1, round(size / (PAIRS_PER_MONTH * ROWS_PER_PAIR)))
+    pairs = max(1, round(size / ROWS_PER_PAIR / months))
+    next_id = iter(range(1, 10**9))
+
+    dataset, link_truth, settlement_truth = [], {}, {}
+    for offset in range(months):
+        start = month_start(offset)
+        splits, banks, truth = synthetic_month(rng, pairs, start, next_id)
+        banks = [(b_id, b_date, amount, narration_variant(rng, desc)) for b_id, b_date, amount, desc in banks]
+        settle_splits, settle_banks, settle_truth = settlement_rows(rng, start, next_id)
+
+        dataset.append((start, splits, settle_splits, banks + settle_banks))
+        link_truth.update(truth)
+        settlement_truth.update(settle_truth)
+
+    return dataset, link_truth, settlement_truth
+
+
+def clear_user(cur, user_id):
+    cur.execute("DELETE FROM transaction_links WHERE user_id = %s", (user_id,))
+    cur.execute("DELETE FROM session_metrics WHERE user_id = %s", (user_id,))
+    cur.execute("DELETE FROM bank_transactions WHERE user_id = %s", (user_id,))
+    cur.execute("DELETE FROM splitwise_transactions WHERE user_id = %s", (user_id,))
+    cur.execute("DELETE FROM upload_sessions WHERE user_id = %s", (user_id,))
+
+
+def load(conn, user_id, dataset):
+    """Insert sessions and rows; returns (session_ids, {db id: synthetic id} per table)"""
+    cur = conn.cursor()
+    clear_user(cur, user_id)
+
+    session_ids, sessions, splitwise, bank = [], [], [], []
+    for start, splits, settle_splits, banks in dataset:
+        session_id = f"bench-{user_id}-{start:%Y-%m}"
+        end = (start.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        session_ids.append(session_id)
+        sessions.append((session_id, user_id, f"{start:%Y-%m}", start, end))
+
+        for s_id, s_date, amount, desc in splits:
+            splitwise.append((f"bench-{user_id}-S{s_id}", user_id, session_id, s_date, amount,
+                              desc, 'General', amount / 2, amount / 2, 'PAYER', 'UNLINKED'))
+        for s_id, s_date, amount, desc in settle_splits:
+            splitwise.append((f"bench-{user_id}-S{s_id}", user_id, session_id, s_date, amount,
+                              desc, 'Payment', -amount, 0, 'SETTLEMENT_RECEIVER', 'SETTLEMENT'))
+        for b_id, b_date, amount, desc in banks:
+            bank.append((f"bench-{user_id}-B{b_id}", user_id, session_id, b_date, amount,
+                         desc, 'Uncategorized', 'UNLINKED'))
+
+    execute_values(cur, """
+        INSERT INTO upload_sessions (id, user_id, selected_month, start_date, end_date)
+        VALUES %s
+    """, sessions)
+
+    split_ids = execute_values(cur, """
+        INSERT INTO splitwise_transactions
+        (transaction_id, user_id, upload_session_id, date, total_cost,
+         description, category, my_column_value, my_share, role, status)
+        VALUES %s
+        RETURNING id, transaction_id
+    """, splitwise, page_size=1000, fetch=True)
+
+    bank_ids = execute_values(cur, """
+        INSERT INTO bank_transactions
+        (transaction_id, user_id, upload_session_id, date, amount,
+         description, category, status)
+        VALUES %s
+        RETURNING id, transaction_id
+    """, bank, page_size=1000, fetch=True)
+
+    conn.commit()
+    cur.close()
+
+    def synthetic(rows, prefix):
+        return {db_id: int(tx_id.rsplit(prefix, 1)[1]) for db_id, tx_id in rows}
+
+    return session_ids, synthetic(split_ids, '-S'), synthetic(bank_ids, '-B')
+
+
+def run_stage(name, session_ids, stage):
+    """Run stage(session_id) for every month; returns (seconds, queries)"""
+    start = time.perf_counter()
+    with track_queries(f"bench:{name}") as stats:
+        with redirect_stdout(io.StringIO()):
+            for session_id in session_ids:
+                stage(session_id)
+    return time.perf_counter() - start, stats.query_count
+
+
+def score(conn, user_id, split_map, bank_map, truth):
+    """(links, correct, expected) for the Splitwise rows covered by truth"""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT splitwise_id, bank_id FROM transaction_links WHERE user_id = %s
+    """, (user_id,))
+    links = [(split_map[s_id], bank_map[b_id]) for s_id, b_id in cur.fetchall()]
+    cur.close()
+
+    links = [(s_id, b_id) for s_id, b_id in links if s_id in truth]
+    correct = sum(1 for s_id, b_id in links if truth[s_id] == b_id)
+    expected = sum(1 for b_id in truth.values() if b_id is not None)
+    return len(links), correct, expected
+
+
+def ratio(numerator, denominator):
+    return numerator / denominator if denominator else 1.0
+
+
+def run_benchmark(sizes, mode, seed=42, keep=False):
+    print(f"\n📊 LINKER SCALABILITY BENCHMARK (mode: {mode}, seed {seed})")
+    print("=" * 118)
+    print(
+        f"{'txns':>8} | {'months':>6} | {'load s':>7} | {'settle s':>8} | {'queries':>7} | "
+        f"{'link s':>7} | {'queries':>7} | {'precision':>9} | {'recall':>7} | {'settle P':>8} | {'settle R':>8}"
+    )
+    print("-" * 118)
+
+    conn = get_db_connection()
+
+    for size in sizes:
+        user_id = BENCH_USER_BASE + size
+        dataset, link_truth, settlement_truth = generate(size, random.Random(seed))
+
+        start = time.perf_counter()
+        session_ids, split_map, bank_map = load(conn, user_id, dataset)
+        load_seconds = time.perf_counter() - start
+        rows = len(split_map) + len(bank_map)
+
+        settle_seconds, settle_queries = run_stage(
+            'settlements', session_ids, lambda s: detect_settlements(user_id, s)
+        )
+        link_seconds, link_queries = run_stage(
+            'linker', session_ids, lambda s: run_linker(user_id, s, mode)
+        )
+
+        links, correct, expected = score(conn, user_id, split_map, bank_map, link_truth)
+        s_links, s_correct, s_expected = score(conn, user_id, split_map, bank_map, settlement_truth)
+
+        print(
+            f"{rows:>8,} | {len(session_ids):>6} | {load_seconds:>7.1f} | {settle_seconds:>8.1f} | "
+            f"{settle_queries:>7,} | {link_seconds:>7.1f} | {link_queries:>7,} | "
+            f"{ratio(correct, links):>9.1%} | {ratio(correct, expected):>7.1%} | "
+            f"{ratio(s_correct, s_links):>8.1%} | {ratio(s_correct, s_expected):>8.1%}"
+        )
+
+        if not keep:
+            cur = conn.cursor()
+            clear_user(cur, user_id)
+            conn.commit()
+            cur.close()
+
+    conn.close()
+
+    print("=" * 118)
+    print("✅ Benchmark complete" + (f" (data kept under users {BENCH_USER_BASE}+size)" if keep else ""))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    mode, seed, keep = Config.LINKER_MODE, 42, False
+
+    if '--mode' in args:
+        i = args.index('--mode')
+        mode = args[i + 1]
+        del args[i:i + 2]
+    if '--seed' in args:
+        i = args.index('--seed')
+        seed = int(args[i + 1])
+        del args[i:i + 2]
+    if '--keep' in args:
+        args.remove('--keep')
+        keep = True
+
+    if mode not in ('greedy', 'assignment'):
+        print("❌ --mode must be 'greedy' or 'assignment'")
+        sys.exit(1)
+
+    sizes = [int(a) for a in args] if args else DEFAULT_SIZES
+    run_benchmark(sizes, mode, seed, keep)
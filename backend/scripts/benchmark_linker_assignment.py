@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Benchmark: greedy three-pass linker vs assignment mode
+
+Generates synthetic months with known Splitwise <-> bank pairs, then runs
+both planners in memory (no database) and reports runtime, link rate and
+precision against the ground truth.
+
+Synthetic noise: bank posting delays of 0-2 days, paise rounding, merchant
+descriptions that only sometimes mention the Splitwise text, unrelated bank
+rows with popular amounts, and Splitwise rows with no bank counterpart.
+
+Usage: python scripts/benchmark_linker_assignment.py [pairs_per_month ...] [--months N] [--seed S]
+"""
+import sys
+import os
+import time
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.linker import BankCandidateIndex, plan_links
+from app.services.link_assignment import plan_assignment_links
+
+DEFAULT_SIZES = [50, 200, 500]
+DEFAULT_MONTHS = 5
+POPULAR_AMOUNTS = [100, 150, 200, 250, 300, 500, 1000]
+
+EXPENSES = [
+    ('dinner at social', 'UPI-SOCIAL HOSPITALITY PVT LTD'),
+    ('swiggy order', 'UPI-SWIGGY LIMITED'),
+    ('uber to airport', 'UPI-UBER INDIA SYSTEMS'),
+    ('groceries', 'POS DMART READY'),
+    ('movie tickets', 'UPI-BOOKMYSHOW'),
+    ('cab', 'UPI-OLA CABS'),
+    ('zomato', 'UPI-ZOMATO LTD'),
+    ('electricity bill', 'NEFT-TATA POWER'),
+    ('chai and snacks', 'UPI-PAYTM MERCHANT'),
+    ('trek booking', 'IMPS-INDIAHIKES'),
+]
+
+
+def synthetic_month(rng, pairs, month_start, next_id):
+    """
+    Returns (splitwise_rows, bank_rows, truth) where truth maps split_id -> bank_id
+    (None for Splitwise rows that were never paid from the bank account)
+    """
+    splitwise_rows, bank_rows, truth = [], [], {}
+
+    for _ in range(pairs):
+        s_id, b_id = next(next_id), next(next_id)
+        s_date = month_start + timedelta(days=rng.randrange(28))
+        split_desc, bank_desc = rng.choice(EXPENSES)
+
+        if rng.random() < 0.4:
+            amount = Decimal(rng.choice(POPULAR_AMOUNTS))
+        else:
+            amount = Decimal(rng.randrange(5000, 300000)) / 100
+
+        splitwise_rows.append((s_id, s_date, amount, split_desc))
+
+        if rng.random() < 0.08:
+            truth[s_id] = None      # Paid in cash / another account
+            continue
+
+        delay = rng.choices([0, 1, 2], weights=[70, 20, 10])[0]
+        rounding = Decimal(rng.choice([0, 0, 0, 50])) / 100
+        description = bank_desc if rng.random() < 0.7 else f"UPI-{rng.randrange(10**9)}@ybl"
+        bank_rows.append((b_id, s_date + timedelta(days=delay), -(amount + rounding), description))
+        truth[s_id] = b_id
+
+    # Decoys: unrelated spends at popular amounts on nearby days
+    for _ in range(pairs // 2):
+        bank_rows.append((
+            next(next_id),
+            month_start + timedelta(days=rng.randrange(30)),
+            -Decimal(rng.choice(POPULAR_AMOUNTS)),
+            rng.choice(EXPENSES)[1]
+        ))
+
+    splitwise_rows.sort(key=lambda r: (r[1], r[0]))
+    return splitwise_rows, bank_rows, truth
+
+
+def score(links, truth):
+    return {
+        'links': len(links),
+        'correct': sum(1 for s_id, b_id, _, _ in links if truth.get(s_id) == b_id),
+        'expected': sum(1 for b_id in truth.values() if b_id is not None),
+        'rows': len(truth),
+    }
+
+
+def run_planner(planner, months):
+    totals = {'links': 0, 'correct': 0, 'expected': 0, 'rows': 0, 'seconds': 0.0}
+
+    for splitwise_rows, bank_rows, truth in months:
+        index = BankCandidateIndex(bank_rows)
+        start = time.perf_counter()
+        links = planner(splitwise_rows, index, verbose=False)
+        totals['seconds'] += time.perf_counter() - start
+
+        for key, value in score(links, truth).items():
+            totals[key] += value
+
+    return totals
+
+
+def run_benchmark(sizes, month_count=DEFAULT_MONTHS, seed=42):
+    print("\n📊 LINKER BENCHMARK: greedy vs assignment")
+    print(f"   {month_count} synthetic months per size, seed {seed}")
+    print("=" * 84)
+    print(f"{'pairs/month':>11} | {'mode':10} | {'ms/month':>9} | {'link rate':>9} | {'precision':>9} | {'recall':>7}")
+    print("-" * 84)
+
+    for pairs in sizes:
+        rng = random.Random(seed)
+        ids = iter(range(1, 10**9))
+        months = [
+            synthetic_month(rng, pairs, date(2025, m, 1), ids)
+            for m in range(1, month_count + 1)
+        ]
+
+        for mode, planner in (('greedy', plan_links), ('assignment', plan_assignment_links)):
+            t = run_planner(planner, months)
+            print(
+                f"{pairs:>11,} | {mode:10} | {t['seconds'] * 1000 / month_count:>9.1f} | "
+                f"{t['links'] / t['rows']:>9.1%} | "
+                f"{(t['correct'] / t['links'] if t['links'] else 1.0):>9.1%} | "
+                f"{t['correct'] / t['expected']:>7.1%}"
+            )
+
+    print("=" * 84)
+    print("✅ Benchmark complete")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    month_count, seed = DEFAULT_MONTHS, 42
+
+    if '--months' in args:
+        i = args.index('--months')
+        month_count = int(args[i + 1])
+        del args[i:i + 2]
+    if '--seed' in args:
+        i = args.index('--seed')
+        seed = int(args[i + 1])
+        del args[i:i + 2]
+
+    sizes = [int(a) for a in args] if args else DEFAULT_SIZES
+    run_benchmark(sizes, month_count, seed)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: prepared vs ad-hoc execution of hot queries
+
+For each registered hot statement, runs it N times as plain SQL and N times
+through the prepared-statement registry on the same connection, and reports
+mean latency plus the planning time Postgres reports for each style.
+
+Usage: python scripts/benchmark_prepared_statements.py [session_id] [runs]
+"""
+import sys
+import os
+import re
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.database.connection import get_db_connection
+from app.database.prepared import STATEMENTS, execute_prepared
+
+# Importing the services registers their statements
+import app.services.analytics  # noqa: F401
+import app.services.manual_linking  # noqa: F401
+
+_PLACEHOLDER = re.compile(r"\$(\d+)")
+_PLANNING_TIME = re.compile(r"Planning Time: ([\d.]+) ms")
+
+
+def pick_session(cur):
+    cur.execute("""
+        SELECT id, user_id, start_date
+        FROM upload_sessions
+        ORDER BY created_at DESC
+        LIMIT 1
+    """)
+    return cur.fetchone()
+
+
+def benchmark_cases(session_id, user_id, start_date):
+    """Statement name -> sample parameters"""
+    return {
+        'analytics_solo_spend': (session_id, user_id),
+        'analytics_category_solo': (session_id, user_id),
+        'analytics_unlinked_payer': (session_id, user_id),
+        'manual_potential_matches': (session_id, user_id, 425.0, 575.0, start_date),
+    }
+
+
+def as_plain_sql(name, params):
+    """Registered SQL rewritten with named psycopg2 placeholders"""
+    sql = _PLACEHOLDER.sub(r"%(p\1)s", STATEMENTS[name])
+    values = {f"p{i + 1}": value for i, value in enumerate(params)}
+    return sql, values
+
+
+def planning_ms(cur, sql, params):
+    cur.execute("EXPLAIN (ANALYZE, SUMMARY) " + sql, params)
+    plan = "\n".join(row[0] for row in cur.fetchall())
+    match = _PLANNING_TIME.search(plan)
+    return float(match.group(1)) if match else 0.0
+
+
+def time_runs(run, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        run()
+    return (time.perf_counter() - start) * 1000 / runs
+
+
+def run_benchmark(session_id=None, runs=500):
+    conn = get_db_connection()
+    cur = conn.cursor()
+
+    session = pick_session(cur)
+    if session_id:
+        cur.execute("SELECT id, user_id, start_date FROM upload_sessions WHERE id = %s", (session_id,))
+        session = cur.fetchone()
+
+    if not session:
+        print("❌ No upload session found - upload a month first")
+        return
+
+    session_id, user_id, start_date = session
+
+    print("\n📊 PREPARED STATEMENT BENCHMARK")
+    print(f"   Session: {session_id} | Runs per statement: {runs}")
+    print("=" * 92)
+    print(f"{'statement':32} | {'plain ms':>9} | {'prepared ms':>11} | {'plan ms':>8} | {'plan ms (prep)':>14} | saved")
+    print("-" * 92)
+
+    total_saved = 0.0
+
+    for name, params in benchmark_cases(session_id, user_id, start_date).items():
+        plain_sql, plain_params = as_plain_sql(name, params)
+
+        def run_plain():
+            cur.execute(plain_sql, plain_params)
+            cur.fetchall()
+
+        def run_prepared():
+            execute_prepared(cur, name, params)
+            cur.fetchall()
+
+        plain_ms = time_runs(run_plain, runs)
+        prepared_ms = time_runs(run_prepared, runs)
+
+        plain_plan = planning_ms(cur, plain_sql, plain_params)
+        placeholders = ", ".join(["%s"] * len(params))
+        prepared_plan = planning_ms(cur, f"EXECUTE {name} ({placeholders})", params)
+
+        saved = (plain_plan - prepared_plan) * runs
+        total_saved += saved
+
+        print(f"{name:32} | {plain_ms:>9.3f} | {prepared_ms:>11.3f} | {plain_plan:>8.3f} | {prepared_plan:>14.3f} | {saved:>7.1f}ms")
+
+    conn.rollback()
+    cur.close()
+    conn.close()
+
+    print("=" * 92)
+    print(f"✅ Planning time saved over {runs} calls of each statement: {total_saved:,.1f}ms")
+
+
+if __name__ == "__main__":
+    session_arg = sys.argv[1] if len(sys.argv) > 1 else None
+    runs_arg = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    run_benchmark(session_arg, runs_arg)
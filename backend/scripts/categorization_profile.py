@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Show the stored stage profiles of a session's categorization runs
+
+For every profiled run of auto_categorize and detect_transfers: wall time,
+DB time, statements and rows scanned/updated per stage, plus the change in
+wall time against the previous run of the same pipeline.
+
+Usage: python scripts/categorization_profile.py <session_id> [--pipeline auto_categorize|detect_transfers] [--runs N] [--json out.json]
+"""
+import sys
+import os
+import json
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.categorization_profiler import get_profiles
+
+
+def print_run(run, previous):
+    print(f"\n📊 {run['pipeline'].upper()}  {run['run_id']}  ({run['created_at']})")
+    change = ""
+    if previous:
+        delta = run['wall_ms'] - previous['wall_ms']
+        change = f" | vs previous {delta:+.1f}ms"
+    print(f"   wall {run['wall_ms']:.1f}ms | {run['statements']} statements{change}")
+    print("=" * 78)
+    print(f"{'stage':16} | {'wall ms':>8} | {'db ms':>7} | {'stmts':>5} | {'scanned':>7} | {'updated':>7} | {'vs prev':>8}")
+    print("-" * 78)
+
+    before = {s['stage']: s for s in previous['stages']} if previous else {}
+    for s in run['stages']:
+        prev = before.get(s['stage'])
+        change = f"{s['wall_ms'] - prev['wall_ms']:+.1f}" if prev else "-"
+        print(
+            f"{s['stage']:16} | {s['wall_ms']:>8.1f} | {s['db_ms']:>7.1f} | {s['statements']:>5} | "
+            f"{s['rows_scanned']:>7} | {s['rows_updated']:>7} | {change:>8}"
+        )
+
+    for s in run['stages']:
+        if s['detail']:
+            counts = ", ".join(f"{key}={value}" for key, value in s['detail'].items())
+            print(f"   {s['stage']}: {counts}")
+
+
+def main():
+    args = sys.argv[1:]
+    pipeline, runs, json_path = None, 5, None
+
+    if '--pipeline' in args:
+        i = args.index('--pipeline')
+        pipeline = args[i + 1]
+        del args[i:i + 2]
+    if '--runs' in args:
+        i = args.index('--runs')
+        runs = int(args[i + 1])
+        del args[i:i + 2]
+    if '--json' in args:
+        i = args.index('--json')
+        json_path = args[i + 1]
+        del args[i:i + 2]
+
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+
+    # One extra run so the oldest shown still has something to compare with
+    profiles = get_profiles(args[0], pipeline, runs + 1)
+    if not profiles:
+        print(f"ℹ️  No categorization profiles for session {args[0]}")
+        return
+
+    for i, run in enumerate(profiles[:runs]):
+        previous = next((p for p in profiles[i + 1:] if p['pipeline'] == run['pipeline']), None)
+        print_run(run, previous)
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(profiles[:runs], f, indent=2, default=str)
+        print(f"\n💾 Profiles written to {json_path}")
+
+
+if __name__ == "__main__":
+    main()
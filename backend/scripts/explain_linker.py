@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Explain what settlement detection and the linker would do for a session
+
+Dry run - nothing is written. Prints per-pass candidate counts, links,
+tie-breaks and rejections with their scores, and SQL vs matching time.
+
+Usage: python scripts/explain_linker.py <session_id> [--mode greedy|assignment] [--details N] [--json out.json]
+"""
+import sys
+import os
+import json
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.linker import explain_linker
+
+
+def print_trace(trace, details):
+    print(f"\n📊 {trace['name'].upper()}")
+    print(f"   wall {trace['wall_ms']:.1f}ms | SQL {trace['sql_ms']:.1f}ms | matching {trace['matching_ms']:.1f}ms | links {trace['links']}")
+    print("=" * 78)
+    print(f"{'pass':22} | {'rows':>5} | {'cands':>6} | {'0':>4} | {'1':>4} | {'2+':>4} | {'links':>5} | {'ties':>4} | {'rej':>5}")
+    print("-" * 78)
+
+    for p in trace['passes']:
+        print(
+            f"{p['name']:22} | {p['rows']:>5} | {p['candidates']:>6} | {p['rows_without_candidates']:>4} | "
+            f"{p['rows_with_one_candidate']:>4} | {p['rows_with_many_candidates']:>4} | {p['links']:>5} | "
+            f"{p['tie_break_count']:>4} | {p['rejected_count']:>5}"
+        )
+
+    for p in trace['passes']:
+        if p['tie_breaks'][:details]:
+            print(f"\n   🔀 {p['name']} tie-breaks")
+            for t in p['tie_breaks'][:details]:
+                scores = ", ".join(f"{s['bank_id']}={s['score']:.2f}" for s in t['scores'])
+                print(f"      Split {t['split_id']} -> Bank {t['chosen_bank_id']}  [{scores}]")
+        if p['rejected'][:details]:
+            print(f"\n   ⛔ {p['name']} rejected pairs")
+            for r in p['rejected'][:details]:
+                score = f"{r['score']:.2f}" if r['score'] is not None else "-"
+                print(f"      Split {r['split_id']} x Bank {r['bank_id']}: {score} ({r['reason']})")
+
+
+def main():
+    args = sys.argv[1:]
+    mode, details, json_path = None, 10, None
+
+    if '--mode' in args:
+        i = args.index('--mode')
+        mode = args[i + 1]
+        del args[i:i + 2]
+    if '--details' in args:
+        i = args.index('--details')
+        details = int(args[i + 1])
+        del args[i:i + 2]
+    if '--json' in args:
+        i = args.index('--json')
+        json_path = args[i + 1]
+        del args[i:i + 2]
+
+    if not args:
+        print(__doc__)
+        sys.exit(1)
+
+    report = explain_linker(args[0], mode=mode)
+
+    print_trace(report['settlements'], details)
+    print_trace(report['linker'], details)
+
+    summary = report['linker']['summary']
+    print("\n" + "=" * 78)
+    print(f"✅ Would link {summary['would_link']} of {summary['splitwise_rows']} Splitwise rows "
+          f"({summary['bank_candidates']} bank candidates)")
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"💾 Full report written to {json_path}")
+
+
+if __name__ == "__main__":
+    main()